@@ -0,0 +1,31 @@
+import time
+
+from docker_ndp_daemon.daemon.proxy import DryRunBackend
+
+
+class RecordingBackend(DryRunBackend):
+    """A dry-run backend that records when entries change.
+
+    ``apply_delay`` seconds are spent in every :meth:`apply` call, e.g. to
+    mimic the cost of the real backends.
+    """
+
+    def __init__(self, apply_delay=0.0):
+        super().__init__()
+        self.apply_delay = apply_delay
+        self.calls = 0
+        #: (action, ipv6 address) -> time.time_ns() the change was applied
+        self.applied = {}
+
+    def apply(self, add=(), delete=()):
+        if self.apply_delay:
+            time.sleep(self.apply_delay)
+        super().apply(add=add, delete=delete)
+        now = time.time_ns()
+        with self._lock:
+            self.calls += 1
+            for entry in delete:
+                self.applied[('delete', entry[0])] = now
+            for entry in add:
+                self.applied[('add', entry[0])] = now
+        return []
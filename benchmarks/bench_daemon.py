@@ -0,0 +1,109 @@
+"""Measures :class:`DockerNdpDaemon` against a fake Docker API and an in-memory proxy backend.
+
+Reports the startup time for the existing containers, the sustained event
+throughput and the event-to-apply latency. Run it from the repository root::
+
+    python -m benchmarks.bench_daemon --containers 2000 --events 5000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from docker_ndp_daemon.daemon import DockerNdpDaemon
+
+from .backends import RecordingBackend
+from .fake_docker import FakeDockerServer, FakeDockerState
+
+
+def percentile(values, fraction):
+    """The value below which ``fraction`` of the sorted ``values`` fall."""
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def build_state(containers, networks, events, churn):
+    """Sets up ``containers`` running containers and plans ``events`` connects."""
+    state = FakeDockerState()
+    network_ids = [state.add_network(index) for index in range(networks)]
+    for index in range(containers):
+        state.connect(network_ids[index % networks], index)
+    for index in range(containers, containers + events):
+        state.plan_connect(network_ids[index % networks], index)
+    if churn:
+        for index in range(containers, containers + events):
+            state.plan_disconnect(network_ids[index % networks], index)
+    return state
+
+
+def run(args):
+    state = build_state(args.containers, args.networks, args.events, args.churn)
+    backend = RecordingBackend(apply_delay=args.apply_delay / 1000)
+    queue_options = {'flush_interval': args.flush_interval / 1000, 'batch_size': args.batch_size}
+
+    with tempfile.TemporaryDirectory() as directory:
+        with FakeDockerServer(os.path.join(directory, 'docker.sock'), state,
+                              rate=args.rate) as server:
+            daemon = DockerNdpDaemon(socket_url=server.url, ethernet_interface='bench0',
+                                     backend=backend, startup_concurrency=args.concurrency,
+                                     queue_options=queue_options)
+            started = time.perf_counter()
+            daemon.__enter__()
+            startup = time.perf_counter() - started
+            try:
+                if args.engine == 'asyncio':
+                    asyncio.run(daemon.listen_network_connect_events_async())
+                else:
+                    daemon.listen_network_connect_events()
+            finally:
+                daemon.__exit__(None, None, None)
+
+    latencies = sorted((backend.applied[key] - emitted) / 1e6
+                       for key, emitted in state.emitted.items() if key in backend.applied)
+    missing = len(state.emitted) - len(latencies)
+    if state.emitted:
+        first = min(state.emitted.values())
+        last = max(backend.applied[key] for key in state.emitted if key in backend.applied)
+        throughput = len(latencies) / max((last - first) / 1e9, 1e-9)
+    else:
+        throughput = float('nan')
+
+    print(f"startup:     {startup * 1000:9.1f} ms for {args.containers} containers "
+          f"on {args.networks} networks")
+    print(f"events:      {len(state.emitted):9d} sent, {missing} not applied")
+    print(f"throughput:  {throughput:9.0f} events/s")
+    print(f"latency p50: {percentile(latencies, 0.50):9.2f} ms")
+    print(f"latency p99: {percentile(latencies, 0.99):9.2f} ms")
+    print(f"latency max: {percentile(latencies, 1.0):9.2f} ms")
+    print(f"backend:     {backend.calls:9d} apply calls")
+    return 1 if missing else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--containers', type=int, default=1000,
+                        help="containers running before the daemon starts")
+    parser.add_argument('--networks', type=int, default=4, help="IPv6 networks to spread them on")
+    parser.add_argument('--events', type=int, default=2000, help="connect events to send")
+    parser.add_argument('--churn', action='store_true',
+                        help="disconnect every new container again afterwards")
+    parser.add_argument('--rate', type=float, default=0,
+                        help="events per second, 0 sends them as fast as possible")
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads',
+                        help="how the daemon reads the events")
+    parser.add_argument('--concurrency', type=int, default=8, help="startup_concurrency")
+    parser.add_argument('--flush-interval', type=float, default=5, help="queue flush interval [ms]")
+    parser.add_argument('--batch-size', type=int, default=256, help="queue batch size")
+    parser.add_argument('--apply-delay', type=float, default=0,
+                        help="time the fake backend spends in every apply call [ms]")
+    parser.add_argument('--verbose', action='store_true', help="show the daemon's log")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    return run(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,86 @@
+"""Measures how long importing the daemon and loading its config take.
+
+Imports ``docker_ndp_daemon.main`` in fresh interpreters with ``-X importtime``
+and fails if it takes longer than a budget or pulls in modules that should
+only be imported once they are used. Run it from the repository root::
+
+    python -m benchmarks.bench_startup --runs 5 --budget 60
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+TARGET = 'docker_ndp_daemon.main'
+
+#: Modules importing the daemon must not load, they are imported when used
+LAZY_MODULES = ('docker', 'requests', 'urllib3', 'asyncio', 'http.server')
+
+_LOAD_CONFIG = (
+    "import time; started = time.perf_counter(); "
+    "from docker_ndp_daemon import config; config.load(); "
+    "print(time.perf_counter() - started)"
+)
+
+
+def import_times(module):
+    """Imports ``module`` in a fresh interpreter.
+
+    :return: ``{module name: (self µs, cumulative µs)}`` of every module imported.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            encoding='utf-8', check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def config_load_time():
+    result = subprocess.run([sys.executable, '-c', _LOAD_CONFIG], stdout=subprocess.PIPE,
+                            encoding='utf-8', check=True)
+    return float(result.stdout)
+
+
+def run(args):
+    totals, loads, times = [], [], {}
+    for _ in range(args.runs):
+        times = import_times(TARGET)
+        totals.append(times[TARGET][1] / 1000)
+        loads.append(config_load_time() * 1000)
+
+    print(f"import {TARGET}: {statistics.median(totals):7.1f} ms median of {args.runs} "
+          f"(min {min(totals):.1f} ms)")
+    print(f"config.load():         {statistics.median(loads):7.1f} ms median")
+    print("slowest imports (self time of the last run):")
+    for name, (own, _) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {own / 1000:7.1f} ms  {name}")
+
+    failed = False
+    eager = sorted(name for name in times
+                   if any(name == lazy or name.startswith(lazy + '.') for lazy in LAZY_MODULES))
+    if eager:
+        print(f"FAIL: importing {TARGET} loads {', '.join(eager)}")
+        failed = True
+    if args.budget and statistics.median(totals) > args.budget:
+        print(f"FAIL: import takes longer than the budget of {args.budget} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters to measure")
+    parser.add_argument('--budget', type=float, default=0,
+                        help="fail if the median import takes longer [ms], 0 disables it")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to show")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
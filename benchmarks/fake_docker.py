@@ -0,0 +1,201 @@
+"""A stand-in for the Docker Engine API, served on a unix socket.
+
+Only the endpoints the daemon uses are implemented: ``/version``,
+``/networks``, ``/networks/{id}``, ``/containers/json``,
+``/containers/{id}/json`` and a chunked ``/events`` stream. The stream plays a
+list of synthetic events as fast as the client reads them, or at a fixed
+rate, and updates the served state right before each event, like docker does.
+"""
+import ipaddress
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+API_VERSION = '1.41'
+
+_VERSIONED_PATH = re.compile(r'^/v[0-9.]+(/.*)$')
+
+
+class FakeDockerState:
+    """Networks and containers served by :class:`FakeDockerServer` and the events to play."""
+
+    def __init__(self):
+        self.networks = {}  # id -> inspect attrs
+        self.containers = {}  # id -> inspect attrs
+        self.events = []  # (apply to the state or None, event without timeNano)
+        #: (action, ipv6 address) -> time.time_ns() the event was sent
+        self.emitted = {}
+        self._lock = threading.Lock()
+
+    def add_network(self, index):
+        network_id = f"{index:064x}"
+        subnet = ipaddress.ip_network(f"fd00:{index:x}::/64")
+        self.networks[network_id] = {
+            'Id': network_id, 'Name': f"bench{index}", 'Driver': 'bridge', 'EnableIPv6': True,
+            'IPAM': {'Config': [{'Subnet': f"172.{16 + index % 16}.0.0/16"},
+                                {'Subnet': str(subnet)}]},
+            'Containers': {},
+        }
+        return network_id
+
+    def _address(self, network_id, index):
+        subnet = ipaddress.ip_network(self.networks[network_id]['IPAM']['Config'][1]['Subnet'])
+        return str(subnet.network_address + index + 2)
+
+    def connect(self, network_id, index):
+        """Creates container ``index`` on a network. Returns its id and IPv6 address."""
+        container_id = f"{index + 1:064x}"
+        name = f"bench-{index}"
+        ipv6_address = self._address(network_id, index)
+        network = self.networks[network_id]
+        with self._lock:
+            network['Containers'][container_id] = {
+                'Name': name, 'EndpointID': container_id, 'IPv6Address': f"{ipv6_address}/64",
+            }
+            self.containers[container_id] = {
+                'Id': container_id, 'Name': f"/{name}", 'State': {'Running': True},
+                'NetworkSettings': {'Networks': {network['Name']: {
+                    'NetworkID': network_id, 'GlobalIPv6Address': ipv6_address,
+                    'GlobalIPv6PrefixLen': 64,
+                }}},
+            }
+        return container_id, ipv6_address
+
+    def disconnect(self, network_id, container_id):
+        with self._lock:
+            self.networks[network_id]['Containers'].pop(container_id, None)
+            self.containers.pop(container_id, None)
+
+    def plan_connect(self, network_id, index):
+        """Queues a container creation and its connect event."""
+        def apply():
+            container_id, ipv6_address = self.connect(network_id, index)
+            return container_id, ('add', ipv6_address)
+        self.events.append((apply, network_id, 'connect'))
+
+    def plan_disconnect(self, network_id, index):
+        """Queues the disconnect event of a container created by :meth:`plan_connect`."""
+        def apply():
+            container_id = f"{index + 1:064x}"
+            self.disconnect(network_id, container_id)
+            return container_id, ('delete', self._address(network_id, index))
+        self.events.append((apply, network_id, 'disconnect'))
+
+    def play(self):
+        """Applies the planned events one by one, yielding the encoded event."""
+        for apply, network_id, action in self.events:
+            container_id, emitted_key = apply()
+            time_nano = time.time_ns()
+            self.emitted[emitted_key] = time_nano
+            yield json.dumps({
+                'Type': 'network', 'Action': action, 'scope': 'local',
+                'Actor': {'ID': network_id, 'Attributes': {
+                    'container': container_id, 'name': self.networks[network_id]['Name'],
+                    'type': 'bridge'}},
+                'time': time_nano // 1_000_000_000, 'timeNano': time_nano,
+            }).encode('utf-8') + b'\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeDocker/' + API_VERSION
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        return 'unix'
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.server.state
+        path = urlsplit(self.path).path
+        match = _VERSIONED_PATH.match(path)
+        if match:
+            path = match.group(1)
+        parts = path.strip('/').split('/')
+
+        if parts == ['version']:
+            self._send_json({'ApiVersion': API_VERSION, 'Version': 'fake'})
+        elif parts == ['_ping']:
+            self._send_json('OK')
+        elif parts == ['networks']:
+            self._send_json([dict(network, Containers={})
+                             for network in state.networks.values()])
+        elif len(parts) == 2 and parts[0] == 'networks':
+            network = state.networks.get(parts[1])
+            if network is None:
+                self._send_json({'message': f"network {parts[1]} not found"}, 404)
+            else:
+                with state._lock:
+                    self._send_json(dict(network, Containers=dict(network['Containers'])))
+        elif parts == ['containers', 'json']:
+            self._send_json(list(state.containers.values()))
+        elif len(parts) == 3 and parts[0] == 'containers' and parts[2] == 'json':
+            container = state.containers.get(parts[1])
+            if container is None:
+                self._send_json({'message': f"No such container: {parts[1]}"}, 404)
+            else:
+                self._send_json(container)
+        elif parts == ['events']:
+            self._stream_events()
+        else:
+            self._send_json({'message': f"page not found: {path}"}, 404)
+
+    def _stream_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        interval = 1 / self.server.rate if self.server.rate else 0
+        started = time.monotonic()
+        for count, line in enumerate(self.server.state.play()):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            self.wfile.flush()
+            if interval:
+                delay = started + (count + 1) * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        self.wfile.write(b'0\r\n\r\n')
+        self.close_connection = True
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves a :class:`FakeDockerState` on the unix socket at ``path``.
+
+    Use it as a context manager to run it on a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, state, rate=0):
+        """
+        :param (str) path: Path of the unix socket.
+        :param (FakeDockerState) state: What to serve.
+        :param (float) rate: Events per second to send, ``0`` sends as fast as possible.
+        """
+        super().__init__(path, _Handler)
+        self.state = state
+        self.rate = rate
+
+    @property
+    def url(self):
+        return f"unix://{self.server_address}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, name='fake-docker', daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
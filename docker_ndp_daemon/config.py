@@ -1,5 +1,6 @@
 import logging
 import configparser
+import ipaddress
 from pathlib import Path
 
 log = logging.getLogger(__name__)
@@ -20,19 +21,211 @@ loglevel_map = {'critical': logging.CRITICAL,
                 'debug': logging.DEBUG
                 }
 
-conf = configparser.ConfigParser()
-conf.read([
+
+def positive_int(section, option, default):
+    """Reads an integer option of the section called ``section`` that must be at least 1."""
+    value = conf.get(section, option, fallback=str(default))
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ValueError(f"Config option [{section}] {option} must be a whole number "
+                         f"of at least 1, not {value!r}")
+    return number
+
+
+def non_negative_int(section, option, default):
+    """Reads an integer option of the section called ``section`` that must be at least 0."""
+    value = conf.get(section, option, fallback=str(default))
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise ValueError(f"Config option [{section}] {option} must be a whole number "
+                         f"of at least 0, not {value!r}")
+    return number
+
+
+def split_list(value):
+    """Splits a comma separated config value into a list of its non-empty items."""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def mapping(section, option):
+    """Reads an option of the section called ``section`` that lists ``key=value`` pairs,
+    separated by commas, into a dict."""
+    pairs = {}
+    for item in split_list(conf.get(section, option, fallback='')):
+        key, _, value = (part.strip() for part in item.partition('='))
+        if not key or not value:
+            raise ValueError(f"Config option [{section}] {option} must list items like "
+                             f"network=interface, not {item!r}")
+        pairs[key] = value
+    return pairs
+
+
+def prefixes(section, option):
+    """Reads an option of the section called ``section`` that routes IPv6 prefixes,
+    e.g. ``2001:db8:1::/48=skip, 2001:db8:2::/64=eth1``."""
+    routes = mapping(section, option)
+    for prefix in routes:
+        try:
+            ipaddress.IPv6Network(prefix, strict=False)
+        except ValueError:
+            raise ValueError(f"Config option [{section}] {option} must list IPv6 prefixes, "
+                             f"not {prefix!r}") from None
+    return routes
+
+
+def endpoint_path(path, name):
+    """The file of the endpoint ``name`` next to ``path``, e.g. its snapshot."""
+    if not path:
+        return ''
+    path = Path(path)
+    suffixes = ''.join(path.suffixes)
+    return str(path.with_name(f"{path.name[:len(path.name) - len(suffixes)]}-{name}{suffixes}"))
+
+
+def read_endpoints():
+    """The docker endpoints to serve, one for every ``[endpoint:<name>]`` section.
+
+    Without such sections ``[host]`` and ``[events]`` describe the only one.
+    """
+    sections = [section for section in conf.sections() if section.startswith('endpoint:')]
+    if not sections:
+        return [Config(name='default', socket_url=None, gateway=host.gateway,
+                       interfaces=mapping('host', 'interfaces'), prefixes=host.prefixes,
+                       networks=events.networks, snapshot=snapshot.path,
+                       capture=events.capture)]
+    endpoints = []
+    for section in sections:
+        name = section[len('endpoint:'):].strip()
+        options = conf[section]
+        endpoints.append(Config(
+            name=name,
+            socket_url=options.get('socket_url') or None,
+            gateway=options.get('gateway', host.gateway),
+            interfaces=mapping(section, 'interfaces'),
+            prefixes=prefixes(section, 'prefixes') if 'prefixes' in options else host.prefixes,
+            networks=(split_list(options['networks']) if 'networks' in options
+                      else events.networks),
+            snapshot=options.get('snapshot', endpoint_path(snapshot.path, name)),
+            capture=options.get('capture', endpoint_path(events.capture, name)),
+        ))
+    return endpoints
+
+
+#: Config files read by :func:`load`, later ones override earlier ones
+DEFAULT_PATHS = (
     Path(__file__).resolve().parent.parent / "dnd.ini",
-    '/etc/docker-ndp-daemon.ini',
-])
-
-try:
-    # Create sections with attributes
-    host = Config(conf['host'])
-    logger = Config(conf['logger'])
-except Exception as ex:
-    raise ImportError(
-        "Missing config sections"
-    ) from ex
-
-logger.level = loglevel_map[logger.level.lower()]
+    Path('/etc/docker-ndp-daemon.ini'),
+)
+
+#: Module attributes set by :func:`load`
+SECTIONS = ('conf', 'host', 'logger', 'events', 'queue', 'watcher', 'snapshot', 'metrics',
+            'profiling', 'endpoints')
+
+
+def load(paths=DEFAULT_PATHS, overrides=None):
+    """Reads the config files and sets the sections of this module.
+
+    Nothing is read on import. ``init_app`` loads the config with the command
+    line overrides, anything using a section before just gets the files.
+
+    :param paths: Config files to read, later ones override earlier ones.
+    :param (dict) overrides: Option values by ``(section, option)`` that win
+       over the files.
+    :raise ValueError: If a section is missing or an option is invalid.
+    """
+    global conf, host, logger, events, queue, watcher, snapshot, metrics, profiling, endpoints
+    conf = configparser.ConfigParser()
+    conf.read(paths)
+    for (section, option), value in (overrides or {}).items():
+        if not conf.has_section(section):
+            conf.add_section(section)
+        conf.set(section, option, str(value).replace('%', '%%'))
+
+    try:
+        # Create sections with attributes
+        host = Config(conf['host'])
+        logger = Config(conf['logger'])
+    except KeyError as ex:
+        raise ValueError(
+            f"Missing config section [{ex.args[0]}] in {', '.join(str(path) for path in paths)}"
+        ) from ex
+
+    events = Config(conf['events']) if conf.has_section('events') else Config()
+    queue = Config(conf['queue']) if conf.has_section('queue') else Config()
+    watcher = Config(conf['watcher']) if conf.has_section('watcher') else Config()
+    snapshot = Config(conf['snapshot']) if conf.has_section('snapshot') else Config()
+    metrics = Config(conf['metrics']) if conf.has_section('metrics') else Config()
+    profiling = Config(conf['profiling']) if conf.has_section('profiling') else Config()
+
+    logger.level = loglevel_map[logger.level.lower()]
+    logger.background = conf.getboolean('logger', 'background', fallback=True)
+    logger.json = conf.getboolean('logger', 'json', fallback=False)
+    logger.rate_limit = non_negative_int('logger', 'rate_limit', 0)
+    logger.rate_interval = float(logger.get('rate_interval', 60))
+    host.setdefault('proxy_backend', 'netlink')
+    host.startup_concurrency = positive_int('host', 'startup_concurrency', 8)
+    host.prefixes = prefixes('host', 'prefixes')
+    events.networks = split_list(events.get('networks', ''))
+    events.setdefault('capture', '')
+    events.plugins = conf.getboolean('events', 'plugins', fallback=True)
+    events.engine = events.get('engine', 'threads').lower()
+    if events.engine not in ('threads', 'asyncio'):
+        raise ValueError(f"Config option [events] engine must be threads or asyncio, "
+                         f"not {events.engine!r}")
+
+    queue.options = {
+        'flush_interval': float(queue.get('flush_interval', 0.005)),
+        'batch_size': positive_int('queue', 'batch_size', 256),
+        'max_depth': positive_int('queue', 'max_depth', 10000),
+        'retry_delay': float(queue.get('retry_delay', 0.5)),
+        'retry_max_delay': float(queue.get('retry_max_delay', 60)),
+        'retry_attempts': positive_int('queue', 'retry_attempts', 8),
+    }
+
+    watcher.enabled = conf.getboolean('watcher', 'enabled', fallback=True)
+    watcher.options = {
+        'min_interval': float(watcher.get('min_interval', 1)),
+        'cooldown': float(watcher.get('cooldown', 10)),
+    }
+
+    snapshot.setdefault('path', '')
+    snapshot.interval = float(snapshot.get('interval', 5))
+    snapshot.max_age = float(snapshot.get('max_age', 60))
+
+    metrics.enabled = conf.getboolean('metrics', 'enabled', fallback=False)
+    metrics.setdefault('address', '127.0.0.1')
+    metrics.port = positive_int('metrics', 'port', 9469)
+
+    profiling.enabled = conf.getboolean('profiling', 'enabled', fallback=False)
+    profiling.setdefault('directory', '/tmp')
+    profiling.top = positive_int('profiling', 'top', 30)
+    profiling.trace_memory = conf.getboolean('profiling', 'trace_memory', fallback=False)
+
+    endpoints = read_endpoints()
+
+
+def reload(paths=DEFAULT_PATHS, overrides=None):
+    """Like :func:`load`, but keeps the current config if the new one is invalid.
+
+    :raise Exception: What reading or checking the new config raised.
+    """
+    current = {name: globals()[name] for name in SECTIONS if name in globals()}
+    try:
+        load(paths, overrides)
+    except Exception:
+        globals().update(current)
+        raise
+
+
+def __getattr__(name):
+    # Loads the config the first time a section is used, see load()
+    if name in SECTIONS:
+        load()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,11 @@
 from .ndp import DockerNdpDaemon
 from .events import DockerEventDaemon
+from .handlers import HandlerRegistry
+from .proxy import (
+    ProxyBackend, IpCommandBackend, NetlinkBackend, DryRunBackend, create_backend,
+)
 
-__all__ = ('DockerNdpDaemon', 'DockerEventDaemon')
+__all__ = (
+    'DockerNdpDaemon', 'DockerEventDaemon', 'HandlerRegistry',
+    'ProxyBackend', 'IpCommandBackend', 'NetlinkBackend', 'DryRunBackend', 'create_backend',
+)
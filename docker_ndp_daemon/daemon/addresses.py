@@ -0,0 +1,90 @@
+class AddressEntry:
+    """The IPv6 address of one container on one docker network."""
+    __slots__ = ('container_id', 'network_id', 'container_name', 'network_name',
+                 'ipv6_address', 'interface')
+
+    def __init__(self, container_id, network_id, ipv6_address, interface, *,
+                 container_name=None, network_name=None):
+        self.container_id = container_id
+        self.network_id = network_id
+        self.ipv6_address = ipv6_address
+        self.interface = interface
+        self.container_name = container_name
+        self.network_name = network_name
+
+    @property
+    def key(self):
+        return self.container_id, self.network_id
+
+    @property
+    def proxy_entry(self):
+        """The ``(ipv6_address, interface)`` tuple used by the proxy backends."""
+        return self.ipv6_address, self.interface
+
+    def __repr__(self):
+        return (f"AddressEntry({self.container_name or self.container_id[:12]!r} on "
+                f"{self.network_name or self.network_id[:12]!r}: {self.ipv6_address} "
+                f"via {self.interface})")
+
+
+class AddressTable:
+    """The proxied addresses, keyed by container id and network id.
+
+    Besides the primary key the table keeps a reverse index by IPv6 address and
+    one by container, so entries of a destroyed container can be dropped
+    without scanning. Each address belongs to at most one entry.
+    """
+
+    def __init__(self):
+        self._entries = {}  # (container id, network id) -> AddressEntry
+        self._by_address = {}  # ipv6 address -> AddressEntry
+        self._by_container = {}  # container id -> {network id, ...}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries.values()))
+
+    def get(self, container_id, network_id):
+        return self._entries.get((container_id, network_id))
+
+    def lookup(self, ipv6_address):
+        """Returns the entry that owns ``ipv6_address`` or ``None``."""
+        return self._by_address.get(ipv6_address)
+
+    def add(self, entry):
+        """Stores ``entry``.
+
+        :return: The entries it displaced, either because they had the same
+           key or the same address.
+        """
+        displaced = []
+        previous = self.remove(*entry.key)
+        if previous is not None:
+            displaced.append(previous)
+        owner = self.lookup(entry.ipv6_address)
+        if owner is not None:
+            displaced.append(self.remove(*owner.key))
+        self._entries[entry.key] = entry
+        self._by_address[entry.ipv6_address] = entry
+        self._by_container.setdefault(entry.container_id, set()).add(entry.network_id)
+        return displaced
+
+    def remove(self, container_id, network_id):
+        """Drops and returns the entry of a container on a network, if any."""
+        entry = self._entries.pop((container_id, network_id), None)
+        if entry is None:
+            return None
+        if self._by_address.get(entry.ipv6_address) is entry:
+            del self._by_address[entry.ipv6_address]
+        networks = self._by_container.get(container_id)
+        networks.discard(network_id)
+        if not networks:
+            del self._by_container[container_id]
+        return entry
+
+    def remove_container(self, container_id):
+        """Drops and returns all entries of a container."""
+        return [self.remove(container_id, network_id)
+                for network_id in list(self._by_container.get(container_id, ()))]
@@ -0,0 +1,194 @@
+"""The asyncio event engine: a minimal client for the docker event stream and
+the tasks running the event handlers.
+
+The client speaks HTTP/1.1 over docker's unix socket directly, without
+docker-py and the requests stack, and decodes the chunked stream of JSON
+events as the chunks arrive.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from urllib.parse import urlencode
+
+DEFAULT_SOCKET_URL = 'unix:///var/run/docker.sock'
+
+
+class DockerApiError(Exception):
+    """Docker answered a request with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+
+
+def unix_socket_path(socket_url=None):
+    """The path of docker's unix socket at ``socket_url``.
+
+    ``None`` uses ``DOCKER_HOST`` like docker-py's ``from_env`` does.
+
+    :raise ValueError: If the URL isn't a unix socket.
+    """
+    url = socket_url or os.environ.get('DOCKER_HOST') or DEFAULT_SOCKET_URL
+    if url.startswith('unix://'):
+        path = url[len('unix://'):]
+        return path if path.startswith('/') else '/' + path
+    if url.startswith('/'):
+        return url
+    raise ValueError(f"The asyncio engine only talks to unix sockets, not {url!r}")
+
+
+async def _read_chunks(reader):
+    # Yields the chunks of a chunked HTTP body until the last one or the end of the connection
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            return
+        size = int(line.split(b';', 1)[0], 16)
+        if size == 0:
+            return
+        chunk = await reader.readexactly(size)
+        await reader.readexactly(2)  # CRLF
+        yield chunk
+
+
+async def _read_until_closed(reader):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        yield data
+
+
+class AsyncDockerClient:
+    """Reads docker events from the unix socket at ``socket_path`` on an asyncio loop."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    async def _request(self, path, query=None):
+        # Sends a GET request and returns the status, the headers and the streams
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        target = path + ('?' + urlencode(query) if query else '')
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: docker\r\n"
+                     f"Connection: close\r\n\r\n".encode('ascii'))
+        try:
+            status = int((await reader.readline()).split(b' ', 2)[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except (IndexError, ValueError):
+            writer.close()
+            raise DockerApiError(0, "Malformed HTTP response") from None
+        return status, headers, reader, writer
+
+    async def events(self, since=None, filters=None):
+        """Yields the decoded events of ``GET /events`` until docker closes the stream.
+
+        :param (str) since: Only events after this time, e.g. ``"1539202002.835354153"``.
+        :param (dict) filters: Docker event filters, e.g. ``{'type': ['network']}``.
+        """
+        query = {}
+        if since is not None:
+            query['since'] = since
+        if filters:
+            query['filters'] = json.dumps(filters)
+        status, headers, reader, writer = await self._request('/events', query)
+        try:
+            if status >= 400:
+                raise DockerApiError(status, (await reader.read()).decode('utf-8', 'replace'))
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                chunks = _read_chunks(reader)
+            else:
+                chunks = _read_until_closed(reader)
+            # Docker sends one event per line and usually one line per chunk,
+            # which is decoded as it is. Only split events are buffered.
+            buffer = bytearray()
+            async for chunk in chunks:
+                if not buffer and len(chunk) > 1 and chunk.count(b'\n') == 1 \
+                        and chunk.endswith(b'\n'):
+                    yield json.loads(chunk)
+                    continue
+                buffer += chunk
+                start = 0
+                while True:
+                    end = buffer.find(b'\n', start)
+                    if end < 0:
+                        break
+                    if end > start:
+                        yield json.loads(buffer[start:end])
+                    start = end + 1
+                del buffer[:start]
+        finally:
+            writer.close()
+
+
+def _ordering_key(event):
+    # Events of the same container are handled in order
+    actor = event.get('Actor') or {}
+    return (actor.get('Attributes') or {}).get('container') or actor.get('ID')
+
+
+class HandlerTasks:
+    """Runs the handlers of an event stream as concurrent tasks, in order per
+    container, and moves the handled cursor of the daemon past an event once
+    it and all events before it are handled.
+
+    Used by :meth:`DockerEventDaemon.listen_network_connect_events_async`.
+    """
+
+    def __init__(self, daemon, max_tasks):
+        self._daemon = daemon
+        self._slots = asyncio.Semaphore(max_tasks)
+        self._tails = {}  # ordering key -> task of its last event
+        self._in_flight = deque()  # (cursor after the event, task or None) in stream order
+        self._failure = None
+
+    async def dispatch(self, event, handler, cursor):
+        """Runs ``handler`` for ``event`` after the handlers of earlier events of its container.
+
+        :raise Exception: What an earlier handler raised, like the synchronous
+           dispatch does.
+        """
+        if self._failure is not None:
+            raise self._failure
+        if handler is None:
+            self._in_flight.append((cursor, None))
+            self._advance()
+            return
+        await self._slots.acquire()
+        key = _ordering_key(event)
+        task = asyncio.ensure_future(self._run(self._tails.get(key), handler, event))
+        self._tails[key] = task
+        self._in_flight.append((cursor, task))
+        task.add_done_callback(lambda task: self._done(key, task))
+
+    async def _run(self, previous, handler, event):
+        if previous is not None:
+            await asyncio.wait([previous])
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._daemon._call_handler, handler, event)
+
+    def _done(self, key, task):
+        self._slots.release()
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        if not task.cancelled() and task.exception() is not None and self._failure is None:
+            self._failure = task.exception()
+        self._advance()
+
+    def _advance(self):
+        while self._in_flight and (self._in_flight[0][1] is None or self._in_flight[0][1].done()):
+            self._daemon._handled_since = self._in_flight.popleft()[0]
+
+    async def drain(self):
+        """Waits for all handlers and raises what the first failing one raised."""
+        tasks = [task for _, task in self._in_flight if task is not None]
+        if tasks:
+            await asyncio.wait(tasks)
+        if self._failure is not None:
+            raise self._failure
@@ -1,9 +1,13 @@
 import logging
-from docker import DockerClient, from_env
-from urllib3.exceptions import ReadTimeoutError
+import re
+import time
+from . import metrics, profiling
+from .handlers import HandlerRegistry, load_entry_points
 
 logger = logging.getLogger(__name__)
 
+HANDLER_NAME = re.compile(r'^handle_(?P<type>[a-z]+)_(?P<action>\w+)_event$')
+
 
 class DockerEventDaemon:
     """High level docker client for listening to dockerndp client.
@@ -18,45 +22,217 @@ class DockerEventDaemon:
 
     # Properties
     socket_url = None
+    watched_networks = None
+    reconnects = 0
     _client = None
+    _since = None  # timeNano of the last seen event
+    _seen_at_since = ()  # keys of the events seen at exactly that time
+    _handled_since = None  # timeNano of the last event whose handler returned
 
-    def __init__(self, *, socket_url=None):
+    def __init__(self, *, socket_url=None, watched_networks=None, capture=None,
+                 handler_plugins=True):
         """Creates a new DockerClient.
 
         :param socket_url: URL to the Docker server.
+        :param (list) watched_networks: Names or ids of the only networks whose
+           events are handled. Events of other types are always handled.
+        :param (TraceWriter) capture: Records the events and the docker
+           responses to a trace, see :mod:`.trace`.
+        :param (bool) handler_plugins: Also dispatch events to the handlers of
+           the ``docker_ndp_daemon.handlers`` entry points, see :mod:`.handlers`.
 
         Example:
             >>> DockerEventDaemon(socket_url="unix://var/run/dockerndp.sock")
             >>> DockerEventDaemon(socket_url="tcp://127.0.0.1:1234")
         """
         self.socket_url = socket_url
+        self.watched_networks = set(watched_networks or ())
+        self.capture = capture
+        self.handler_plugins = handler_plugins
+        self.handlers = None  # HandlerRegistry, built by handler_registry()
 
         logger.info("Connecting ...")
 
     def __enter__(self):
         self._client = self.init_docker_client()
         assert self._client
+        if self.capture is not None:
+            from .trace import TracingDockerClient
+            self._client = TracingDockerClient(self._client, self.capture)
         return self
 
     def __exit__(self, *exc):
         self._client.close()
+        if self.capture is not None:
+            self.capture.flush()
 
     def init_docker_client(self):
         """
         :return: the docker client object
         """
+        # docker-py pulls in requests and urllib3, only import it when needed
+        import docker
         if self.socket_url is None:
-            return from_env()
+            return docker.from_env()
         else:
-            return DockerClient(base_url=self.socket_url)
+            return docker.DockerClient(base_url=self.socket_url)
+
+    def handler_registry(self):
+        """The :class:`HandlerRegistry` the events are dispatched with.
+
+        It is built on first use from the ``handle_<type>_<action>_event``
+        methods and the entry point plugins, and kept from then on.
+        """
+        if self.handlers is None:
+            registry = HandlerRegistry()
+            for name in dir(self):
+                match = HANDLER_NAME.match(name)
+                if match:
+                    registry.register(match.group('type'), match.group('action'),
+                                      getattr(self, name), name=name)
+            if self.handler_plugins:
+                load_entry_points(self, registry)
+            self.handlers = registry
+        return self.handlers
+
+    def event_filters(self):
+        """Docker event filters that only let through events with a handler,
+        see :meth:`HandlerRegistry.filters`.
+        """
+        return self.handler_registry().filters()
+
+    def is_watched_network(self, network_id, network_name=None):
+        """Tells if events of a network are handled, see ``watched_networks``."""
+        return (not self.watched_networks or network_id in self.watched_networks
+                or network_name in self.watched_networks)
+
+    def _is_watched(self, event):
+        # Docker's own `network` filter would drop container events as well
+        if event.get('Type') != 'network':
+            return True
+        actor = event.get('Actor') or {}
+        return self.is_watched_network(actor.get('ID'), (actor.get('Attributes') or {}).get('name'))
+
+    @staticmethod
+    def _event_key(event):
+        actor = event.get('Actor') or {}
+        return (event.get('Type'), event.get('Action'), actor.get('ID'),
+                (actor.get('Attributes') or {}).get('container'))
+
+    def _is_replayed(self, event):
+        # Resuming with `since` repeats the events at exactly that time
+        time_nano = event.get('timeNano')
+        if time_nano is None:
+            return False
+        key = self._event_key(event)
+        if time_nano == self._since:
+            if key in self._seen_at_since:
+                return True
+            self._seen_at_since.add(key)
+        else:
+            self._since = time_nano
+            self._seen_at_since = {key}
+        return False
+
+    def _since_param(self):
+        seconds, nanos = divmod(self._since, 1_000_000_000)
+        return f"{seconds}.{nanos:09d}"
+
+    def start_event_cursor(self):
+        """Makes :meth:`listen_network_connect_events` start with the events from now on.
+
+        Call it before scanning the current state, so events that happen during
+        the scan aren't lost. Does nothing once the cursor is set.
+        """
+        if self._since is None:
+            self._since = int(time.time() * 1_000_000_000)
+            self._seen_at_since = set()
+            self._handled_since = self._since
+
+    def _dispatch(self, event):
+        # Passes a decoded event to its handlers, if it has any
+        metrics.EVENTS_RECEIVED.inc(type=event.get('Type'), action=event.get('Action'))
+        try:
+            self._handle(event)
+        finally:
+            self._handled_since = self._since
+
+    def _handle(self, event):
+        handler = self._handler(event)
+        if handler is not None:
+            self._call_handler(handler, event)
+
+    def _handler(self, event):
+        # The handlers of an event or None if the event is ignored.
+        # Must see the events in the order of the stream.
+        if self._is_replayed(event):
+            metrics.EVENTS_IGNORED.inc(reason='replayed')
+            return None
+        if not self._is_watched(event):
+            metrics.EVENTS_IGNORED.inc(reason='unwatched')
+            return None
+        handler = self.handler_registry().get(event.get('Type'), event.get('Action'))
+        if handler is None:
+            metrics.EVENTS_IGNORED.inc(reason='unhandled')
+        return handler
+
+    @staticmethod
+    def _call_handler(handler, event):
+        profiling.call(handler, event)
+        metrics.EVENTS_HANDLED.inc(type=event['Type'], action=event['Action'])
 
     def listen_network_connect_events(self):
+        """Dispatches events to the handlers of :meth:`handler_registry`.
+
+        A read timeout resumes the stream where it stopped, without losing or
+        repeating events. Returns when docker closes the stream.
+        """
+        from urllib3.exceptions import ReadTimeoutError
+        filters = self.event_filters()
         logger.info("Listening for Events ...")
+        logger.debug("Event filters: %r", filters)
+        self.start_event_cursor()
 
-        try:
-            for event in self._client.events(decode=True):
-                method = f"handle_{event['Type']}_{event['Action']}_event"
-                if hasattr(self, method):
-                    getattr(self, method)(event)
-        except ReadTimeoutError as ex:
-            raise TimeoutError from ex
+        while True:
+            try:
+                events = self._client.events(decode=True, since=self._since_param(),
+                                             filters=filters)
+                for event in events:
+                    if self.capture is not None:
+                        self.capture.record('event', None, event)
+                    self._dispatch(event)
+                return
+            except ReadTimeoutError as ex:
+                logger.debug(ex)
+                self.reconnects += 1
+                metrics.RECONNECTS.inc(reason='timeout')
+                logger.info("Docker connection read timed out. Resuming events since %s ...",
+                            self._since_param())
+
+    async def listen_network_connect_events_async(self, max_tasks=64):
+        """Dispatches events like :meth:`listen_network_connect_events`, on the
+        running asyncio loop.
+
+        The events are read straight from docker's unix socket by an
+        :class:`AsyncDockerClient`, so no thread blocks on the stream. Handlers
+        run as concurrent tasks in the loop's default executor, but those of the
+        same container, or of the same network for events without a container,
+        run in the order of their events. Returns when docker closes the stream.
+
+        :param (int) max_tasks: Stop reading events while this many handlers are
+           waiting or running.
+        """
+        from .asyncdocker import AsyncDockerClient, HandlerTasks, unix_socket_path
+        filters = self.event_filters()
+        logger.info("Listening for Events ...")
+        logger.debug("Event filters: %r", filters)
+        self.start_event_cursor()
+
+        client = AsyncDockerClient(unix_socket_path(self.socket_url))
+        tasks = HandlerTasks(self, max_tasks)
+        async for event in client.events(since=self._since_param(), filters=filters):
+            if self.capture is not None:
+                self.capture.record('event', None, event)
+            metrics.EVENTS_RECEIVED.inc(type=event.get('Type'), action=event.get('Action'))
+            await tasks.dispatch(event, self._handler(event), self._since)
+        await tasks.drain()
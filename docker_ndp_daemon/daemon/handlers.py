@@ -0,0 +1,149 @@
+"""The event handlers of a daemon, by event type and action.
+
+Besides the ``handle_<type>_<action>_event`` methods of the daemon, other
+packages can add handlers through the :data:`ENTRY_POINT_GROUP` entry point
+group. Each entry point names a function that is called with the daemon and
+its :class:`HandlerRegistry` and registers its handlers, e.g.::
+
+    [options.entry_points]
+    docker_ndp_daemon.handlers =
+        cleanup = my_package.dnd:register
+
+    def register(daemon, registry):
+        registry.register('container', 'destroy', lambda event: ...)
+"""
+import logging
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = 'docker_ndp_daemon.handlers'
+
+
+class _Handler:
+    # Runs one handler, timing it and logging what it raises instead of
+    # letting it stop the event stream
+
+    __slots__ = ('name', 'function')
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def __call__(self, event):
+        started = time.perf_counter()
+        try:
+            self.function(event)
+        except Exception:
+            metrics.HANDLER_ERRORS.inc(handler=self.name)
+            logger.exception("Handler %s failed on %s %s event of %s", self.name,
+                             event.get('Type'), event.get('Action'),
+                             (event.get('Actor') or {}).get('ID'))
+        finally:
+            metrics.HANDLER_SECONDS.observe(time.perf_counter() - started, handler=self.name)
+
+    def __repr__(self):
+        return f"<handler {self.name}>"
+
+
+class _Handlers(tuple):
+    # Runs several handlers of the same event in the order they were registered
+
+    def __call__(self, event):
+        for handler in self:
+            handler(event)
+
+
+class HandlerRegistry:
+    """Maps ``(type, action)`` of docker events to the callables handling them.
+
+    The registry is filled once, before the events are read. Looking up an
+    event costs a single dict access.
+    """
+
+    def __init__(self):
+        self._handlers = {}  # (type, action) -> _Handler or _Handlers
+
+    def __len__(self):
+        return len(self._handlers)
+
+    def __contains__(self, type_action):
+        return type_action in self._handlers
+
+    def register(self, event_type, action, function, name=None):
+        """Makes ``function(event)`` handle the events of ``event_type`` and ``action``.
+
+        Handlers of the same event run in the order they were registered.
+        Exceptions they raise are logged and counted, and don't affect the
+        other handlers.
+
+        :param (str) name: For logs and metrics, defaults to the function's name.
+        """
+        if name is None:
+            name = getattr(function, '__qualname__', None) or repr(function)
+        handler = _Handler(name, function)
+        key = (event_type, action)
+        existing = self._handlers.get(key)
+        if existing is None:
+            self._handlers[key] = handler
+        elif isinstance(existing, _Handlers):
+            self._handlers[key] = _Handlers(existing + (handler,))
+        else:
+            self._handlers[key] = _Handlers((existing, handler))
+
+    def get(self, event_type, action):
+        """The callable running all handlers of an event or ``None``."""
+        return self._handlers.get((event_type, action))
+
+    def filters(self):
+        """Docker event filters that only let through events with a handler.
+
+        Types and actions are filtered independently, so the dispatcher still
+        has to check that a handler for the exact combination exists.
+        """
+        types = sorted({event_type for event_type, _ in self._handlers})
+        actions = sorted({action for _, action in self._handlers})
+        return {'type': types, 'event': actions}
+
+
+def _entry_points():
+    # The entry points of the handler group, imported when needed since
+    # importlib.metadata takes a while to import
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python < 3.8
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            return _pkg_resources_entry_points()
+    try:
+        return list(entry_points(group=ENTRY_POINT_GROUP))
+    except TypeError:
+        # Python < 3.10
+        return list(entry_points().get(ENTRY_POINT_GROUP, ()))
+
+
+def _pkg_resources_entry_points():
+    try:
+        import pkg_resources
+    except ImportError:
+        logger.debug("Neither importlib.metadata nor pkg_resources is installed, "
+                     "no handler plugins are loaded")
+        return []
+    return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP))
+
+
+def load_entry_points(daemon, registry):
+    """Lets the installed :data:`ENTRY_POINT_GROUP` entry points register
+    their handlers. An entry point that fails is logged and skipped.
+    """
+    for entry_point in _entry_points():
+        try:
+            entry_point.load()(daemon, registry)
+        except Exception:
+            logger.exception("Could not load the event handlers of %r", entry_point.name)
+            continue
+        logger.info("Loaded the event handlers of %r", entry_point.name)
@@ -0,0 +1,286 @@
+"""Prometheus metrics of the daemon, served over HTTP without extra dependencies.
+
+The metrics are module level objects, so every part of the daemon records into
+the same :data:`REGISTRY`. :func:`start_http_server` exposes it in the
+Prometheus text format on ``/metrics``.
+"""
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#: Seconds. Fine grained around 100 ms, the time we promise a new container
+#: to have working IPv6 within.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    """A metric and its children, one for every combination of label values."""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}  # label values -> child state
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, not {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yields ``(suffix, label names, label values, value)`` of all children."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} "
+                         f"{_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._children.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, value in children:
+            yield '_total', self.labelnames, values, value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, either set or read from a function on scrape."""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Makes the gauge report ``function()`` at scrape time."""
+        self.set(function, **labels)
+
+    def value(self, **labels):
+        value = self._children.get(self._key(labels), 0)
+        return value() if callable(value) else value
+
+    def samples(self):
+        with self._lock:
+            children = sorted(self._children.items(), key=lambda item: item[0])
+        for values, value in children:
+            try:
+                value = value() if callable(value) else value
+            except Exception:
+                logger.exception("Reading gauge %s failed", self.name)
+                continue
+            yield '', self.labelnames, values, value
+
+
+class Histogram(_Metric):
+    """Counts observations in cumulative buckets."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                # per bucket counts, sum
+                child = self._children[key] = [[0] * len(self.buckets), 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    child[0][index] += 1
+                    break
+            child[1] += value
+
+    def time(self, **labels):
+        """Context manager observing the seconds its block took."""
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        child = self._children.get(self._key(labels))
+        return sum(child[0]) if child else 0
+
+    def quantile(self, fraction, **labels):
+        """Upper bound of the bucket holding the ``fraction`` quantile, ``nan``
+        without observations.
+        """
+        child = self._children.get(self._key(labels))
+        total = sum(child[0]) if child else 0
+        if not total:
+            return math.nan
+        cumulative = 0
+        for bound, count in zip(self.buckets, child[0]):
+            cumulative += count
+            if cumulative and cumulative >= fraction * total:
+                return bound
+        return math.inf
+
+    def samples(self):
+        with self._lock:
+            children = sorted((values, (list(counts), total))
+                              for values, (counts, total) in self._children.items())
+        names = self.labelnames + ('le',)
+        for values, (counts, total) in children:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', names, values + (_format_value(bound),), cumulative
+            yield '_count', self.labelnames, values, cumulative
+            yield '_sum', self.labelnames, values, total
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.monotonic() - self._started, **self._labels)
+
+
+class Registry:
+    """The metrics to expose."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        return ''.join(metric.render() for metric in self._metrics.values())
+
+
+REGISTRY = Registry()
+
+EVENTS_RECEIVED = REGISTRY.register(Counter(
+    'dnd_events_received', "Docker events read from the event stream.", ('type', 'action')))
+EVENTS_HANDLED = REGISTRY.register(Counter(
+    'dnd_events_handled', "Docker events passed to a handler.", ('type', 'action')))
+EVENTS_IGNORED = REGISTRY.register(Counter(
+    'dnd_events_ignored', "Docker events dropped without handling them.", ('reason',)))
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    'dnd_handler_seconds', "Duration of event handler calls.", ('handler',)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'dnd_handler_errors', "Exceptions raised by event handlers.", ('handler',)))
+EVENT_TO_PROXY_SECONDS = REGISTRY.register(Histogram(
+    'dnd_event_to_proxy_seconds',
+    "Seconds from a docker event to its proxy change being applied.", ('action',)))
+BACKEND_APPLY_SECONDS = REGISTRY.register(Histogram(
+    'dnd_backend_apply_seconds', "Duration of proxy backend apply calls.", ('backend',)))
+BACKEND_CALLS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'dnd_backend_calls_in_flight', "Proxy backend apply calls running right now.",
+    ('backend',)))
+ADDRESS_TABLE_ENTRIES = REGISTRY.register(Gauge(
+    'dnd_address_table_entries', "Container addresses in the address table.", ('endpoint',)))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'dnd_proxy_queue_depth', "Keys with proxy work waiting in the queue."))
+PROXY_RETRIES = REGISTRY.register(Counter(
+    'dnd_proxy_retries', "Failed proxy changes and queued work scheduled to be tried again.",
+    ('action',)))
+PROXY_CHANGES_ABANDONED = REGISTRY.register(Counter(
+    'dnd_proxy_changes_abandoned', "Failed proxy changes and queued work given up on.",
+    ('action',)))
+RETRYING_CHANGES = REGISTRY.register(Gauge(
+    'dnd_proxy_retries_pending', "Failed proxy changes and queued work waiting to be tried again."))
+PROXY_ENTRIES_RESTORED = REGISTRY.register(Counter(
+    'dnd_proxy_entries_restored', "Proxy entries put back after the kernel lost them."))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    'dnd_startup_seconds',
+    "Seconds from the process start until the endpoint was ready to read events.",
+    ('endpoint',)))
+RECONNECTS = REGISTRY.register(Counter(
+    'dnd_reconnects', "Times the docker event stream was resumed or reopened.", ('reason',)))
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    'dnd_log_records_dropped', "Log records not written.", ('reason',)))
+
+
+def _handler_class(registry):
+    # http.server pulls in the email package, so it is only imported when metrics are served
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return MetricsHandler
+
+
+def start_http_server(port, address='127.0.0.1', registry=REGISTRY):
+    """Serves ``registry`` on ``http://address:port/metrics`` from a daemon thread.
+
+    :return: The :class:`http.server.ThreadingHTTPServer`; ``shutdown()`` stops it.
+    """
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((address, port), _handler_class(registry))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", address, server.server_address[1])
+    return server
@@ -1,109 +1,508 @@
+import ipaddress
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from . import metrics
 from .events import DockerEventDaemon
-from subprocess import run, PIPE, DEVNULL
+from .addresses import AddressEntry, AddressTable
+from .networks import NetworkCache, ipv6_subnets
+from .pipeline import ProxyChange, ProxyQueue
+from .prefixes import SKIP, PrefixIndex
+from .proxy import IpCommandBackend
+from .watcher import ALL, NeighbourWatcher
 
 logger = logging.getLogger(__name__)
 
 
+def _normalize(ipv6_address):
+    # The kernel reports addresses in their canonical compressed form
+    return ipaddress.ip_address(ipv6_address).compressed
+
+
+def _event_time(event):
+    # Unix time of a docker event or None if it doesn't tell
+    time_nano = event.get('timeNano')
+    return time_nano / 1_000_000_000 if time_nano else None
+
+
+def _ipv6_subnets(networks):
+    # IPv6 subnets of docker networks, i.e. where container addresses come from
+    return [subnet for network in networks for subnet in ipv6_subnets(network)]
+
+
 class DockerNdpDaemon(DockerEventDaemon):
     """A special :class:`DockerEventDaemon` that adds IPv6 addresses of
     recently started docker containers to the NDP proxy for
     getting IPv6 internet connectivity.
     """
     ethernet_interface = None
+    backend = None
+    networks = None
+    startup_concurrency = 8
 
-    def __init__(self, *, socket_url=None, ethernet_interface):
+    def __init__(self, *, socket_url=None, ethernet_interface, backend=None,
+                 watched_networks=None, startup_concurrency=None, queue_options=None,
+                 watcher_options=None, snapshot=None, name='default', interfaces=None,
+                 prefixes=None, queue=None, capture=None, handler_plugins=True):
         """ Creates a new instance.
 
         :param (str) socket_url: Path of the dockerndp socket file.
+        :param (str) name: Name of the docker endpoint, for logs and metrics.
+        :param (dict) interfaces: Gateway interface of some networks, by network
+           name or id. The others use ``ethernet_interface``.
+        :param (dict) prefixes: Static routes by IPv6 prefix, either the
+           interface to proxy its addresses on or :data:`SKIP` for prefixes that
+           are routed to the host already. They win over the network gateways.
+        :param (ProxyQueue) queue: A queue shared with the daemons of other
+           endpoints. Its owner starts and stops it. Without one the daemon runs
+           its own, made with ``queue_options``.
+        :param (list) watched_networks: Names or ids of the only networks to
+           proxy. Empty proxies all networks.
+        :param (int) startup_concurrency: How many networks to inspect at once
+           during startup.
+        :param (dict) queue_options: Keyword arguments for the :class:`ProxyQueue`
+           that batches proxy changes made by events.
+        :param (dict) watcher_options: Keyword arguments for the
+           :class:`NeighbourWatcher` that restores proxy entries removed by
+           someone else. ``None`` doesn't watch the kernel.
+        :param (Snapshot) snapshot: Keeps the address table on disk, so a
+           restart can resume where the last run stopped.
+        :param (TraceWriter) capture: Records the events and docker responses
+           for a later replay, see :mod:`.trace`.
+        :param (bool) handler_plugins: Also pass the events to the handlers of
+           the ``docker_ndp_daemon.handlers`` entry points.
         :param (str) ethernet_interface: Name of the ethernet interface that is
            an internet gateway.
+        :param (ProxyBackend) backend: Programs the NDP proxy table. Defaults to
+           forking ``ip`` and ``sysctl``. The caller is responsible for closing it.
         """
-        super().__init__(socket_url=socket_url)
-        self.ethernet_interface = ethernet_interface
-        self._address_cache = {}  # (container id, network name) -> ip address
+        super().__init__(socket_url=socket_url, watched_networks=watched_networks,
+                         capture=capture, handler_plugins=handler_plugins)
+        self.name = name
+        self._network_subnets = {}  # network id -> (name, subnets in the prefix index)
+        self._set_routes(ethernet_interface, interfaces, prefixes)
+        self.backend = backend if backend is not None else IpCommandBackend()
+        if startup_concurrency is not None:
+            self.startup_concurrency = startup_concurrency
+        self._owns_queue = queue is None
+        self.queue = queue if queue is not None else ProxyQueue(self.backend,
+                                                                **(queue_options or {}))
+        self.watcher = None
+        if watcher_options is not None:
+            self.watcher = NeighbourWatcher(self._restore_proxy_entries,
+                                            self.gateway_interfaces, **watcher_options)
+        self.snapshot = snapshot
+        self.addresses = AddressTable()
 
     def __enter__(self):
         rv = super().__enter__()
+        self.networks = NetworkCache(self._client)
         self._activate_ndp_proxy()
-        self._add_all_existing_containers_to_neigh_proxy()
+        previous = self.snapshot.load() if self.snapshot is not None else None
+        if previous is not None and previous.age <= self.snapshot.max_age:
+            self._resume_from_snapshot(previous)
+        else:
+            # Events during the scan are replayed afterwards
+            self.start_event_cursor()
+            self._add_all_existing_containers_to_neigh_proxy(
+                previous.entries if previous is not None else ())
+        self._save_snapshot(force=True)
+        metrics.ADDRESS_TABLE_ENTRIES.set_function(lambda: len(self.addresses), endpoint=self.name)
+        metrics.QUEUE_DEPTH.set_function(lambda: self.queue.depth)
+        metrics.RETRYING_CHANGES.set_function(lambda: self.queue.retrying)
+        self.queue.flush_hooks.append(self._save_snapshot)
+        if self._owns_queue:
+            self.queue.start()
+        self._start_watcher()
         return rv
 
+    def __exit__(self, *exc):
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self._owns_queue:
+            self.queue.stop()
+        if self._save_snapshot in self.queue.flush_hooks:
+            self.queue.flush_hooks.remove(self._save_snapshot)
+        self._save_snapshot(force=True)
+        super().__exit__(*exc)
+
+    def _save_snapshot(self, force=False):
+        # Runs on the queue's worker, or with the worker stopped. The cursor is
+        # read before checking for queued work, so every event up to it is
+        # reflected in the address table. A shared queue holds the work of other
+        # endpoints as well, which only makes this wait longer.
+        if self.snapshot is None or not (force or self.snapshot.due()):
+            return
+        since = self._handled_since
+        if since is None or self.queue.depth:
+            return
+        self.snapshot.save(since, self.addresses)
+
+    def _set_routes(self, ethernet_interface, interfaces, prefixes):
+        # Sets the gateway interfaces and static routes and rebuilds the prefix index
+        self.ethernet_interface = ethernet_interface
+        self.network_interfaces = dict(interfaces or {})
+        self._static_prefixes = PrefixIndex()
+        #: Where to proxy an address, by its longest matching prefix. Holds the
+        #: static routes and the IPv6 subnets of the networks.
+        self.prefixes = PrefixIndex()
+        for prefix, route in (prefixes or {}).items():
+            self._static_prefixes.add(prefix, route)
+            self.prefixes.add(prefix, route)
+        #: Every interface this daemon proxies on
+        self.gateway_interfaces = sorted(
+            {ethernet_interface, *self.network_interfaces.values(), *(prefixes or {}).values()}
+            - {SKIP})
+        networks, self._network_subnets = self._network_subnets, {}
+        for network_id, (network_name, subnets) in networks.items():
+            self._index_network(network_id, network_name, subnets)
+
+    def reconfigure(self, *, ethernet_interface, interfaces=None, prefixes=None):
+        """Proxies the addresses on other interfaces, e.g. after the config was
+        reloaded, keeping the address table and the event stream position.
+
+        Runs on the queue's worker. Only the proxy entries whose interface
+        changes are moved, all in one batch.
+
+        :param (str) ethernet_interface: The new default gateway interface.
+        :param (dict) interfaces: The new gateway interfaces of networks.
+        :param (dict) prefixes: The new static routes.
+        """
+        self.queue.submit('reconfigure', (self.name, 'reconfigure'),
+                          lambda: self._reconfigure_changes(ethernet_interface, interfaces,
+                                                            prefixes))
+
+    def _reconfigure_changes(self, ethernet_interface, interfaces, prefixes):
+        previous = set(self.gateway_interfaces)
+        self._set_routes(ethernet_interface, interfaces, prefixes)
+        for interface in self.gateway_interfaces:
+            if interface not in previous:
+                logger.info("Activating IPv6 ndp proxy on %r ...", interface)
+                self.backend.activate(interface)
+        if self.watcher is not None:
+            self.watcher.interfaces = set(self.gateway_interfaces)
+
+        changes, moved, dropped = [], 0, 0
+        for entry in self.addresses:
+            interface = self._route(entry.ipv6_address, entry.network_id, entry.network_name)
+            if interface == entry.interface:
+                continue
+            self.addresses.remove(entry.container_id, entry.network_id)
+            changes.append(self._change('delete', entry))
+            if interface is None:
+                dropped += 1
+                continue
+            entry = AddressEntry(entry.container_id, entry.network_id, entry.ipv6_address,
+                                 interface, container_name=entry.container_name,
+                                 network_name=entry.network_name)
+            self.addresses.add(entry)
+            changes.append(self._change('add', entry))
+            moved += 1
+        logger.info("Gateway interfaces are now %s: moving %d proxy entries, dropping %d",
+                    ', '.join(self.gateway_interfaces), moved, dropped)
+        return changes
+
+    def _start_watcher(self):
+        if self.watcher is None:
+            return
+        try:
+            self.watcher.start()
+        except OSError as ex:
+            logger.warning("Can't watch the kernel's neighbour table, lost proxy entries "
+                           "won't be restored: %s", ex)
+            self.watcher = None
+
+    def _restore_proxy_entries(self, lost):
+        # Called by the watcher. The worker decides which entries are still wanted.
+        self.queue.submit('restore', (self.name, 'restore'), lambda: self._restore_changes(lost))
+
+    def _restore_changes(self, lost):
+        changes = []
+        for ipv6_address, interface in lost:
+            if ipv6_address is ALL:
+                entries = [entry for entry in self.addresses if entry.interface == interface]
+            else:
+                entry = self.addresses.lookup(ipv6_address)
+                entries = [entry] if entry is not None and entry.interface == interface else []
+            changes += [self._change('add', entry) for entry in entries]
+        if changes:
+            logger.info("Restoring %d proxy entries removed behind our back", len(changes))
+            metrics.PROXY_ENTRIES_RESTORED.inc(len(changes))
+        return changes
+
+    # The event handlers run on the event reader and only queue the work. The
+    # queue's worker resolves it, so it alone touches the address table and
+    # the network cache.
+
     def handle_network_connect_event(self, event):
         logger.debug("event: %r", event)
-        # Fetches Container from id in event
         container_id = event['Actor']['Attributes']['container']
-        network = event['Actor']['Attributes']['name']
-        container = self._client.containers.get(container_id)
-        logger.debug("Event: Container %r connected to %s network",
-                     container.name, network)
-        self._add_container_to_ipv6_ndp_proxy(container, network)
+        network_id = event['Actor']['ID']
+        since = _event_time(event)
+        self.queue.submit('add', (self.name, 'endpoint', container_id, network_id),
+                          lambda: self._connect_changes(container_id, network_id, since))
+        logger.debug("Queued connect of container %s to %s network",
+                     container_id[:12], event['Actor']['Attributes'].get('name'))
 
     def handle_network_disconnect_event(self, event):
         logger.debug("event: %r", event)
-        # Fetches Container from id in event
         container_id = event['Actor']['Attributes']['container']
-        network = event['Actor']['Attributes']['name']
-        container = self._client.containers.get(container_id)
-        logger.debug("Event: Container %r disconnected from %s network",
-                     container.name, network)
-        self._del_container_from_ipv6_ndp_proxy(container, network)
-
-    def _add_container_to_ipv6_ndp_proxy(self, container, network):
-        ipv6_address = container.attrs['NetworkSettings']['Networks'][network]['GlobalIPv6Address']
-        if not ipv6_address:
-            logger.info(
-                "Ignoring container %r on %r. It has no IPv6 address.", container.name, network,
-            )
-            return
+        network_id = event['Actor']['ID']
+        since = _event_time(event)
+        self.queue.submit('delete', (self.name, 'endpoint', container_id, network_id),
+                          lambda: self._disconnect_changes(container_id, network_id, since))
+        logger.debug("Queued disconnect of container %s from %s network",
+                     container_id[:12], event['Actor']['Attributes'].get('name'))
 
-        self._address_cache[container, network] = ipv6_address
+    def handle_network_create_event(self, event):
+        network_id = event['Actor']['ID']
+        self.queue.submit('create', (self.name, 'network', network_id),
+                          lambda: self._create_network_changes(network_id))
 
-        self._add_ipv6_neigh_proxy(ipv6_address)
+    def handle_network_destroy_event(self, event):
+        network_id = event['Actor']['ID']
+        self.queue.submit('destroy', (self.name, 'network', network_id),
+                          lambda: self._destroy_network_changes(network_id))
 
-        logger.info("Set IPv6 ndp proxy for container %r: %r", container.name, ipv6_address)
+    def handle_container_destroy_event(self, event):
+        logger.debug("event: %r", event)
+        container_id = event['Actor']['ID']
+        since = _event_time(event)
+        self.queue.submit('destroy', (self.name, 'container', container_id),
+                          lambda: self._destroy_changes(container_id, since))
 
-    def _del_container_from_ipv6_ndp_proxy(self, container, network):
+    def _create_network_changes(self, network_id):
+        # Adds the subnets of a new network to the prefix index
+        from docker.errors import NotFound
         try:
-            ipv6_address = self._address_cache[container, network]
-        except KeyError:
+            network = self.networks.refresh(network_id)
+        except NotFound:
+            logger.debug("Network %s vanished before it was inspected", network_id[:12])
+            return []
+        self._index_network(network.id, network.name, network.subnets)
+        return []
+
+    def _destroy_network_changes(self, network_id):
+        self.networks.forget(network_id)
+        self._unindex_network(network_id)
+        return []
+
+    def _connect_changes(self, container_id, network_id, since=None):
+        # Resolves the address of a connected container into proxy changes. The
+        # container or network may be gone by the time the queue gets to it.
+        from docker.errors import NotFound
+        try:
+            return self._resolve_connect(container_id, network_id, since)
+        except NotFound as ex:
+            logger.debug("Ignoring container %s on %s, it is gone: %s",
+                         container_id[:12], network_id[:12], ex,
+                         extra={'container_id': container_id, 'network': network_id})
+            return []
+
+    def _resolve_connect(self, container_id, network_id, since=None):
+        network, endpoint = self.networks.endpoint(network_id, container_id)
+        if not network.enable_ipv6:
+            logger.info("Ignoring container %s on %r. The network has no IPv6.",
+                        container_id[:12], network.name,
+                        extra={'container_id': container_id, 'network': network.name})
+            return []
+        if network.id not in self._network_subnets:
+            self._index_network(network.id, network.name, network.subnets)
+        if endpoint is None:
+            # The network doesn't list the container, ask the container itself
+            container = self._client.containers.get(container_id)
+            entry = self._container_entry(container, network.name)
+        elif not endpoint[1]:
+            logger.info("Ignoring container %r on %r. It has no IPv6 address.",
+                        endpoint[0], network.name,
+                        extra={'container_id': container_id, 'network': network.name})
+            entry = None
+        else:
+            entry = self._entry(container_id, network.id, endpoint[1],
+                                container_name=endpoint[0], network_name=network.name)
+        return self._entry_changes(entry, since) if entry is not None else []
+
+    def _disconnect_changes(self, container_id, network_id, since=None):
+        self.networks.discard_endpoint(network_id, container_id)
+        entry = self.addresses.remove(container_id, network_id)
+        if entry is None:
             logger.info(
-                "Ignoring container %r on %r. I don't remember its IPv6 address.",
-                container.name, network,
+                "Ignoring container %s on %s. I don't remember its IPv6 address.",
+                container_id[:12], network_id[:12],
+                extra={'container_id': container_id, 'network': network_id},
             )
-            return
+            return []
+        logger.debug("Address table holds %d entries", len(self.addresses))
+        return [self._change('delete', entry, since)]
 
-        self._del_ipv6_neigh_proxy(ipv6_address)
+    def _destroy_changes(self, container_id, since=None):
+        # Normally every network was disconnected already, this catches missed events.
+        self.networks.discard_container(container_id)
+        entries = self.addresses.remove_container(container_id)
+        if entries:
+            logger.info("Container %s was destroyed, removing its leftover addresses: %r",
+                        container_id[:12], entries)
+        return [self._change('delete', entry, since) for entry in entries]
 
-        logger.info("Removed IPv6 ndp proxy for container %r: %r", container.name, ipv6_address)
+    def _container_entry(self, container, network):
+        # The address table entry of a container on a network or None without an IPv6 address
+        settings = container.attrs['NetworkSettings']['Networks'][network]
+        if not settings.get('GlobalIPv6Address'):
+            logger.info(
+                "Ignoring container %r on %r. It has no IPv6 address.", container.name, network,
+                extra={'container_id': container.id, 'network': network},
+            )
+            return None
+        return self._entry(container.id, settings['NetworkID'], settings['GlobalIPv6Address'],
+                           container_name=container.name, network_name=network)
 
-    def _add_ipv6_neigh_proxy(self, ipv6_address) -> (int, str, str):
-        # Sets IPv6 neighbour discovery to ethernet interface.
-        logger.info("Adding %r to proxy on %r ...", ipv6_address, self.ethernet_interface)
-        run(
-            ['ip', '-6', 'neigh', 'add', 'proxy', ipv6_address, 'dev', self.ethernet_interface],
-            stdin=DEVNULL, stdout=PIPE, encoding='utf-8', check=True,
-        )
+    def _entry(self, container_id, network_id, ipv6_address, *, container_name=None,
+               network_name=None):
+        # The address table entry of a container address or None if it needs no proxy
+        ipv6_address = _normalize(ipv6_address)
+        interface = self._route(ipv6_address, network_id, network_name)
+        if interface is None:
+            logger.debug("Not proxying %s of container %r, it is routed to the host already.",
+                         ipv6_address, container_name or container_id[:12])
+            return None
+        return AddressEntry(container_id, network_id, ipv6_address, interface,
+                            container_name=container_name, network_name=network_name)
 
-    def _del_ipv6_neigh_proxy(self, ipv6_address) -> (int, str, str):
-        # Remove IPv6 neighbour discovery to ethernet interface.
-        logger.info("Removing %r from %r ...", ipv6_address, self.ethernet_interface)
-        run(
-            ['ip', '-6', 'neigh', 'del', 'proxy', ipv6_address, 'dev', self.ethernet_interface],
-            stdin=DEVNULL, stdout=PIPE, encoding='utf-8', check=True,
-        )
+    def _entry_changes(self, entry, since=None):
+        # Stores entry and returns the proxy changes that make the kernel follow
+        changes = [self._change('delete', old, since) for old in self.addresses.add(entry)
+                   if old.proxy_entry != entry.proxy_entry]
+        changes.append(self._change('add', entry, since))
+        logger.debug("Address table holds %d entries", len(self.addresses))
+        return changes
+
+    @staticmethod
+    def _change(action, entry, since=None):
+        return ProxyChange(action, entry.ipv6_address, entry.interface, since=since,
+                           label=f"container {entry.container_name or entry.container_id[:12]!r}",
+                           container_id=entry.container_id,
+                           network=entry.network_name or entry.network_id)
+
+    def _interface(self, network_id, network_name=None):
+        # The gateway interface to proxy the addresses of a network on
+        return (self.network_interfaces.get(network_id)
+                or self.network_interfaces.get(network_name)
+                or self.ethernet_interface)
+
+    def _route(self, ipv6_address, network_id, network_name=None):
+        # The interface to proxy an address on, by its longest matching prefix,
+        # or None if it isn't proxied at all
+        route = self.prefixes.lookup(ipv6_address)
+        if route is None:
+            route = self._interface(network_id, network_name)
+        return None if route == SKIP else route
+
+    def _index_network(self, network_id, network_name, subnets):
+        # Routes the subnets of a network to its gateway, unless a static route covers them
+        self._unindex_network(network_id)
+        for subnet in subnets:
+            route = self._static_prefixes.lookup(subnet.network_address, subnet.prefixlen)
+            self.prefixes.add(subnet, route or self._interface(network_id, network_name))
+        self._network_subnets[network_id] = (network_name, subnets)
+
+    def _unindex_network(self, network_id):
+        _, subnets = self._network_subnets.pop(network_id, (None, ()))
+        for subnet in subnets:
+            self.prefixes.remove(subnet)
+            route = self._static_prefixes.get(subnet)
+            if route is not None:
+                self.prefixes.add(subnet, route)
+
+    def _watched_networks(self, networks):
+        # The listed networks whose containers are proxied, see `watched_networks`
+        return [network for network in networks
+                if self.is_watched_network(network['Id'], network.get('Name'))]
+
+    def _index_networks(self, networks):
+        # Fills the prefix index with the subnets of the listed networks
+        for network in self._watched_networks(networks):
+            if network.get('EnableIPv6'):
+                self._index_network(network['Id'], network.get('Name'), ipv6_subnets(network))
 
     def _activate_ndp_proxy(self):
         # Activates the ndp proxy
-        logger.info("Activating IPv6 ndp proxy on %r ...", self.ethernet_interface)
-        run(
-            ["sysctl", f"net.ipv6.conf.{self.ethernet_interface}.proxy_ndp=1"],
-            stdin=DEVNULL, stdout=PIPE, stderr=PIPE, encoding='utf-8', check=True,
-        )
+        for interface in self.gateway_interfaces:
+            logger.info("Activating IPv6 ndp proxy on %r ...", interface)
+            self.backend.activate(interface)
 
-    def _add_all_existing_containers_to_neigh_proxy(self):
-        # Adds all running containers to the IPv6 neighbour discovery proxy
+    def _apply(self, add=(), delete=()):
+        # Applies a batch of proxy changes and logs the ones that failed
+        with metrics.BACKEND_APPLY_SECONDS.time(backend=self.backend.name):
+            failures = self.backend.apply(add=add, delete=delete)
+        for failure in failures:
+            logger.error("%s", failure)
+
+    def _inspect_ipv6_networks(self, networks):
+        # Yields the NetworkInfo of all IPv6 networks as the concurrent inspections finish
+        from docker.errors import NotFound
+        with ThreadPoolExecutor(max_workers=self.startup_concurrency) as pool:
+            futures = {pool.submit(self.networks.refresh, network['Id']): network
+                       for network in networks if network.get('EnableIPv6')
+                       and self.is_watched_network(network['Id'], network.get('Name'))}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except NotFound:
+                    logger.debug("Network %r vanished during startup", futures[future].get('Name'))
+
+    def _resume_from_snapshot(self, previous):
+        # Resumes the event stream where the last run stopped. Docker only keeps
+        # its last 256 events, so connects during the downtime may be lost: the
+        # proxy table is still checked against the endpoints docker has now,
+        # with the entries of the snapshot counting as ours to remove.
+        logger.info("Resuming from a snapshot of %d addresses, %.1fs old ...",
+                    len(previous.entries), previous.age)
+        self._since, self._seen_at_since = previous.since, set()
+        self._handled_since = previous.since
+        self._add_all_existing_containers_to_neigh_proxy(previous.entries)
+
+    def _add_all_existing_containers_to_neigh_proxy(self, previous=()):
+        # Brings the proxy table in line with all running containers. Each network
+        # lists the addresses of all its containers, so instead of inspecting every
+        # container the networks are inspected concurrently and each one is added
+        # to the proxy as soon as it arrives. Entries of a previous run are stale
+        # as well when docker doesn't know them anymore.
         logger.info("Adding all runnning containers to IPv6 ndp proxy...")
-        for container in self._client.containers.list():
-            for network in container.attrs['NetworkSettings']['Networks'].keys():
-                self._add_container_to_ipv6_ndp_proxy(container, network)
+        started = time.monotonic()
+        current = {entry for entry in self.backend.dump() if entry[1] in self.gateway_interfaces}
+        networks = self._client.api.networks()
+        self._index_networks(networks)
+
+        desired = set()
+        for network in self._inspect_ipv6_networks(networks):
+            missing = []
+            for container_id, (container_name, ipv6_address) in network.endpoints.items():
+                if not ipv6_address:
+                    logger.info("Ignoring container %r on %r. It has no IPv6 address.",
+                                container_name, network.name,
+                                extra={'container_id': container_id, 'network': network.name})
+                    continue
+                entry = self._entry(container_id, network.id, ipv6_address,
+                                    container_name=container_name, network_name=network.name)
+                if entry is None:
+                    continue
+                self.addresses.add(entry)
+                desired.add(entry.proxy_entry)
+                if entry.proxy_entry not in current:
+                    missing.append(entry.proxy_entry)
+            logger.debug("Network %r: adding %d of %d addresses",
+                         network.name, len(missing), len(network.endpoints))
+            self._apply(add=missing)
+
+        # Only entries inside the subnets of watched networks, or that we added
+        # before, are ours to remove
+        subnets = _ipv6_subnets(self._watched_networks(networks))
+        ours = {entry.proxy_entry for entry in previous}
+        stale = sorted(
+            entry for entry in current - desired
+            if entry in ours or any(ipaddress.ip_address(entry[0]) in subnet for subnet in subnets)
+        )
+        self._apply(delete=stale)
+        logger.info("Proxy table: %d entries up to date, added %d, removed %d stale in %.3fs",
+                    len(desired & current), len(desired - current), len(stale),
+                    time.monotonic() - started)
@@ -0,0 +1,206 @@
+"""Minimal rtnetlink (NETLINK_ROUTE) client for the IPv6 neighbour proxy table.
+
+Only the handful of messages needed by the daemon are implemented: adding,
+deleting and dumping ``NTF_PROXY`` neighbour entries and decoding neighbour
+and link notifications. See ``rtnetlink(7)``, ``linux/neighbour.h`` and
+``linux/if_link.h`` for the wire format.
+"""
+import itertools
+import os
+import socket
+import struct
+
+NETLINK_ROUTE = 0
+
+# Message types
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
+
+# Message flags
+NLM_F_REQUEST = 0x001
+NLM_F_ACK = 0x004
+NLM_F_DUMP = 0x300
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+# Multicast groups, as bind() bitmask
+RTMGRP_LINK = 0x1
+RTMGRP_NEIGH = 0x4
+
+# Link attributes and flags
+IFLA_IFNAME = 3
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+# Neighbour attributes, flags and states
+NDA_DST = 1
+NTF_PROXY = 0x08
+NUD_PERMANENT = 0x80
+
+_NLMSGHDR = struct.Struct('=IHHII')  # len, type, flags, seq, pid
+_NDMSG = struct.Struct('=BxxxiHBB')  # family, ifindex, state, flags, type
+_IFINFOMSG = struct.Struct('=BxHiII')  # family, type, index, flags, change
+_RTATTR = struct.Struct('=HH')  # len, type
+_NLMSGERR = struct.Struct('=i')
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def pack_attr(attr_type, data):
+    """Encodes a single route attribute, padded to the netlink alignment."""
+    length = _RTATTR.size + len(data)
+    return _RTATTR.pack(length, attr_type) + data + b'\0' * (_align(length) - length)
+
+
+def pack_proxy_dump_request():
+    """Builds the ``ndmsg`` payload that asks for the IPv6 proxy entries only."""
+    return _NDMSG.pack(socket.AF_INET6, 0, 0, NTF_PROXY, 0)
+
+
+def pack_proxy_neigh(ipv6_address, ifindex):
+    """Builds the ``ndmsg`` payload of a proxy entry for ``ipv6_address`` on ``ifindex``."""
+    return (
+        _NDMSG.pack(socket.AF_INET6, ifindex, NUD_PERMANENT, NTF_PROXY, 0)
+        + pack_attr(NDA_DST, socket.inet_pton(socket.AF_INET6, ipv6_address))
+    )
+
+
+def parse_attrs(data):
+    """Decodes a sequence of route attributes into a ``{type: data}`` dict."""
+    attrs = {}
+    offset = 0
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def unpack_neigh(payload):
+    """Decodes a neighbour message into ``(ifindex, flags, destination)``.
+
+    ``destination`` is the textual IPv6 address or ``None`` for other families.
+    """
+    family, ifindex, _, flags, _ = _NDMSG.unpack_from(payload)
+    dst = parse_attrs(payload[_NDMSG.size:]).get(NDA_DST)
+    if family != socket.AF_INET6 or dst is None or len(dst) != 16:
+        return ifindex, flags, None
+    return ifindex, flags, socket.inet_ntop(socket.AF_INET6, dst)
+
+
+def unpack_link(payload):
+    """Decodes a link message into ``(ifindex, flags, name)``."""
+    _, _, ifindex, flags, _ = _IFINFOMSG.unpack_from(payload)
+    name = parse_attrs(payload[_IFINFOMSG.size:]).get(IFLA_IFNAME)
+    return ifindex, flags, name.rstrip(b'\0').decode() if name is not None else None
+
+
+def iter_messages(data):
+    """Splits a datagram received from the kernel into ``(type, flags, seq, payload)``."""
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        yield msg_type, flags, seq, data[offset + _NLMSGHDR.size:offset + length]
+        offset += _align(length)
+
+
+class NetlinkRouteSocket:
+    """A persistent ``NETLINK_ROUTE`` socket.
+
+    Requests are acknowledged synchronously; a negative acknowledgement is
+    raised as :class:`OSError` with the errno reported by the kernel.
+    """
+
+    RECV_BUFFER = 1 << 17
+    #: Requests sent in one datagram by :meth:`request_many`. Every request
+    #: gets its own acknowledgement, so this bounds the receive queue as well.
+    BATCH_SIZE = 64
+
+    def __init__(self, groups=0):
+        """
+        :param (int) groups: Multicast group bitmask to subscribe to.
+        """
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self._sock.bind((0, groups))
+        self._seq = itertools.count(1)
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+
+    def receive(self):
+        """Reads one datagram, e.g. of multicast notifications, as a list of
+        ``(type, flags, seq, payload)``.
+
+        Raises :class:`OSError` with ``ENOBUFS`` if notifications were lost
+        because the receive buffer overflowed.
+        """
+        return list(iter_messages(self._sock.recv(self.RECV_BUFFER)))
+
+    def _pack(self, msg_type, flags, payload):
+        seq = next(self._seq)
+        return seq, _NLMSGHDR.pack(_NLMSGHDR.size + len(payload), msg_type,
+                                   flags | NLM_F_REQUEST, seq, 0) + payload
+
+    def request(self, msg_type, flags, payload):
+        """Sends one request and waits for its acknowledgement."""
+        error, = self.request_many([(msg_type, flags, payload)])
+        if error is not None:
+            raise error
+
+    def request_many(self, requests):
+        """Sends ``(type, flags, payload)`` requests in as few datagrams as possible.
+
+        :return: One entry per request, in order: ``None`` on success or the
+           :class:`OSError` the kernel answered with.
+        """
+        results = []
+        requests = list(requests)
+        for start in range(0, len(requests), self.BATCH_SIZE):
+            pending = {}
+            datagram = bytearray()
+            for msg_type, flags, payload in requests[start:start + self.BATCH_SIZE]:
+                seq, message = self._pack(msg_type, flags | NLM_F_ACK, payload)
+                pending[seq] = len(results) + len(pending)
+                datagram += message
+            results.extend([None] * len(pending))
+            self._sock.send(datagram)
+            while pending:
+                for reply_type, _, seq, reply in iter_messages(self._sock.recv(self.RECV_BUFFER)):
+                    if reply_type != NLMSG_ERROR or seq not in pending:
+                        continue
+                    error, = _NLMSGERR.unpack_from(reply)
+                    index = pending.pop(seq)
+                    if error:
+                        results[index] = OSError(-error, os.strerror(-error))
+        return results
+
+    def dump(self, msg_type, payload):
+        """Sends a dump request and yields the payloads of all answers."""
+        seq, message = self._pack(msg_type, NLM_F_DUMP, payload)
+        self._sock.send(message)
+        while True:
+            for reply_type, _, reply_seq, reply in iter_messages(self._sock.recv(self.RECV_BUFFER)):
+                if reply_seq != seq:
+                    continue
+                if reply_type == NLMSG_DONE:
+                    return
+                if reply_type == NLMSG_ERROR:
+                    error, = _NLMSGERR.unpack_from(reply)
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return
+                yield reply
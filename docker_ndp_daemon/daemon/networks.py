@@ -0,0 +1,95 @@
+import ipaddress
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NetworkInfo:
+    """What the daemon needs to know of a docker network and its endpoints."""
+    __slots__ = ('id', 'name', 'enable_ipv6', 'subnets', 'endpoints')
+
+    def __init__(self, attrs):
+        """
+        :param (dict) attrs: The result of ``GET /networks/{id}``.
+        """
+        self.id = attrs['Id']
+        self.name = attrs.get('Name')
+        self.enable_ipv6 = bool(attrs.get('EnableIPv6'))
+        self.subnets = ipv6_subnets(attrs)
+        # container id -> (container name, ipv6 address or None)
+        self.endpoints = {
+            container_id: (endpoint.get('Name'), _strip_prefix(endpoint.get('IPv6Address')))
+            for container_id, endpoint in (attrs.get('Containers') or {}).items()
+        }
+
+
+def ipv6_subnets(attrs):
+    """The IPv6 subnets in the IPAM config of a network, i.e. where its
+    container addresses come from.
+
+    :param (dict) attrs: A network as listed or inspected by docker.
+    """
+    subnets = []
+    for pool in (attrs.get('IPAM') or {}).get('Config') or ():
+        subnet = pool.get('Subnet', '')
+        if ':' in subnet:
+            subnets.append(ipaddress.ip_network(subnet, strict=False))
+    return subnets
+
+
+def _strip_prefix(address):
+    # Endpoint addresses come in CIDR notation, e.g. "2001:db8::2/64"
+    return address.split('/', 1)[0] if address else None
+
+
+class NetworkCache:
+    """Caches network inspections, so one request resolves the addresses of
+    all containers on a network.
+    """
+
+    def __init__(self, client):
+        """
+        :param (docker.DockerClient) client: Client used for inspecting networks.
+        """
+        self._client = client
+        self._networks = {}  # network id -> NetworkInfo
+
+    def __len__(self):
+        return len(self._networks)
+
+    def refresh(self, network_id):
+        """Inspects a network and caches the result."""
+        logger.debug("Inspecting network %s", network_id[:12])
+        info = NetworkInfo(self._client.api.inspect_network(network_id))
+        self._networks[network_id] = info
+        return info
+
+    def get(self, network_id):
+        """Returns the cached :class:`NetworkInfo`, inspecting the network if unknown."""
+        info = self._networks.get(network_id)
+        return info if info is not None else self.refresh(network_id)
+
+    def endpoint(self, network_id, container_id):
+        """Returns ``(network, (container name, ipv6 address))`` of a container.
+
+        A container that isn't in the cached endpoints yet causes a single
+        refresh of the network. The endpoint is ``None`` if the network doesn't
+        know the container even then.
+        """
+        info = self.get(network_id)
+        if info.enable_ipv6 and container_id not in info.endpoints:
+            info = self.refresh(network_id)
+        return info, info.endpoints.get(container_id)
+
+    def discard_endpoint(self, network_id, container_id):
+        info = self._networks.get(network_id)
+        if info is not None:
+            info.endpoints.pop(container_id, None)
+
+    def discard_container(self, container_id):
+        """Drops a container from the endpoints of all cached networks."""
+        for info in self._networks.values():
+            info.endpoints.pop(container_id, None)
+
+    def forget(self, network_id):
+        self._networks.pop(network_id, None)
@@ -0,0 +1,355 @@
+import errno
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from . import metrics, profiling
+from .proxy import ProxyError
+
+#: Errors that won't go away by trying again
+PERMANENT_ERRORS = frozenset((errno.EPERM, errno.EACCES, errno.EINVAL, errno.EAFNOSUPPORT))
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyChange:
+    """Adding or deleting one proxy entry."""
+    __slots__ = ('action', 'ipv6_address', 'interface', 'label', 'since', 'attempt',
+                 'container_id', 'network')
+
+    def __init__(self, action, ipv6_address, interface, label=None, since=None,
+                 container_id=None, network=None):
+        """
+        :param (str) action: ``'add'`` or ``'delete'``.
+        :param (str) label: What the address belongs to, for logging.
+        :param (float) since: Unix time of the event that caused the change.
+        :param (str) container_id: The container of the address, for logging.
+        :param (str) network: Name or id of the address's network, for logging.
+        """
+        self.action = action
+        self.ipv6_address = ipv6_address
+        self.interface = interface
+        self.label = label
+        self.since = since
+        self.container_id = container_id
+        self.network = network
+        self.attempt = 0  # failed tries so far
+
+    @property
+    def proxy_entry(self):
+        return self.ipv6_address, self.interface
+
+    def __repr__(self):
+        return f"ProxyChange({self.action} {self.ipv6_address} on {self.interface})"
+
+
+class _FailedWork:
+    # Queued work that raised, to be run again under its key
+    __slots__ = ('work', 'attempt')
+
+    def __init__(self, work, attempt):
+        self.work = work
+        self.attempt = attempt  # failed tries so far
+
+    def __call__(self):
+        return self.work()
+
+
+class ProxyQueue:
+    """Decouples event intake from programming the proxy table.
+
+    Work is queued under a key, e.g. a container on a network. Queued work is
+    either a :class:`ProxyChange` or a callable that runs on the worker thread
+    and returns the changes to make, so lookups needed to resolve an event don't
+    hold up reading the event stream.
+
+    A ``'delete'`` queued while the ``'add'`` of the same key is still pending
+    cancels it, e.g. a container that connects and disconnects before the next
+    flush causes no work at all. The worker takes batches of pending work, once
+    ``batch_size`` keys are waiting or ``flush_interval`` seconds after the
+    oldest one arrived, and applies the resulting changes with one backend call.
+    Of several changes of the same proxy entry in a batch only the last counts.
+
+    The queue is bounded: :meth:`submit` blocks while ``max_depth`` keys are
+    pending, which slows down the event reader instead of growing without limit.
+
+    A change that fails is tried again later, with exponential backoff and
+    jitter, up to ``retry_attempts`` times. There is at most one retry per proxy
+    entry, and a newer change of the entry replaces it. Errors in
+    :data:`PERMANENT_ERRORS` are given up on right away. Queued work that
+    raises, e.g. a lookup hitting a docker API error, is run again the same
+    way, unless newer work was queued under its key meanwhile.
+    """
+
+    def __init__(self, backend, *, flush_interval=0.005, batch_size=256, max_depth=10000,
+                 retry_delay=0.5, retry_max_delay=60.0, retry_attempts=8):
+        """
+        :param (ProxyBackend) backend: Applies the batches.
+        :param (float) flush_interval: Seconds to wait for more work before flushing.
+        :param (int) batch_size: Flush as soon as this many keys are pending.
+        :param (int) max_depth: Maximum number of pending keys.
+        :param (float) retry_delay: Seconds before the first retry, doubled for
+           every further one.
+        :param (float) retry_max_delay: Upper bound of the delay between retries.
+        :param (int) retry_attempts: How often a change is tried at most.
+        """
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_depth = max_depth
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.retry_attempts = retry_attempts
+        self._pending = OrderedDict()  # key -> [enqueued at, [(action, work), ...]]
+        self._retries = {}  # proxy entry -> (due at, ProxyChange)
+        self._work_retries = {}  # key -> (due at, [(action, _FailedWork)])
+        #: Called on the worker thread after every flush
+        self.flush_hooks = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    @property
+    def depth(self):
+        """Number of keys with pending work."""
+        return len(self._pending)
+
+    @property
+    def retrying(self):
+        """Number of failed changes and work waiting to be tried again."""
+        return len(self._retries) + len(self._work_retries)
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='proxy-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flushes all pending work and stops the worker."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def flush(self):
+        """Applies all pending work and the retries that are due on the calling thread."""
+        with self._cond:
+            batch = [(key, enqueued, works) for key, (enqueued, works) in self._pending.items()]
+            self._pending.clear()
+            now = time.monotonic()
+            batch.extend(self._take_work_retries(now))
+            retries = self._take_retries(now)
+            self._cond.notify_all()
+        if batch or retries:
+            self.flush_batch(batch, retries)
+
+    def add(self, ipv6_address, interface, label=None):
+        self.submit('add', (ipv6_address, interface),
+                    ProxyChange('add', ipv6_address, interface, label))
+
+    def delete(self, ipv6_address, interface, label=None):
+        self.submit('delete', (ipv6_address, interface),
+                    ProxyChange('delete', ipv6_address, interface, label))
+
+    def submit(self, action, key, work):
+        """Queues ``work`` under ``key``.
+
+        :param (str) action: ``'add'`` and ``'delete'`` cancel each other out,
+           anything else is just queued.
+        :param work: A :class:`ProxyChange` or a callable returning an iterable
+           of them.
+        """
+        with self._cond:
+            while len(self._pending) >= self.max_depth and key not in self._pending:
+                logger.debug("Proxy queue is full (%d), waiting ...", len(self._pending))
+                self._cond.wait()
+            if self._work_retries.pop(key, None) is not None:
+                logger.debug("Newer %s of %r replaces its failed work", action, key)
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = [time.monotonic(), [(action, work)]]
+            elif action == 'delete' and pending[1][-1][0] == 'add':
+                pending[1].pop()
+                logger.debug("Cancelled pending add of %r", key)
+                if not pending[1]:
+                    del self._pending[key]
+            else:
+                pending[1].append((action, work))
+            self._cond.notify_all()
+
+    def _retry_timeout(self, now):
+        # Seconds until the next retry is due or None without retries
+        if not self._retries and not self._work_retries:
+            return None
+        return max(0, min(due for due, _ in chain(self._retries.values(),
+                                                  self._work_retries.values())) - now)
+
+    def _take_retries(self, now):
+        due = [entry for entry, (due_at, _) in self._retries.items() if due_at <= now]
+        return [self._retries.pop(entry)[1] for entry in due]
+
+    def _take_work_retries(self, now):
+        # The failed work that is due, as batch items
+        due = [key for key, (due_at, _) in self._work_retries.items() if due_at <= now]
+        return [(key, now, self._work_retries.pop(key)[1]) for key in due]
+
+    def _take_batch(self):
+        # Waits for a batch or retries to be due and removes them from the pending work
+        with self._cond:
+            while not self._pending and not self._stopping:
+                timeout = self._retry_timeout(time.monotonic())
+                if timeout == 0:
+                    break
+                self._cond.wait(timeout)
+            if self._pending and not self._stopping:
+                enqueued, _ = next(iter(self._pending.values()))
+                deadline = enqueued + self.flush_interval
+                while (self._pending and len(self._pending) < self.batch_size
+                       and not self._stopping):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                key, (enqueued, works) = self._pending.popitem(last=False)
+                batch.append((key, enqueued, works))
+            now = time.monotonic()
+            batch.extend(self._take_work_retries(now))
+            retries = self._take_retries(now)
+            self._cond.notify_all()
+            return batch, retries
+
+    def _run(self):
+        while True:
+            batch, retries = self._take_batch()
+            if batch or retries:
+                profiling.call(self.flush_batch, batch, retries)
+                for hook in list(self.flush_hooks):
+                    try:
+                        hook()
+                    except Exception:
+                        logger.exception("After flush hook failed")
+            elif self._stopping:
+                if self._retries or self._work_retries:
+                    logger.warning("Dropping %d proxy changes waiting for a retry",
+                                   self.retrying)
+                    self._retries.clear()
+                    self._work_retries.clear()
+                return
+
+    def _resolve(self, batch, retries=()):
+        # Runs the queued work and keeps the last change of every proxy entry.
+        # Newer changes replace retries of the same entry.
+        changes = OrderedDict((change.proxy_entry, change) for change in retries)
+        for key, _, works in batch:
+            failed = None  # the last work of the key that raised, unless newer work ran
+            for action, work in works:
+                if isinstance(work, ProxyChange):
+                    produced = (work,)
+                else:
+                    try:
+                        produced = work() or ()
+                    except Exception as ex:
+                        failed = (action, work, ex)
+                        continue
+                failed = None
+                for change in produced:
+                    changes.pop(change.proxy_entry, None)
+                    self._retries.pop(change.proxy_entry, None)
+                    changes[change.proxy_entry] = change
+            if failed is not None:
+                self._retry_work(key, *failed)
+        return list(changes.values())
+
+    def _backoff(self, attempt):
+        # Seconds to wait before the next try after `attempt` failed ones
+        delay = min(self.retry_max_delay, self.retry_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _retry_work(self, key, action, work, failure):
+        # Queues failed work under its key again or gives up on it
+        if isinstance(work, _FailedWork):
+            work, attempt = work.work, work.attempt + 1
+        else:
+            attempt = 1
+        if attempt >= self.retry_attempts:
+            logger.error("Handling queued %s of %r failed. Giving up after %d attempts.",
+                         action, key, attempt, exc_info=failure)
+            metrics.PROXY_CHANGES_ABANDONED.inc(action=action)
+            return
+        delay = self._backoff(attempt)
+        work = _FailedWork(work, attempt)
+        with self._cond:
+            if key in self._pending:
+                logger.debug("Handling queued %s of %r failed, newer work replaces it: %s",
+                             action, key, failure)
+                return
+            self._work_retries[key] = (time.monotonic() + delay, [(action, work)])
+            self._cond.notify_all()
+        logger.warning("Handling queued %s of %r failed: %s. Retrying in %.1fs.",
+                       action, key, failure, delay)
+        metrics.PROXY_RETRIES.inc(action=action)
+
+    def _retry(self, change, failure):
+        # Schedules a failed change again or gives up on it
+        change.attempt += 1
+        if (change.attempt >= self.retry_attempts
+                or getattr(failure.cause, 'errno', None) in PERMANENT_ERRORS):
+            logger.error("%s. Giving up after %d attempts.", failure, change.attempt)
+            metrics.PROXY_CHANGES_ABANDONED.inc(action=change.action)
+            return
+        delay = self._backoff(change.attempt)
+        logger.warning("%s. Retrying in %.1fs.", failure, delay)
+        metrics.PROXY_RETRIES.inc(action=change.action)
+        self._retries[change.proxy_entry] = (time.monotonic() + delay, change)
+
+    def flush_batch(self, batch, retries=()):
+        """Resolves ``(key, enqueued, [(action, work), ...])`` items and applies
+        the resulting changes, together with the due ``retries``, in one backend call.
+        """
+        changes = self._resolve(batch, retries)
+        if not changes:
+            return
+        add = [change.proxy_entry for change in changes if change.action == 'add']
+        delete = [change.proxy_entry for change in changes if change.action == 'delete']
+        logger.debug("Applying %d additions and %d deletions, %d keys still queued",
+                     len(add), len(delete), self.depth)
+        metrics.BACKEND_CALLS_IN_FLIGHT.inc(backend=self.backend.name)
+        try:
+            with metrics.BACKEND_APPLY_SECONDS.time(backend=self.backend.name):
+                failures = self.backend.apply(add=add, delete=delete)
+        except Exception as ex:
+            logger.exception("Applying %d proxy changes failed", len(changes))
+            failures = [ProxyError(change.action, change.ipv6_address, change.interface, ex)
+                        for change in changes]
+        finally:
+            metrics.BACKEND_CALLS_IN_FLIGHT.dec(backend=self.backend.name)
+
+        failed = {(failure.ipv6_address, failure.interface): failure for failure in failures}
+        applied = time.time()
+        for change in changes:
+            failure = failed.get(change.proxy_entry)
+            if failure is not None:
+                self._retry(change, failure)
+                continue
+            duration = None
+            if change.since is not None:
+                duration = applied - change.since
+                metrics.EVENT_TO_PROXY_SECONDS.observe(duration, action=change.action)
+            fields = {'container_id': change.container_id, 'network': change.network,
+                      'address': change.ipv6_address, 'interface': change.interface,
+                      'duration': duration}
+            if change.action == 'add':
+                logger.info("Set IPv6 ndp proxy for %s: %r on %r",
+                            change.label or "container", change.ipv6_address, change.interface,
+                            extra=fields)
+            else:
+                logger.info("Removed IPv6 ndp proxy for %s: %r on %r",
+                            change.label or "container", change.ipv6_address, change.interface,
+                            extra=fields)
@@ -0,0 +1,65 @@
+import ipaddress
+
+#: Route of prefixes that are routed to the host already and need no NDP proxy
+SKIP = 'skip'
+
+
+class PrefixIndex:
+    """Longest prefix match over IPv6 prefixes.
+
+    Prefixes are kept in one dict per prefix length, keyed by their network
+    bits, so a lookup costs one dict access per length in use.
+    """
+
+    def __init__(self):
+        self._by_length = {}  # prefix length -> {network bits: route}
+        self._lengths = []  # prefix lengths in use, longest first
+
+    def __len__(self):
+        return sum(len(routes) for routes in self._by_length.values())
+
+    @staticmethod
+    def _bits(address, length):
+        return int(address) >> (128 - length)
+
+    def add(self, prefix, route):
+        """Routes the addresses of ``prefix`` (e.g. ``'2001:db8::/64'``) to ``route``."""
+        network = ipaddress.IPv6Network(prefix, strict=False)
+        routes = self._by_length.get(network.prefixlen)
+        if routes is None:
+            routes = self._by_length[network.prefixlen] = {}
+            self._lengths = sorted(self._by_length, reverse=True)
+        routes[self._bits(network.network_address, network.prefixlen)] = route
+
+    def remove(self, prefix):
+        """Forgets ``prefix``, if it is in the index."""
+        network = ipaddress.IPv6Network(prefix, strict=False)
+        routes = self._by_length.get(network.prefixlen)
+        if routes is None:
+            return
+        routes.pop(self._bits(network.network_address, network.prefixlen), None)
+        if not routes:
+            del self._by_length[network.prefixlen]
+            self._lengths = sorted(self._by_length, reverse=True)
+
+    def get(self, prefix):
+        """Returns the route of exactly ``prefix`` or ``None``."""
+        network = ipaddress.IPv6Network(prefix, strict=False)
+        routes = self._by_length.get(network.prefixlen, {})
+        return routes.get(self._bits(network.network_address, network.prefixlen))
+
+    def lookup(self, address, max_length=128):
+        """Returns the route of the longest prefix containing ``address`` or ``None``.
+
+        :param address: An IPv6 address, as string or :class:`ipaddress.IPv6Address`.
+        :param (int) max_length: Only consider prefixes up to this length, e.g. to
+           find the prefix covering a whole subnet.
+        """
+        address = ipaddress.IPv6Address(address)
+        for length in self._lengths:
+            if length > max_length:
+                continue
+            route = self._by_length[length].get(self._bits(address, length))
+            if route is not None:
+                return route
+        return None
@@ -0,0 +1,175 @@
+"""On-demand profiling of a running daemon.
+
+:func:`toggle` starts profiling the event handlers and the proxy queue
+flushes with cProfile, the next call stops it and writes the stats.
+:func:`dump_memory` writes where the most memory was allocated, together with
+a summary of the daemon's state. ``main`` calls them on SIGUSR1 and SIGUSR2.
+
+cProfile, pstats and tracemalloc are only imported once they are used.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_profiler = None  # the Profiler while profiling
+_toggle_lock = threading.Lock()
+
+
+def call(function, *args):
+    """Calls ``function(*args)``, profiled while profiling is on."""
+    profiler = _profiler
+    if profiler is None:
+        return function(*args)
+    return profiler.call(function, *args)
+
+
+class Profiler:
+    """Collects the profiles of the calls passed to :meth:`call`.
+
+    cProfile only sees the thread it was enabled on, so every thread gets a
+    profile of its own and :meth:`stats` adds them up.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._profiles = {}  # thread id -> cProfile.Profile
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._running = 0  # calls being profiled
+
+    def call(self, function, *args):
+        if getattr(self._local, 'active', False):
+            # Already profiled by an outer call
+            return function(*args)
+        profile = self._profiles.get(threading.get_ident())
+        if profile is None:
+            import cProfile
+            profile = cProfile.Profile()
+            with self._cond:
+                self._profiles[threading.get_ident()] = profile
+        with self._cond:
+            self._running += 1
+        self._local.active = True
+        try:
+            try:
+                profile.enable()
+            except ValueError:
+                # Python >= 3.12 allows one active profiler, which sees all threads
+                return function(*args)
+            try:
+                return function(*args)
+            finally:
+                profile.disable()
+        finally:
+            self._local.active = False
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def stop(self, timeout=5.0):
+        """Waits up to ``timeout`` seconds for the calls being profiled to return.
+
+        :return: ``False`` if some are still running.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._running, timeout)
+
+    def stats(self):
+        """The :class:`pstats.Stats` of all threads or ``None`` without any calls."""
+        import pstats
+        with self._cond:
+            profiles = list(self._profiles.values())
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+def _path(directory, kind, suffix):
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(directory, f"dnd-{kind}-{os.getpid()}-{stamp}{suffix}")
+
+
+def toggle(directory, top=30):
+    """Starts profiling or stops it and writes the stats.
+
+    The stats are written twice: in the binary format of
+    :meth:`pstats.Stats.dump_stats`, for tools like snakeviz, and as text with
+    the ``top`` functions by cumulative time.
+
+    :param (str) directory: Where to write the stats.
+    :return: The path of the binary stats when profiling stopped, ``None``
+       when it started or nothing was called.
+    """
+    global _profiler
+    with _toggle_lock:
+        profiler = _profiler
+        if profiler is None:
+            _profiler = Profiler()
+            logger.info("Profiling the event handlers and proxy queue until the next SIGUSR1")
+            return None
+        _profiler = None
+
+    if not profiler.stop():
+        logger.warning("Writing the profile while calls are still being profiled")
+    seconds = time.monotonic() - profiler.started
+    stats = profiler.stats()
+    if stats is None:
+        logger.warning("Nothing was profiled in %.1f s", seconds)
+        return None
+    path = _path(directory, 'profile', '.prof')
+    stats.dump_stats(path)
+    with open(path[:-len('.prof')] + '.txt', 'w') as file:
+        file.write(f"Profiled for {seconds:.1f} s\n")
+        stats.stream = file
+        stats.sort_stats('cumulative').print_stats(top)
+    logger.info("Wrote the profile of %.1f s to %s", seconds, path)
+    return path
+
+
+def trace_memory(frames=1):
+    """Starts tracing memory allocations, if they aren't traced yet.
+
+    :return: ``True`` if the allocations were traced already.
+    """
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        return True
+    tracemalloc.start(frames)
+    return False
+
+
+def dump_memory(directory, state=(), top=30):
+    """Writes ``state`` and the ``top`` lines that allocated the most memory
+    still in use. Starts tracing allocations if they aren't traced yet, the
+    next call has them.
+
+    :param (str) directory: Where to write the dump.
+    :param (list) state: Lines summarizing the state of the daemon.
+    :return: The path of the dump.
+    """
+    import tracemalloc
+    traced = trace_memory()
+    path = _path(directory, 'memory', '.txt')
+    with open(path, 'w') as file:
+        for line in state:
+            file.write(line + '\n')
+        if not traced:
+            file.write("\nMemory allocations are traced from now on, the next dump lists them.\n")
+        else:
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            file.write(f"\nTraced memory: {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB\n"
+                       f"Top {top} allocating lines:\n")
+            for statistic in snapshot.statistics('lineno')[:top]:
+                file.write(f"{statistic}\n")
+    logger.info("Wrote the memory dump to %s", path)
+    return path
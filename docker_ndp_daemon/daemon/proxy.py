@@ -0,0 +1,297 @@
+import errno
+import logging
+import socket
+import threading
+from pathlib import Path
+from subprocess import run, PIPE, DEVNULL, CalledProcessError
+
+from . import netlink
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyError(Exception):
+    """A single proxy table change that failed."""
+
+    def __init__(self, action, ipv6_address, interface, cause):
+        super().__init__(f"Could not {action} {ipv6_address} on {interface}: {cause}")
+        self.action = action
+        self.ipv6_address = ipv6_address
+        self.interface = interface
+        self.cause = cause
+
+
+def _is_noop_error(action, ex):
+    # Adding an existing or deleting a missing entry already has the desired outcome
+    code = getattr(ex, 'errno', None)
+    return (action, code) in (('add', errno.EEXIST), ('delete', errno.ENOENT))
+
+
+class ProxyBackend:
+    """Programs the kernel's IPv6 NDP proxy table.
+
+    Subclasses implement the actual mechanism. Backends may hold on to
+    resources like sockets and must be closed after use. Proxy entries are
+    ``(ipv6_address, interface)`` tuples.
+    """
+
+    @property
+    def name(self):
+        """Name of the mechanism, e.g. for metrics."""
+        return type(self).__name__
+
+    def activate(self, interface):
+        """Enables NDP proxying on ``interface``."""
+        raise NotImplementedError
+
+    def add(self, ipv6_address, interface):
+        """Adds ``ipv6_address`` to the proxy table of ``interface``."""
+        raise NotImplementedError
+
+    def delete(self, ipv6_address, interface):
+        """Removes ``ipv6_address`` from the proxy table of ``interface``."""
+        raise NotImplementedError
+
+    def dump(self):
+        """Returns the set of IPv6 proxy entries currently in the kernel."""
+        raise NotImplementedError
+
+    def apply(self, add=(), delete=()):
+        """Applies a batch of changes, deletions first.
+
+        Adding an entry that exists or deleting one that doesn't is not an error.
+
+        :return: A list of :class:`ProxyError` for the changes that failed.
+        """
+        failures = []
+        for action, entries in (('delete', delete), ('add', add)):
+            for ipv6_address, interface in entries:
+                try:
+                    getattr(self, action)(ipv6_address, interface)
+                except (OSError, CalledProcessError) as ex:
+                    if not _is_noop_error(action, ex):
+                        failures.append(ProxyError(action, ipv6_address, interface, ex))
+        return failures
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SynchronizedBackend(ProxyBackend):
+    """Lets several threads share a backend by running one operation at a time.
+
+    The wrapped backend is not closed with this one, its owner closes it.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    def activate(self, interface):
+        with self._lock:
+            self.backend.activate(interface)
+
+    def add(self, ipv6_address, interface):
+        with self._lock:
+            self.backend.add(ipv6_address, interface)
+
+    def delete(self, ipv6_address, interface):
+        with self._lock:
+            self.backend.delete(ipv6_address, interface)
+
+    def dump(self):
+        with self._lock:
+            return self.backend.dump()
+
+    def apply(self, add=(), delete=()):
+        with self._lock:
+            return self.backend.apply(add=add, delete=delete)
+
+
+class DryRunBackend(ProxyBackend):
+    """Keeps the proxy table in memory and only logs the changes, e.g. to
+    try a configuration or replay a trace without touching the kernel.
+    """
+
+    def __init__(self):
+        self.entries = set()
+        self.added = 0
+        self.deleted = 0
+        self._lock = threading.Lock()
+
+    def activate(self, interface):
+        logger.debug("Dry run: activate NDP proxy on %s", interface)
+
+    def add(self, ipv6_address, interface):
+        self.apply(add=[(ipv6_address, interface)])
+
+    def delete(self, ipv6_address, interface):
+        self.apply(delete=[(ipv6_address, interface)])
+
+    def dump(self):
+        with self._lock:
+            return set(self.entries)
+
+    def apply(self, add=(), delete=()):
+        with self._lock:
+            for entry in delete:
+                logger.debug("Dry run: delete %s on %s", *entry)
+                self.entries.discard(entry)
+                self.deleted += 1
+            for entry in add:
+                logger.debug("Dry run: add %s on %s", *entry)
+                self.entries.add(entry)
+                self.added += 1
+        return []
+
+
+class IpCommandBackend(ProxyBackend):
+    """Forks ``ip`` and ``sysctl`` for every operation."""
+
+    def activate(self, interface):
+        run(
+            ["sysctl", f"net.ipv6.conf.{interface}.proxy_ndp=1"],
+            stdin=DEVNULL, stdout=PIPE, stderr=PIPE, encoding='utf-8', check=True,
+        )
+
+    def add(self, ipv6_address, interface):
+        run(
+            ['ip', '-6', 'neigh', 'add', 'proxy', ipv6_address, 'dev', interface],
+            stdin=DEVNULL, stdout=PIPE, encoding='utf-8', check=True,
+        )
+
+    def delete(self, ipv6_address, interface):
+        run(
+            ['ip', '-6', 'neigh', 'del', 'proxy', ipv6_address, 'dev', interface],
+            stdin=DEVNULL, stdout=PIPE, encoding='utf-8', check=True,
+        )
+
+    def dump(self):
+        # Lines look like "2001:db8::1 dev eth0 proxy"
+        result = run(
+            ['ip', '-6', 'neigh', 'show', 'proxy'],
+            stdin=DEVNULL, stdout=PIPE, encoding='utf-8', check=True,
+        )
+        entries = set()
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if len(fields) >= 3 and fields[1] == 'dev':
+                entries.add((fields[0], fields[2]))
+        return entries
+
+    def apply(self, add=(), delete=()):
+        commands = [f"neigh del proxy {ipv6_address} dev {interface}\n"
+                    for ipv6_address, interface in delete]
+        commands += [f"neigh add proxy {ipv6_address} dev {interface}\n"
+                     for ipv6_address, interface in add]
+        if not commands:
+            return []
+        result = run(
+            ['ip', '-6', '-batch', '-'], input=''.join(commands),
+            stdout=PIPE, stderr=PIPE, encoding='utf-8',
+        )
+        if result.returncode == 0:
+            return []
+        # `ip neigh` aborts the whole batch on the first error, even with
+        # -force. Redo whatever is still missing one by one to find the culprits.
+        logger.debug("ip -batch failed (%s), retrying one by one", result.stderr.strip())
+        current = self.dump()
+        return super().apply(
+            add=[entry for entry in add if entry not in current],
+            delete=[entry for entry in delete if entry in current],
+        )
+
+
+class NetlinkBackend(ProxyBackend):
+    """Talks rtnetlink over a single persistent socket, without forking."""
+
+    proc_sys = Path('/proc/sys')
+
+    def __init__(self):
+        self._sock = netlink.NetlinkRouteSocket()
+
+    def activate(self, interface):
+        (self.proc_sys / 'net/ipv6/conf' / interface / 'proxy_ndp').write_text('1\n')
+
+    def add(self, ipv6_address, interface):
+        self._sock.request(
+            netlink.RTM_NEWNEIGH, netlink.NLM_F_CREATE | netlink.NLM_F_EXCL,
+            netlink.pack_proxy_neigh(ipv6_address, socket.if_nametoindex(interface)),
+        )
+
+    def delete(self, ipv6_address, interface):
+        self._sock.request(
+            netlink.RTM_DELNEIGH, 0,
+            netlink.pack_proxy_neigh(ipv6_address, socket.if_nametoindex(interface)),
+        )
+
+    def dump(self):
+        entries = set()
+        names = {}
+        for payload in self._sock.dump(netlink.RTM_GETNEIGH, netlink.pack_proxy_dump_request()):
+            ifindex, flags, ipv6_address = netlink.unpack_neigh(payload)
+            if ipv6_address is None or not flags & netlink.NTF_PROXY:
+                continue
+            if ifindex not in names:
+                try:
+                    names[ifindex] = socket.if_indextoname(ifindex)
+                except OSError:
+                    names[ifindex] = None
+            if names[ifindex] is not None:
+                entries.add((ipv6_address, names[ifindex]))
+        return entries
+
+    def apply(self, add=(), delete=()):
+        changes = []
+        requests = []
+        for action, msg_type, flags, entries in (
+                ('delete', netlink.RTM_DELNEIGH, 0, delete),
+                ('add', netlink.RTM_NEWNEIGH, netlink.NLM_F_CREATE | netlink.NLM_F_EXCL, add)):
+            for ipv6_address, interface in entries:
+                try:
+                    ifindex = socket.if_nametoindex(interface)
+                    payload = netlink.pack_proxy_neigh(ipv6_address, ifindex)
+                except OSError as ex:
+                    changes.append((action, ipv6_address, interface, ex))
+                    continue
+                changes.append((action, ipv6_address, interface, None))
+                requests.append((msg_type, flags, payload))
+
+        results = iter(self._sock.request_many(requests))
+        failures = []
+        for action, ipv6_address, interface, error in changes:
+            if error is None:
+                error = next(results)
+            if error is not None and not _is_noop_error(action, error):
+                failures.append(ProxyError(action, ipv6_address, interface, error))
+        return failures
+
+    def close(self):
+        self._sock.close()
+
+
+BACKENDS = {
+    'netlink': NetlinkBackend,
+    'ip': IpCommandBackend,
+    'dry-run': DryRunBackend,
+}
+
+
+def create_backend(name):
+    """Creates the proxy backend called ``name`` (see :data:`BACKENDS`)."""
+    try:
+        backend = BACKENDS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown proxy backend {name!r}. Choose one of {', '.join(BACKENDS)}.")
+    logger.debug("Using %r proxy backend", name)
+    return backend()
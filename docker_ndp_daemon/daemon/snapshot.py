@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from .addresses import AddressEntry
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotState:
+    """What a snapshot holds: the address entries and the event cursor they reflect."""
+    __slots__ = ('since', 'entries', 'saved_at')
+
+    def __init__(self, since, entries, saved_at):
+        self.since = since  # timeNano of the last event reflected in the entries
+        self.entries = entries
+        self.saved_at = saved_at  # unix time
+
+    @property
+    def age(self):
+        return time.time() - self.saved_at
+
+
+class Snapshot:
+    """Keeps the address table and the event cursor in a file, for warm restarts.
+
+    The file is replaced atomically, so a crash leaves either the old or the
+    new snapshot, never a torn one.
+    """
+    VERSION = 1
+
+    def __init__(self, path, *, interval=5.0, max_age=60.0):
+        """
+        :param (str) path: Where to keep the snapshot.
+        :param (float) interval: Seconds between two saves while events come in.
+        :param (float) max_age: The events of snapshots older than this many
+           seconds aren't resumed, only their entries are used to find stale
+           proxy entries. Docker only keeps its last 256 events.
+        """
+        self.path = Path(path)
+        self.interval = interval
+        self.max_age = max_age
+        self._last_save = float('-inf')
+
+    def due(self):
+        """Tells if the last save is more than ``interval`` seconds ago."""
+        return time.monotonic() - self._last_save >= self.interval
+
+    def load(self):
+        """Returns the saved :class:`SnapshotState` or ``None`` if there is none usable."""
+        try:
+            with self.path.open(encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') != self.VERSION:
+                logger.warning("Ignoring snapshot %s of unknown version %r",
+                               self.path, data.get('version'))
+                return None
+            entries = [
+                AddressEntry(container_id, network_id, ipv6_address, interface,
+                             container_name=container_name, network_name=network_name)
+                for (container_id, network_id, ipv6_address, interface, container_name,
+                     network_name) in data['entries']
+            ]
+            return SnapshotState(data['since'], entries, data['saved_at'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            logger.warning("Ignoring unreadable snapshot %s: %s", self.path, ex)
+            return None
+
+    def save(self, since, entries):
+        """Writes a new snapshot and replaces the old one with it.
+
+        :param (int) since: timeNano of the last event reflected in ``entries``.
+        :param entries: The :class:`AddressEntry` objects to keep.
+        """
+        data = {
+            'version': self.VERSION,
+            'saved_at': time.time(),
+            'since': since,
+            'entries': [(entry.container_id, entry.network_id, entry.ipv6_address,
+                         entry.interface, entry.container_name, entry.network_name)
+                        for entry in entries],
+        }
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with temporary.open('w', encoding='utf-8') as file:
+                json.dump(data, file, separators=(',', ':'))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+        except OSError as ex:
+            logger.warning("Could not save snapshot %s: %s", self.path, ex)
+            return
+        self._last_save = time.monotonic()
+        logger.debug("Saved snapshot of %d entries to %s", len(data['entries']), self.path)
@@ -0,0 +1,249 @@
+"""Recording the docker events and API responses a daemon sees, and playing them back.
+
+A trace is a file of JSON lines, gzip compressed if its name ends with
+``.gz``. The first line is a header, every further line one record
+``[seconds since the start, kind, key, data]``:
+
+``event``
+    A decoded docker event, ``key`` is ``null``.
+``networks``
+    The result of listing the networks, ``key`` is ``null``.
+``network``
+    The inspection of the network ``key``, ``null`` if docker didn't know it.
+``container``
+    The attrs of the container ``key``, ``null`` if docker didn't know it.
+"""
+import gzip
+import json
+import logging
+import math
+import threading
+import time
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+def _open(path, mode):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class TraceWriter:
+    """Appends records to a trace file. Safe to use from several threads.
+
+    Records arriving after :meth:`close` are dropped.
+    """
+
+    #: Seconds between two flushes of the file
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path):
+        self.path = path
+        self._file = _open(path, 'w')
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_flush = self._started
+        self._file.write(json.dumps({'version': VERSION, 'started': time.time()}) + '\n')
+
+    def record(self, kind, key, data):
+        now = time.monotonic()
+        line = json.dumps([round(now - self._started, 6), kind, key, data],
+                          separators=(',', ':'))
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + '\n')
+            if now - self._last_flush >= self.FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        """Finishes the file, writing the gzip trailer of compressed traces."""
+        with self._lock:
+            self._file.close()
+
+
+def read_trace(path):
+    """Returns the records of a trace as ``(seconds, kind, key, data)`` tuples.
+
+    A trace cut short, e.g. by the recording daemon getting killed, is read up
+    to its last complete record.
+    """
+    records = []
+    with _open(path, 'r') as file:
+        header = json.loads(file.readline() or 'null')
+        if not isinstance(header, dict) or header.get('version') != VERSION:
+            raise ValueError(f"{path} is not a trace of version {VERSION}")
+        try:
+            for line in file:
+                records.append(tuple(json.loads(line)))
+        except (EOFError, ValueError) as ex:
+            logger.warning("Trace %s ends with an incomplete record: %s", path, ex)
+    return records
+
+
+class _TracingApi:
+
+    def __init__(self, api, trace):
+        self._api = api
+        self._trace = trace
+
+    def networks(self, *args, **kwargs):
+        result = self._api.networks(*args, **kwargs)
+        self._trace.record('networks', None, result)
+        return result
+
+    def inspect_network(self, network_id, *args, **kwargs):
+        from docker.errors import NotFound
+        try:
+            result = self._api.inspect_network(network_id, *args, **kwargs)
+        except NotFound:
+            self._trace.record('network', network_id, None)
+            raise
+        self._trace.record('network', network_id, result)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+
+class _TracingContainers:
+
+    def __init__(self, containers, trace):
+        self._containers = containers
+        self._trace = trace
+
+    def get(self, container_id):
+        from docker.errors import NotFound
+        try:
+            container = self._containers.get(container_id)
+        except NotFound:
+            self._trace.record('container', container_id, None)
+            raise
+        self._trace.record('container', container_id, container.attrs)
+        return container
+
+    def __getattr__(self, name):
+        return getattr(self._containers, name)
+
+
+class TracingDockerClient:
+    """Wraps a :class:`docker.DockerClient`, recording the network and
+    container lookups the daemon makes. The events are recorded by the event
+    loop itself.
+    """
+
+    def __init__(self, client, trace):
+        self._client = client
+        self.api = _TracingApi(client.api, trace)
+        self.containers = _TracingContainers(client.containers, trace)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class ReplayDockerClient:
+    """Stands in for a :class:`docker.DockerClient`, serving a recorded trace.
+
+    :meth:`events` plays the recorded events ``speed`` times as fast as they
+    happened, ``0`` as fast as they are read, with their times set to when
+    they are played. Lookups are answered with the first response recorded
+    after the event played last, which is what the recording daemon got when
+    it handled that event, or with the last response if there is none.
+
+    The replayed daemon doesn't batch its work exactly like the recording one,
+    so it may look up containers the recording daemon found in the network
+    inspections. Those are made up from the networks listing them.
+    """
+
+    def __init__(self, records, speed=1.0):
+        self.speed = speed
+        self._events = [(at, data) for at, kind, _, data in records if kind == 'event']
+        self._responses = {}  # (kind, key) -> [(seconds, data), ...]
+        for at, kind, key, data in records:
+            if kind != 'event':
+                self._responses.setdefault((kind, key), []).append((at, data))
+        self._played = -math.inf  # recording time of the event played last
+        self.api = SimpleNamespace(networks=self._networks, inspect_network=self._inspect_network)
+        self.containers = SimpleNamespace(get=self._container)
+
+    def _response(self, kind, key):
+        from docker.errors import NotFound
+        responses = self._responses.get((kind, key))
+        if not responses:
+            raise NotFound(f"{kind} {key} is not in the trace")
+        data = next((recorded for at, recorded in responses if at >= self._played),
+                    responses[-1][1])
+        if data is None:
+            raise NotFound(f"{kind} {key} was not found when the trace was recorded")
+        return data
+
+    def _networks(self, *args, **kwargs):
+        return self._response('networks', None)
+
+    def _inspect_network(self, network_id, *args, **kwargs):
+        return self._response('network', network_id)
+
+    def _container(self, container_id):
+        from docker.errors import NotFound
+        try:
+            attrs = self._response('container', container_id)
+        except NotFound:
+            attrs = self._listed_container(container_id)
+            if attrs is None:
+                raise
+        return SimpleNamespace(id=attrs['Id'], name=attrs.get('Name', '').lstrip('/'),
+                               attrs=attrs)
+
+    def _listed_container(self, container_id):
+        # Container attrs with the endpoints the networks last listed for it
+        attrs = None
+        for (kind, _), responses in self._responses.items():
+            if kind != 'network':
+                continue
+            network = next((data for at, data in reversed(responses)
+                            if data and container_id in (data.get('Containers') or {})), None)
+            if network is None:
+                continue
+            endpoint = network['Containers'][container_id]
+            if attrs is None:
+                attrs = {'Id': container_id, 'Name': '/' + endpoint.get('Name', ''),
+                         'NetworkSettings': {'Networks': {}}}
+            attrs['NetworkSettings']['Networks'][network['Name']] = {
+                'NetworkID': network['Id'],
+                'GlobalIPv6Address': (endpoint.get('IPv6Address') or '').split('/')[0],
+            }
+        return attrs
+
+    def events(self, decode=True, since=None, filters=None):
+        started = time.monotonic()
+        first = self._events[0][0] if self._events else 0.0
+        for at, event in self._events:
+            if self.speed:
+                delay = started + (at - first) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self._played = at
+            time_nano = time.time_ns()
+            yield dict(event, time=time_nano // 1_000_000_000, timeNano=time_nano)
+
+    @property
+    def event_count(self):
+        return len(self._events)
+
+    @property
+    def recorded_seconds(self):
+        """Seconds between the first and the last recorded event."""
+        return self._events[-1][0] - self._events[0][0] if self._events else 0.0
+
+    def close(self):
+        pass
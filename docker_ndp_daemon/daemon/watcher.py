@@ -0,0 +1,145 @@
+import errno
+import logging
+import select
+import socket
+import threading
+import time
+
+from . import netlink
+
+logger = logging.getLogger(__name__)
+
+#: Pending key restoring every entry of an interface instead of a single address
+ALL = None
+
+
+class NeighbourWatcher:
+    """Notices proxy entries that vanish from the kernel and asks for them back.
+
+    Listens to rtnetlink neighbour and link notifications on a thread of its
+    own. A deleted proxy entry on a watched interface, or the interface coming
+    back up (which flushes its proxy entries), makes the watcher call
+    ``restore`` with the lost ``(ipv6_address, interface)`` entries. The
+    address is :data:`ALL` if all entries of the interface are gone. Whether
+    an entry is still wanted is up to ``restore``.
+
+    Restores are rate limited, so a flapping link or a tool that keeps
+    deleting entries doesn't cause a storm: ``restore`` is called at most once
+    every ``min_interval`` seconds, and the same entry is restored at most once
+    every ``cooldown`` seconds.
+    """
+
+    #: Longest time the thread blocks, i.e. how fast :meth:`stop` takes effect
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, restore, interfaces, *, min_interval=1.0, cooldown=10.0):
+        """
+        :param restore: Called with a list of lost ``(ipv6_address, interface)``
+           entries, on the watcher thread.
+        :param (list) interfaces: Names of the interfaces to watch.
+        :param (float) min_interval: Seconds between two calls of ``restore``.
+        :param (float) cooldown: Seconds before the same entry is restored again.
+        """
+        self.restore = restore
+        self.interfaces = set(interfaces)
+        self.min_interval = min_interval
+        self.cooldown = cooldown
+        self._sock = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._link_up = {}  # interface name -> last seen state
+        self._pending = {}  # (ipv6 address or ALL, interface) -> due at
+        self._restored = {}  # (ipv6 address or ALL, interface) -> last restored at
+        self._last_flush = float('-inf')
+
+    def start(self):
+        self._sock = netlink.NetlinkRouteSocket(groups=netlink.RTMGRP_NEIGH | netlink.RTMGRP_LINK)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='neigh-watcher', daemon=True)
+        self._thread.start()
+        logger.info("Watching the proxy entries on %s", ', '.join(sorted(self.interfaces)))
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            readable, _, _ = select.select([self._sock], [], [], self._timeout(time.monotonic()))
+            if readable:
+                try:
+                    messages = self._sock.receive()
+                except OSError as ex:
+                    if ex.errno != errno.ENOBUFS:
+                        raise
+                    logger.warning("Missed kernel notifications, restoring all proxy entries")
+                    messages = ()
+                    for interface in self.interfaces:
+                        self._lost(ALL, interface, time.monotonic())
+                for msg_type, _, _, payload in messages:
+                    self.handle_message(msg_type, payload, time.monotonic())
+            self.flush(time.monotonic())
+
+    def _timeout(self, now):
+        # Seconds until the next restore is due
+        if not self._pending:
+            return self.POLL_INTERVAL
+        due = max(min(self._pending.values()), self._last_flush + self.min_interval)
+        return min(max(due - now, 0), self.POLL_INTERVAL)
+
+    def handle_message(self, msg_type, payload, now):
+        """Takes note of a neighbour or link notification."""
+        if msg_type == netlink.RTM_DELNEIGH:
+            ifindex, flags, ipv6_address = netlink.unpack_neigh(payload)
+            if ipv6_address is None or not flags & netlink.NTF_PROXY:
+                return
+            interface = self._interface_name(ifindex)
+            if interface in self.interfaces:
+                logger.debug("Kernel dropped proxy entry %s on %s", ipv6_address, interface)
+                self._lost(ipv6_address, interface, now)
+        elif msg_type == netlink.RTM_NEWLINK:
+            _, flags, interface = netlink.unpack_link(payload)
+            if interface not in self.interfaces:
+                return
+            up = bool(flags & netlink.IFF_UP and flags & netlink.IFF_LOWER_UP)
+            if up and self._link_up.get(interface) is False:
+                # The kernel flushes the proxy entries of an interface going down
+                logger.info("Interface %s came back up", interface)
+                self._lost(ALL, interface, now)
+            self._link_up[interface] = up
+
+    @staticmethod
+    def _interface_name(ifindex):
+        try:
+            return socket.if_indextoname(ifindex)
+        except OSError:
+            return None
+
+    def _lost(self, ipv6_address, interface, now):
+        key = ipv6_address, interface
+        due = max(now, self._restored.get(key, float('-inf')) + self.cooldown)
+        self._pending[key] = min(due, self._pending.get(key, due))
+
+    def flush(self, now):
+        """Calls ``restore`` with the entries that are due, unless it was called too recently."""
+        if not self._pending or now - self._last_flush < self.min_interval:
+            return
+        due = [key for key, due_at in self._pending.items() if due_at <= now]
+        if not due:
+            return
+        for key in due:
+            del self._pending[key]
+            self._restored[key] = now
+        self._last_flush = now
+        # Forget cooldowns that are over
+        self._restored = {key: at for key, at in self._restored.items()
+                          if at + self.cooldown > now}
+        try:
+            self.restore(due)
+        except Exception:
+            logger.exception("Restoring proxy entries failed")
@@ -0,0 +1,159 @@
+"""Sets up logging as the ``[logger]`` section of the config says.
+
+Log calls only put their records on a queue. A listener thread formats and
+writes them, so a slow terminal or journal doesn't hold up event handling.
+Records can be written as JSON lines, and repetitive lines can be rate
+limited.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+from .daemon import metrics
+
+#: Record attributes that become JSON fields when a log call passes them in ``extra``
+FIELDS = ('container_id', 'network', 'address', 'interface', 'duration', 'suppressed')
+
+_installed = []  # handlers added to the root logger by setup_logging()
+
+
+class TextFormatter(logging.Formatter):
+    """The classic format, telling how many similar lines were suppressed before a line."""
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f" ({suppressed} similar lines suppressed)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object with the time, level, logger,
+    message and the :data:`FIELDS` it has.
+    """
+
+    def format(self, record):
+        document = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                document[field] = value
+        if record.exc_info:
+            document['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            document['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(document, default=str, separators=(',', ':'))
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most ``limit`` records of the same message template through
+    per ``interval`` seconds. The first record after a pause tells how many
+    were suppressed.
+
+    Only records up to ``level`` are limited, warnings and errors always pass.
+    """
+
+    def __init__(self, limit, interval, level=logging.INFO):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.level = level
+        self._windows = {}  # (logger, template) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.level or not isinstance(record.msg, str):
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                window = self._windows[key] = [now, 0, window[2] if window else 0]
+            if window[1] >= self.limit:
+                window[2] += 1
+                passed = False
+            else:
+                window[1] += 1
+                if window[2]:
+                    record.suppressed, window[2] = window[2], 0
+                passed = True
+        if not passed:
+            metrics.LOG_RECORDS_DROPPED.inc(reason='rate_limited')
+        return passed
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """Hands records to a listener thread that formats them and passes them
+    to ``handlers``.
+
+    Records are queued unformatted, so their arguments should not change
+    after the log call. They are dropped while ``max_queued`` records wait.
+    """
+
+    def __init__(self, handlers, max_queued=10000):
+        super().__init__(queue.Queue(max_queued))
+        self.handlers = list(handlers)
+        self._listener = logging.handlers.QueueListener(self.queue, *self.handlers,
+                                                        respect_handler_level=True)
+        self._started = False
+
+    def start(self):
+        self._listener.start()
+        self._started = True
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc(reason='queue_full')
+
+    def close(self):
+        if self._started:
+            # Writes what is still queued
+            self._started = False
+            self._listener.stop()
+        for handler in self.handlers:
+            handler.close()
+        super().close()
+
+
+def setup_logging(settings, stream=None):
+    """Makes the root logger write records as ``settings`` say, replacing
+    what an earlier call set up.
+
+    :param (Config) settings: :data:`config.logger`.
+    :param stream: Where to write the lines. Defaults to ``sys.stderr``.
+    :return: The handler added to the root logger.
+    """
+    for handler in _installed:
+        logging.root.removeHandler(handler)
+        handler.close()
+    _installed.clear()
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter() if settings.json else TextFormatter(settings.format))
+    handler = output
+    if settings.background:
+        handler = BackgroundHandler([output])
+        handler.start()
+    if settings.rate_limit:
+        handler.addFilter(RateLimitFilter(settings.rate_limit, settings.rate_interval))
+    logging.root.addHandler(handler)
+    logging.root.setLevel(settings.level)
+    _installed.append(handler)
+    return handler
@@ -1,26 +1,368 @@
+import argparse
 import logging
+import os
+import signal
 import sys
+import threading
+import time
+from queue import Queue
 
-from .daemon import DockerNdpDaemon
+from .daemon import DockerNdpDaemon, create_backend, metrics, profiling
+from .daemon.pipeline import ProxyQueue
+from .daemon.proxy import SynchronizedBackend
+from .daemon.snapshot import Snapshot
+from .daemon.trace import TraceWriter
 from . import config
+from .logs import setup_logging
 
+logger = logging.getLogger(__name__)
 
-def init_app():
+
+def _override(text):
+    # Parses a SECTION.OPTION=VALUE command line override
+    key, separator, value = text.partition('=')
+    section, dot, option = key.strip().rpartition('.')
+    if not separator or not section or not option:
+        raise argparse.ArgumentTypeError(f"expected SECTION.OPTION=VALUE, not {text!r}")
+    return section, option, value.strip()
+
+
+def parse_args(argv=None):
+    """Parses the command line. Its options override the config files."""
+    parser = argparse.ArgumentParser(
+        prog='docker-ndp-daemon',
+        description="Adds the IPv6 addresses of docker containers to the NDP proxy table.")
+    parser.add_argument('-c', '--config', action='append', default=[], metavar='PATH',
+                        help="config file read after the default ones, may be repeated")
+    parser.add_argument('--gateway', help="internet gateway interface ([host] gateway)")
+    parser.add_argument('--proxy-backend', choices=('netlink', 'ip', 'dry-run'),
+                        help="how to program the NDP proxy table ([host] proxy_backend)")
+    parser.add_argument('--engine', choices=('threads', 'asyncio'),
+                        help="how to read docker events ([events] engine)")
+    parser.add_argument('--log-level', help="([logger] level)")
+    parser.add_argument('--set', action='append', default=[], type=_override,
+                        metavar='SECTION.OPTION=VALUE', help="overrides any config option")
+    return parser.parse_args(argv)
+
+
+def config_overrides(args):
+    """The config options set on the command line, by ``(section, option)``."""
+    overrides = {(section, option): value for section, option, value in args.set}
+    for section, option, value in (('host', 'gateway', args.gateway),
+                                   ('host', 'proxy_backend', args.proxy_backend),
+                                   ('events', 'engine', args.engine),
+                                   ('logger', 'level', args.log_level)):
+        if value is not None:
+            overrides[section, option] = value
+    return overrides
+
+
+def process_uptime():
+    """Seconds since this process started or ``None`` if the system doesn't tell.
+
+    Unlike a timer started in :func:`init_app`, this includes the interpreter
+    start and the imports.
+    """
     try:
-        logger = logging.getLogger(__name__)
-        daemon = None
+        with open('/proc/self/stat') as file:
+            # The fields after the command name, starting with the state (field 3)
+            fields = file.read().rpartition(')')[2].split()
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def record_startup(endpoint):
+    """Records how long it took until ``endpoint`` was ready to read events."""
+    uptime = process_uptime()
+    if uptime is None:
+        return
+    metrics.STARTUP_SECONDS.set(uptime, endpoint=endpoint.name)
+    logger.info("Endpoint %r is ready, %.3fs after the process started", endpoint.name, uptime)
+
+
+def daemon_options(endpoint):
+    """Keyword arguments for the :class:`DockerNdpDaemon` of a docker endpoint.
+
+    :param (Config) endpoint: One of :data:`config.endpoints`.
+    """
+    snapshot = None
+    if endpoint.snapshot:
+        snapshot = Snapshot(endpoint.snapshot, interval=config.snapshot.interval,
+                            max_age=config.snapshot.max_age)
+    capture = None
+    if endpoint.capture:
+        logger.info("Recording the events of %r to %s", endpoint.name, endpoint.capture)
+        capture = TraceWriter(endpoint.capture)
+    return dict(
+        name=endpoint.name, socket_url=endpoint.socket_url,
+        ethernet_interface=endpoint.gateway, interfaces=endpoint.interfaces,
+        prefixes=endpoint.prefixes, watched_networks=endpoint.networks,
+        startup_concurrency=config.host.startup_concurrency,
+        queue_options=config.queue.options,
+        watcher_options=config.watcher.options if config.watcher.enabled else None,
+        snapshot=snapshot, capture=capture, handler_plugins=config.events.plugins,
+    )
+
+
+class ServedEndpoint:
+    """An endpoint being served, as far as :func:`reload_config` is concerned."""
+
+    def __init__(self, endpoint, backend, queue=None):
+        #: Keyword arguments of the endpoint's next daemon
+        self.options = dict(daemon_options(endpoint), backend=backend, queue=queue)
+        #: The daemon serving the endpoint
+        self.daemon = None
+
+    def close(self):
+        """Finishes the trace of the endpoint, if it records one."""
+        capture = self.options.get('capture')
+        if capture is not None:
+            capture.close()
+
+    def new_daemon(self):
+        # Made under the reload lock, so a reload either comes before and is in
+        # the options or comes after and reconfigures the daemon
+        with _reload_lock:
+            self.daemon = DockerNdpDaemon(**self.options)
+            return self.daemon
+
+
+_served = {}  # endpoint name -> ServedEndpoint
+_reload_lock = threading.Lock()
+
+
+def reload_config(paths, overrides):
+    """Reads the config again and applies what changes without a restart.
+
+    Logging is set up anew and the daemons proxy the addresses on their new
+    gateway interfaces (see :meth:`DockerNdpDaemon.reconfigure`), without
+    rescanning and without losing their place in the event stream. Anything
+    else takes a restart.
+
+    :param paths: The config files, as passed to :func:`config.load`.
+    :param (dict) overrides: The command line overrides.
+    """
+    with _reload_lock:
+        try:
+            config.reload(paths, overrides)
+        except Exception as ex:
+            logger.error("Keeping the current config, the new one is invalid: %s", ex)
+            return
+        setup_logging(config.logger)
+        logger.info("Reloaded the config")
+        endpoints = {endpoint.name: endpoint for endpoint in config.endpoints}
+        for name in endpoints.keys() - _served.keys():
+            logger.warning("Endpoint %r is only served after a restart", name)
+        for name, served in _served.items():
+            endpoint = endpoints.get(name)
+            if endpoint is None:
+                logger.warning("Endpoint %r is served until a restart", name)
+                continue
+            if (endpoint.socket_url != served.options['socket_url']
+                    or endpoint.networks != served.options['watched_networks']):
+                logger.warning("The socket URL and networks of endpoint %r only change with "
+                               "a restart", name)
+            routes = dict(ethernet_interface=endpoint.gateway, interfaces=endpoint.interfaces,
+                          prefixes=endpoint.prefixes)
+            served.options.update(routes)
+            if served.daemon is not None:
+                served.daemon.reconfigure(**routes)
+
+
+def close_endpoints():
+    """Finishes what the served endpoints write, on the way out of :func:`init_app`."""
+    for served in list(_served.values()):
+        try:
+            served.close()
+        except Exception:
+            logger.exception("Closing an endpoint failed")
+
+
+def _exit(signum, frame):
+    # Lets SIGTERM unwind like Ctrl-C, so the daemons and their traces are closed
+    sys.exit(0)
+
+
+def install_reload_handler(paths, overrides):
+    """Makes SIGHUP reload the config, see :func:`reload_config`."""
+    def reload(signum, frame):
+        # The interrupted thread may hold locks the reload needs
+        threading.Thread(target=reload_config, args=(paths, overrides), name='config-reload',
+                         daemon=True).start()
 
-        logging.basicConfig(format=config.logger.format)
-        logging.root.setLevel(config.logger.level)
+    signal.signal(signal.SIGHUP, reload)
 
-        while True:
+
+def daemon_state():
+    """Lines summarizing the endpoints being served, for :func:`profiling.dump_memory`."""
+    uptime = process_uptime()
+    lines = [f"docker-ndp-daemon {os.getpid()} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
+             + (f", up {uptime:.0f} s" if uptime is not None else "")]
+    backends = set()
+    for name, served in list(_served.items()):
+        daemon = served.daemon
+        if daemon is None:
+            lines.append(f"endpoint {name}: starting")
+            continue
+        backends.add(daemon.backend.name)
+        lines.append(f"endpoint {name}: {len(daemon.addresses)} addresses proxied, "
+                     f"{len(daemon.networks)} networks cached, "
+                     f"{daemon.queue.depth} keys queued, {daemon.queue.retrying} retrying")
+    for name in sorted(backends):
+        lines.append(f"backend {name}: "
+                     f"{metrics.BACKEND_CALLS_IN_FLIGHT.value(backend=name)} apply calls in flight")
+    return lines
+
+
+def install_profiling_handlers(settings):
+    """Makes SIGUSR1 toggle profiling and SIGUSR2 dump the memory use, see
+    :mod:`.profiling`. Does nothing unless ``[profiling] enabled``.
+
+    :param (Config) settings: :data:`config.profiling`.
+    """
+    if not settings.enabled:
+        return
+    if settings.trace_memory:
+        profiling.trace_memory()
+
+    def toggle():
+        profiling.toggle(settings.directory, settings.top)
+
+    def dump_memory():
+        profiling.dump_memory(settings.directory, daemon_state(), settings.top)
+
+    def handler(name, target):
+        def run():
             try:
-                with DockerNdpDaemon(ethernet_interface=config.host.gateway) as daemon:
-                    daemon.listen_network_connect_events()
-            except TimeoutError as ex:
-                logger.debug(ex)
-                logger.info("Docker connection read timed out. Reconnecting ...")
+                target()
+            except Exception:
+                logger.exception("Writing the %s failed", name)
+
+        def handle(signum, frame):
+            # Writing the files takes a while and the interrupted thread may hold locks
+            threading.Thread(target=run, name=name, daemon=True).start()
+        return handle
+
+    signal.signal(signal.SIGUSR1, handler('profile', toggle))
+    signal.signal(signal.SIGUSR2, handler('memory dump', dump_memory))
+    logger.info("Profiling on SIGUSR1 and memory dumps on SIGUSR2 go to %s", settings.directory)
+
+
+def serve_endpoint(endpoint, backend, queue=None):
+    """Runs the daemon of one docker endpoint, reconnecting whenever docker
+    closes the event stream.
+
+    :param (Config) endpoint: One of :data:`config.endpoints`.
+    :param (ProxyBackend) backend: Programs the NDP proxy table.
+    :param (ProxyQueue) queue: A queue shared with other endpoints. ``None``
+       gives the daemon a queue of its own.
+    """
+    served = _served[endpoint.name] = ServedEndpoint(endpoint, backend, queue)
+    ready = False
+    while True:
+        with served.new_daemon() as daemon:
+            if not ready:
+                record_startup(endpoint)
+                ready = True
+            daemon.listen_network_connect_events()
+        metrics.RECONNECTS.inc(reason='closed')
+        logger.info("Docker closed the event stream of %r. Reconnecting ...", endpoint.name)
+
+
+def serve_endpoints(endpoints, backend, queue=None):
+    """Serves every endpoint on a thread of its own until one of them fails.
+
+    The endpoints share ``backend`` and ``queue``, so all proxy changes are
+    batched together. A single endpoint is served on the calling thread.
+    """
+    if len(endpoints) == 1:
+        serve_endpoint(endpoints[0], backend, queue)
+        return
+    failures = Queue()
+
+    def serve(endpoint):
+        try:
+            serve_endpoint(endpoint, backend, queue)
+        except BaseException as ex:
+            failures.put(ex)
+
+    for endpoint in endpoints:
+        threading.Thread(target=serve, args=(endpoint,), name=f"endpoint-{endpoint.name}",
+                         daemon=True).start()
+    raise failures.get()
+
+
+async def serve_endpoint_async(endpoint, backend, queue=None):
+    """Like :func:`serve_endpoint`, reading the events on the running asyncio loop.
+
+    Starting and stopping the daemon block, so they run in the loop's executor.
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    served = _served[endpoint.name] = ServedEndpoint(endpoint, backend, queue)
+    ready = False
+    while True:
+        daemon = served.new_daemon()
+        await loop.run_in_executor(None, daemon.__enter__)
+        if not ready:
+            record_startup(endpoint)
+            ready = True
+        try:
+            await daemon.listen_network_connect_events_async()
+        finally:
+            await loop.run_in_executor(None, daemon.__exit__, None, None, None)
+        metrics.RECONNECTS.inc(reason='closed')
+        logger.info("Docker closed the event stream of %r. Reconnecting ...", endpoint.name)
+
+
+async def serve_endpoints_async(endpoints, backend, queue=None):
+    """Serves all endpoints on one asyncio loop until one of them fails."""
+    import asyncio
+    await asyncio.gather(*(serve_endpoint_async(endpoint, backend, queue)
+                           for endpoint in endpoints))
+
+
+def run_endpoints(endpoints, backend, queue=None):
+    """Serves the endpoints with the engine chosen in ``[events] engine``."""
+    if config.events.engine == 'asyncio':
+        # asyncio is only imported by the engine that uses it
+        import asyncio
+        asyncio.run(serve_endpoints_async(endpoints, backend, queue))
+    else:
+        serve_endpoints(endpoints, backend, queue)
+
+
+def init_app(argv=None):
+    args = parse_args(argv)
+    paths, overrides = config.DEFAULT_PATHS + tuple(args.config), config_overrides(args)
+    try:
+        config.load(paths, overrides)
+        setup_logging(config.logger)
+        signal.signal(signal.SIGTERM, _exit)
+        install_reload_handler(paths, overrides)
+        install_profiling_handlers(config.profiling)
+
+        if config.metrics.enabled:
+            metrics.start_http_server(config.metrics.port, config.metrics.address)
+
+        with create_backend(config.host.proxy_backend) as backend:
+            if len(config.endpoints) == 1:
+                run_endpoints(config.endpoints, backend)
+            else:
+                logger.info("Serving docker endpoints %s",
+                            ', '.join(endpoint.name for endpoint in config.endpoints))
+                backend = SynchronizedBackend(backend)
+                proxy_queue = ProxyQueue(backend, **config.queue.options)
+                proxy_queue.start()
+                try:
+                    run_endpoints(config.endpoints, backend, proxy_queue)
+                finally:
+                    proxy_queue.stop()
     except (KeyboardInterrupt, SystemExit):
         sys.exit(0)
+    finally:
+        close_endpoints()
 
     # Just let other kinds of exceptions blow up the app with python's default handler
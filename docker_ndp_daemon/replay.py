@@ -0,0 +1,177 @@
+"""Replays a trace recorded with ``[events] capture`` through the daemon.
+
+The events and docker responses of the trace are served to a
+:class:`DockerNdpDaemon` configured like an endpoint of the config, which
+programs a dry-run proxy backend unless another one is chosen. The proxy
+operations and their timings are reported at the end::
+
+    docker-ndp-replay /var/lib/docker-ndp-daemon/trace.jsonl.gz --speed 10
+"""
+import argparse
+import logging
+import math
+import time
+
+from . import config
+from .logs import setup_logging
+from .daemon import DockerNdpDaemon, create_backend, metrics
+from .daemon.proxy import ProxyBackend
+from .daemon.trace import ReplayDockerClient, read_trace
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayNdpDaemon(DockerNdpDaemon):
+    """A :class:`DockerNdpDaemon` talking to a :class:`ReplayDockerClient`."""
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.replay_client = client
+
+    def init_docker_client(self):
+        return self.replay_client
+
+
+class TimedBackend(ProxyBackend):
+    """Counts the changes applied by ``backend`` and times its apply calls."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.added = 0
+        self.deleted = 0
+        self.durations = []  # seconds per apply call
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    def activate(self, interface):
+        self.backend.activate(interface)
+
+    def add(self, ipv6_address, interface):
+        return self.apply(add=[(ipv6_address, interface)])
+
+    def delete(self, ipv6_address, interface):
+        return self.apply(delete=[(ipv6_address, interface)])
+
+    def dump(self):
+        return self.backend.dump()
+
+    def apply(self, add=(), delete=()):
+        started = time.perf_counter()
+        failures = self.backend.apply(add=add, delete=delete)
+        self.durations.append(time.perf_counter() - started)
+        self.added += len(add)
+        self.deleted += len(delete)
+        return failures
+
+
+def _percentile(values, fraction):
+    if not values:
+        return math.nan
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def replay(records, endpoint, backend, speed=1.0):
+    """Feeds a trace through a daemon configured like ``endpoint``.
+
+    :param (list) records: The records of :func:`read_trace`.
+    :param (Config) endpoint: One of :data:`config.endpoints`.
+    :param (ProxyBackend) backend: Programs the proxy table, usually a dry run.
+    :param (float) speed: Play the events this many times as fast as they
+       were recorded, ``0`` as fast as possible.
+    :return: A dict with the report, see :func:`print_report`.
+    """
+    client = ReplayDockerClient(records, speed=speed)
+    timed = TimedBackend(backend)
+    daemon = ReplayNdpDaemon(client, name=endpoint.name, ethernet_interface=endpoint.gateway,
+                             interfaces=endpoint.interfaces, prefixes=endpoint.prefixes,
+                             watched_networks=endpoint.networks, backend=timed,
+                             startup_concurrency=config.host.startup_concurrency,
+                             queue_options=config.queue.options,
+                             handler_plugins=config.events.plugins)
+    logger.info("Replaying %d events of %.1f s at %s", client.event_count,
+                client.recorded_seconds, f"{speed:g}x" if speed else "full speed")
+    started = time.perf_counter()
+    with daemon:
+        ready = time.perf_counter()
+        startup_entries = timed.added
+        daemon.listen_network_connect_events()
+    finished = time.perf_counter()
+    return {
+        'events': client.event_count,
+        'recorded_seconds': client.recorded_seconds,
+        'startup_seconds': ready - started,
+        'startup_entries': startup_entries,
+        'replay_seconds': finished - ready,
+        'added': timed.added,
+        'deleted': timed.deleted,
+        'apply_calls': len(timed.durations),
+        'apply_seconds': timed.durations,
+        'entries': len(daemon.addresses),
+    }
+
+
+def print_report(report, backend_name, speed):
+    durations = report['apply_seconds']
+    print(f"events:      {report['events']:9d} recorded over {report['recorded_seconds']:.1f} s, "
+          f"replayed in {report['replay_seconds']:.1f} s "
+          f"({f'{speed:g}x' if speed else 'as fast as possible'})")
+    print(f"startup:     {report['startup_seconds'] * 1000:9.1f} ms, "
+          f"{report['startup_entries']} entries added")
+    print(f"proxy:       {report['added']:9d} adds, {report['deleted']} deletes "
+          f"in {report['apply_calls']} apply calls of the {backend_name} backend")
+    print(f"apply p50:   {_percentile(durations, 0.50) * 1000:9.3f} ms")
+    print(f"apply p99:   {_percentile(durations, 0.99) * 1000:9.3f} ms")
+    print(f"apply max:   {_percentile(durations, 1.0) * 1000:9.3f} ms")
+    for action in ('add', 'delete'):
+        if metrics.EVENT_TO_PROXY_SECONDS.count(action=action):
+            print(f"{action} latency: p50 <= "
+                  f"{metrics.EVENT_TO_PROXY_SECONDS.quantile(0.50, action=action) * 1000:g} ms, "
+                  f"p99 <= "
+                  f"{metrics.EVENT_TO_PROXY_SECONDS.quantile(0.99, action=action) * 1000:g} ms")
+    print(f"table:       {report['entries']:9d} addresses proxied at the end")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='docker-ndp-replay',
+        description="Replays a recorded trace of docker events through the daemon.")
+    parser.add_argument('trace', help="trace file written with [events] capture")
+    parser.add_argument('-c', '--config', action='append', default=[], metavar='PATH',
+                        help="config file read after the default ones, may be repeated")
+    parser.add_argument('--endpoint', help="configure the daemon like this endpoint "
+                                           "(default: the first one)")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="play the events this many times as fast as recorded, "
+                             "0 as fast as possible (default: 1)")
+    parser.add_argument('--proxy-backend', default='dry-run',
+                        choices=('dry-run', 'netlink', 'ip'),
+                        help="backend to program, the real ones change the kernel "
+                             "(default: dry-run)")
+    parser.add_argument('--log-level', default='warning')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config.load(config.DEFAULT_PATHS + tuple(args.config),
+                {('logger', 'level'): args.log_level})
+    setup_logging(config.logger)
+
+    endpoints = {endpoint.name: endpoint for endpoint in config.endpoints}
+    endpoint = endpoints.get(args.endpoint) if args.endpoint else config.endpoints[0]
+    if endpoint is None:
+        print(f"Unknown endpoint {args.endpoint!r}. Choose one of {', '.join(endpoints)}.")
+        return 2
+
+    records = read_trace(args.trace)
+    with create_backend(args.proxy_backend) as backend:
+        report = replay(records, endpoint, backend, speed=args.speed)
+        print_report(report, backend.name, args.speed)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,43 @@
+import unittest
+from docker_ndp_daemon.daemon.addresses import AddressEntry, AddressTable
+
+
+class AddressTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self._table = AddressTable()
+        self._table.add(AddressEntry('c1', 'n1', '2001:db8::1', 'eth0'))
+        self._table.add(AddressEntry('c1', 'n2', '2001:db8:1::1', 'eth0'))
+        self._table.add(AddressEntry('c2', 'n1', '2001:db8::2', 'eth0'))
+
+    def test_add__ok_displaces_same_key(self):
+        """Tests if a new address for a known container and network replaces the old one"""
+        displaced = self._table.add(AddressEntry('c1', 'n1', '2001:db8::9', 'eth0'))
+        self.assertEqual(['2001:db8::1'], [entry.ipv6_address for entry in displaced])
+        self.assertIsNone(self._table.lookup('2001:db8::1'))
+        self.assertEqual(3, len(self._table))
+
+    def test_add__ok_displaces_same_address(self):
+        """Tests if an address reused by another container moves to that container"""
+        displaced = self._table.add(AddressEntry('c3', 'n1', '2001:db8::2', 'eth0'))
+        self.assertEqual([('c2', 'n1')], [entry.key for entry in displaced])
+        self.assertIsNone(self._table.get('c2', 'n1'))
+        self.assertEqual('c3', self._table.lookup('2001:db8::2').container_id)
+
+    def test_remove__ok(self):
+        entry = self._table.remove('c2', 'n1')
+        self.assertEqual('2001:db8::2', entry.ipv6_address)
+        self.assertIsNone(self._table.lookup('2001:db8::2'))
+        self.assertIsNone(self._table.remove('c2', 'n1'))
+        self.assertEqual(2, len(self._table))
+
+    def test_remove_container__ok(self):
+        """Tests if all networks of a container are dropped at once"""
+        entries = self._table.remove_container('c1')
+        self.assertEqual({'n1', 'n2'}, {entry.network_id for entry in entries})
+        self.assertEqual(['c2'], [entry.container_id for entry in self._table])
+        self.assertEqual([], self._table.remove_container('c1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
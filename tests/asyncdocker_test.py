@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from urllib.parse import parse_qs, urlsplit
+from docker_ndp_daemon.daemon.asyncdocker import AsyncDockerClient, DockerApiError, unix_socket_path
+
+
+class AsyncDockerClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._directory.name, 'docker.sock')
+        self._requests = []
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _events(self, response, **kwargs):
+        # Serves ``response`` to one request and returns the events read from it
+        async def handle(reader, writer):
+            self._requests.append((await reader.readline()).decode('ascii'))
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            writer.write(response)
+            await writer.drain()
+            writer.close()
+
+        async def read():
+            server = await asyncio.start_unix_server(handle, self._path)
+            async with server:
+                return [event async for event in
+                        AsyncDockerClient(self._path).events(**kwargs)]
+
+        return asyncio.run(read())
+
+    @staticmethod
+    def _chunked(*chunks):
+        body = b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in chunks)
+        return (b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                b'Transfer-Encoding: chunked\r\n\r\n' + body + b'0\r\n\r\n')
+
+    def test_events__ok_chunked(self):
+        """Tests if events are decoded whether they span chunks or share one"""
+        first = json.dumps({'Action': 'connect', 'timeNano': 1}).encode() + b'\n'
+        second = json.dumps({'Action': 'disconnect', 'timeNano': 2}).encode() + b'\n'
+        third = json.dumps({'Action': 'destroy', 'timeNano': 3}).encode() + b'\n'
+        response = self._chunked(first, second[:5], second[5:] + third)
+
+        events = self._events(response, since="1.000000002", filters={'type': ['network']})
+
+        self.assertEqual(['connect', 'disconnect', 'destroy'],
+                         [event['Action'] for event in events])
+        query = parse_qs(urlsplit(self._requests[0].split()[1]).query)
+        self.assertEqual(['1.000000002'], query['since'])
+        self.assertEqual({'type': ['network']}, json.loads(query['filters'][0]))
+
+    def test_events__fail_error_status(self):
+        response = (b'HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n\r\n'
+                    b'{"message": "invalid filter"}')
+        with self.assertRaises(DockerApiError) as raised:
+            self._events(response)
+        self.assertEqual(400, raised.exception.status)
+
+    def test_unix_socket_path__ok(self):
+        self.assertEqual('/var/run/docker.sock', unix_socket_path('unix:///var/run/docker.sock'))
+        self.assertEqual('/var/run/docker.sock', unix_socket_path('unix://var/run/docker.sock'))
+
+    def test_unix_socket_path__fail_tcp(self):
+        with self.assertRaises(ValueError):
+            unix_socket_path('tcp://127.0.0.1:2375')
+
+
+if __name__ == '__main__':
+    unittest.main()
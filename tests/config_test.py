@@ -0,0 +1,114 @@
+import configparser
+import tempfile
+import unittest
+import mock
+from docker_ndp_daemon import config
+
+
+class ConfigTest(unittest.TestCase):
+
+    def test_positive_int__ok(self):
+        with mock.patch.dict(config.conf['host'], {'startup_concurrency': '4'}):
+            self.assertEqual(4, config.positive_int('host', 'startup_concurrency', 8))
+
+    def test_positive_int__ok_default(self):
+        self.assertEqual(8, config.positive_int('host', 'no_such_option', 8))
+
+    def test_positive_int__fail_below_one(self):
+        for value in ('0', '-2', 'many'):
+            with self.subTest(value=value):
+                with mock.patch.dict(config.conf['host'], {'startup_concurrency': value}):
+                    with self.assertRaises(ValueError):
+                        config.positive_int('host', 'startup_concurrency', 8)
+
+    def test_mapping__ok(self):
+        with mock.patch.dict(config.conf['host'], {'interfaces': 'isolated=eth1, 8f3c=eth2,'}):
+            self.assertEqual({'isolated': 'eth1', '8f3c': 'eth2'},
+                             config.mapping('host', 'interfaces'))
+
+    def test_mapping__fail_no_interface(self):
+        with mock.patch.dict(config.conf['host'], {'interfaces': 'isolated'}):
+            with self.assertRaises(ValueError):
+                config.mapping('host', 'interfaces')
+
+    def test_prefixes__fail_not_a_prefix(self):
+        with mock.patch.dict(config.conf['host'], {'prefixes': 'eth1=skip'}):
+            with self.assertRaises(ValueError):
+                config.prefixes('host', 'prefixes')
+
+    def test_read_endpoints__ok_default(self):
+        """Tests if [host] and [events] describe the only endpoint without endpoint sections"""
+        endpoints = config.read_endpoints()
+        self.assertEqual(['default'], [endpoint.name for endpoint in endpoints])
+        self.assertIsNone(endpoints[0].socket_url)
+        self.assertEqual(config.host.gateway, endpoints[0].gateway)
+
+    def test_read_endpoints__ok_sections(self):
+        conf = configparser.ConfigParser()
+        conf.read_string("""
+            [host]
+            [endpoint:rootful]
+            socket_url = unix:///var/run/docker.sock
+            [endpoint:alice]
+            socket_url = unix:///run/user/1000/docker.sock
+            gateway = eth1
+            interfaces = web=eth0
+            networks = web, db
+        """)
+        with mock.patch.object(config, 'conf', conf), \
+                mock.patch.dict(config.snapshot, {'path': '/var/lib/dnd/snapshot.json'}):
+            rootful, alice = config.read_endpoints()
+
+        self.assertEqual('unix:///var/run/docker.sock', rootful.socket_url)
+        self.assertEqual(config.host.gateway, rootful.gateway)
+        self.assertEqual({}, rootful.interfaces)
+        self.assertEqual(config.events.networks, rootful.networks)
+        self.assertEqual('/var/lib/dnd/snapshot-rootful.json', rootful.snapshot)
+        self.assertEqual('eth1', alice.gateway)
+        self.assertEqual({'web': 'eth0'}, alice.interfaces)
+        self.assertEqual(['web', 'db'], alice.networks)
+
+    def test_endpoint_path__ok(self):
+        self.assertEqual('/var/lib/dnd/trace-alice.jsonl.gz',
+                         config.endpoint_path('/var/lib/dnd/trace.jsonl.gz', 'alice'))
+        self.assertEqual('', config.endpoint_path('', 'alice'))
+
+    def test_load__ok_overrides(self):
+        try:
+            config.load(overrides={('host', 'gateway'): 'eth9', ('events', 'engine'): 'asyncio'})
+            self.assertEqual('eth9', config.host.gateway)
+            self.assertEqual('eth9', config.endpoints[0].gateway)
+            self.assertEqual('asyncio', config.events.engine)
+        finally:
+            config.load()
+
+    def test_load__fail_missing_section(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ini') as file:
+            file.write("[host]\ngateway = eth0\n")
+            file.flush()
+            try:
+                with self.assertRaises(ValueError):
+                    config.load([file.name])
+            finally:
+                config.load()
+
+    def test_reload__fail_keeps_config(self):
+        gateway = config.host.gateway
+        with self.assertRaises(ValueError):
+            config.reload(overrides={('host', 'gateway'): 'eth9', ('events', 'engine'): 'fibers'})
+        self.assertEqual(gateway, config.host.gateway)
+
+    def test_load__ok_profiling_disabled(self):
+        self.assertFalse(config.profiling.enabled)
+        self.assertEqual(30, config.profiling.top)
+
+    def test_load__fail_negative_rate_limit(self):
+        try:
+            with self.assertRaises(ValueError):
+                config.load(overrides={('logger', 'rate_limit'): '-1'})
+        finally:
+            config.load()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,5 @@
+import asyncio
+import threading
 import unittest
 import mock
 import logging
@@ -20,19 +22,14 @@ def side_effect_error_during_terminate():
     return raise_error()
 
 
-def side_effect_socket_read_timeout():
-    def raise_error():
-        raise ReadTimeoutError(url=None, pool=None, message="Read timeout during listening for events.")
-    return raise_error()
-
-
 class DockerEventDaemonTest(unittest.TestCase):
 
     def setUp(self):
         """Sets _daemon with mocked :class:`DockerClient``
         """
         with mock.patch.object(DockerClient, '__init__', return_value=None):
-            self._daemon = DockerEventDaemon("socket")
+            self._daemon = DockerEventDaemon(socket_url="socket")
+            self._daemon._client = DockerClient()
 
     @mock.patch.object(DockerClient, '__init__')
     def test_init__ok(self, mock_docker_client):
@@ -41,13 +38,14 @@ class DockerEventDaemonTest(unittest.TestCase):
         :param mock_docker_client: DockerClient is mocked to avoid testing with real socket.
         """
         mock_docker_client.return_value = None
-        daemon = DockerEventDaemon("socket")
+        daemon = DockerEventDaemon(socket_url="socket")
         self.assertIsNotNone(daemon)
+        self.assertIsNotNone(daemon.init_docker_client())
         mock_docker_client.assert_called_with(base_url='socket')
 
     def test_init__fail__file_not_found(self,):
         try:
-            DockerEventDaemon("socket")
+            DockerEventDaemon(socket_url="socket").__enter__()
         except DockerException as ex:
             logger.info("{}: {}".format(ex.__class__, ex))
             return
@@ -57,7 +55,7 @@ class DockerEventDaemonTest(unittest.TestCase):
     @mock.patch.object(DockerEventDaemon, 'init_docker_client', mock.Mock(return_value=None))
     def test_init__fail__docker_client_is_none(self):
         try:
-            DockerEventDaemon("socket")
+            DockerEventDaemon(socket_url="socket").__enter__()
         except Exception as ex:
             logger.info("{}: {}".format(ex.__class__, ex))
             return
@@ -65,12 +63,20 @@ class DockerEventDaemonTest(unittest.TestCase):
         self.fail("ValueError expected.")
 
     @mock.patch.object(DockerClient, 'events')
-    @mock.patch.object(DockerEventDaemon, '_handle_network_connect_event')
+    @mock.patch.object(DockerEventDaemon, 'handle_network_connect_event', create=True)
     def test_listen_network_connect_events__ok(self, mock_event_handler, mock_events):
+        actor = {"ID": "29985997bf53d5933fea12ac6c40ccd6240013b88f940270bfd1d16a0f5fb5bd",
+                 "Attributes": {"name": "bridge", "type": "bridge"}}
         mock_events.return_value = [
-            '{"Type":"network","Action":"connect","Actor":{"ID":"29985997bf53d5933fea12ac6c40ccd6240013b88f940270bfd1d16a0f5fb5bd","Attributes":{"container":"534280333f1f64f7cfeb56dde3a76788b2961abc807b3833705fa2d4fcee2f40","name":"bridge","type":"bridge"}},"scope":"local","time":1539202002,"timeNano":1539202002835354153}',
-            '{"Type":"network","Action":"disconnect","Actor":{"ID":"29985997bf53d5933fea12ac6c40ccd6240013b88f940270bfd1d16a0f5fb5bd","Attributes":{"container":"3fc260a2e5a99df767b6ebfe0506d598b7502d1be38f82dc5513dcd25bc62c12","name":"bridge","type":"bridge"}},"scope":"local","time":1539202263,"timeNano":1539202263993893537}',
-            '{"Type":"network","Action":"connect","Actor":{"ID":"29985997bf53d5933fea12ac6c40ccd6240013b88f940270bfd1d16a0f5fb5bd","Attributes":{"container":"534280333f1f64f7cfeb56dde3a76788b2961abc807b3833705fa2d4fcee2f40","name":"bridge","type":"bridge"}},"scope":"local","time":1539202002,"timeNano":1539202002835354153}'
+            {"Type": "network", "Action": "connect", "scope": "local",
+             "Actor": dict(actor, Attributes=dict(actor["Attributes"], container="5342803")),
+             "time": 1539202002, "timeNano": 1539202002835354153},
+            {"Type": "network", "Action": "disconnect", "scope": "local",
+             "Actor": dict(actor, Attributes=dict(actor["Attributes"], container="3fc260a")),
+             "time": 1539202263, "timeNano": 1539202263993893537},
+            {"Type": "network", "Action": "connect", "scope": "local",
+             "Actor": dict(actor, Attributes=dict(actor["Attributes"], container="5342803")),
+             "time": 1539202002, "timeNano": 1539202002835354153},
         ]
         mock_event_handler.return_value = 42
         self._daemon.listen_network_connect_events()
@@ -89,16 +95,16 @@ class DockerEventDaemonTest(unittest.TestCase):
             logger.info("{}: {}".format(ex.__class__, ex))
             self.assertTrue(mock_events.called)
 
-    @mock.patch.object(DockerClient, 'events', side_effect=side_effect_socket_read_timeout)
-    def test_listen_network_connect_events__fail_timeout(self, mock_events):
+    @mock.patch.object(DockerClient, 'events')
+    def test_listen_network_connect_events__ok_timeout(self, mock_events):
         """Tests the reaction when docker client throws a timeout excpetion."""
-        try:
-            self._daemon.listen_network_connect_events()
-            self.fail("DaemonTimeoutException expected.")
-        except Exception as ex:
-            logger.info("{}: {}".format(ex.__class__, ex))
-            self.assertIsInstance(ex, (TimeoutError, ReadTimeoutError))
-            self.assertTrue(mock_events.called)
+        mock_events.side_effect = [
+            ReadTimeoutError(url=None, pool=None, message="Read timeout"),
+            [],
+        ]
+        self._daemon.listen_network_connect_events()
+        self.assertEqual(2, mock_events.call_count)
+        self.assertEqual(1, self._daemon.reconnects)
 
     # @mock.patch('docker.models.containers.Container')
     # @mock.patch.object(Popen, "communicate",
@@ -120,6 +126,7 @@ class DockerEventDaemonTest(unittest.TestCase):
     #     self.assertIsNone(stderr)
     #     self.assertTrue(mock_communicate.called)
 
+    @unittest.skip("DockerEventDaemon doesn't handle signals, SIGTERM and SIGINT end init_app")
     @mock.patch.object(DockerClient, "events")
     @mock.patch.object(DockerClient, "close")
     def test_handle_termination__ok(self, mock_close, mock_events):
@@ -134,5 +141,90 @@ class DockerEventDaemonTest(unittest.TestCase):
                 self.assertTrue(self._daemon._terminate)
 
 
+class DockerEventDaemonListenTest(unittest.TestCase):
+
+    def setUp(self):
+        self._daemon = DockerEventDaemon(socket_url="socket")
+        self._daemon._client = mock.Mock()
+        self._daemon.handle_network_connect_event = mock.Mock()
+
+    @staticmethod
+    def _event(container, time_nano):
+        return {"Type": "network", "Action": "connect", "timeNano": time_nano,
+                "Actor": {"ID": "net", "Attributes": {"container": container, "name": "bridge"}}}
+
+    def test_listen_network_connect_events__ok_resume_after_timeout(self):
+        """Tests if a read timeout resumes the stream from the last event without repeating it."""
+        first = self._event("c1", 1539202002835354153)
+        second = self._event("c2", 1539202002835354153)
+        third = self._event("c3", 1539202263993893537)
+
+        def stream_with_timeout():
+            yield first
+            raise ReadTimeoutError(url=None, pool=None, message="Read timeout")
+
+        self._daemon._client.events.side_effect = [stream_with_timeout(),
+                                                   iter([first, second, third])]
+        self._daemon.listen_network_connect_events()
+
+        self.assertEqual(1, self._daemon.reconnects)
+        self.assertEqual("1539202002.835354153", self._daemon._client.events.call_args[1]['since'])
+        handled = [call[0][0] for call in self._daemon.handle_network_connect_event.call_args_list]
+        self.assertEqual([first, second, third], handled)
+
+    def test_event_filters__ok(self):
+        """Tests if the docker event filters are derived from the handler methods."""
+        self._daemon.handle_container_destroy_event = mock.Mock()
+        self.assertEqual({'type': ['container', 'network'], 'event': ['connect', 'destroy']},
+                         self._daemon.event_filters())
+
+    def test_listen_network_connect_events__ok_watched_networks(self):
+        """Tests if only events of watched networks are handled, but all container events."""
+        self._daemon.handle_container_destroy_event = mock.Mock()
+        self._daemon.watched_networks = {"bridge"}
+        watched = self._event("c1", 1)
+        other = self._event("c2", 2)
+        other["Actor"]["Attributes"]["name"] = "other"
+        destroy = {"Type": "container", "Action": "destroy", "timeNano": 3,
+                   "Actor": {"ID": "c2", "Attributes": {"name": "c2"}}}
+        self._daemon._client.events.return_value = iter([watched, other, destroy])
+
+        self._daemon.listen_network_connect_events()
+
+        self._daemon.handle_network_connect_event.assert_called_once_with(watched)
+        self._daemon.handle_container_destroy_event.assert_called_once_with(destroy)
+        self.assertNotIn('network', self._daemon._client.events.call_args[1]['filters'])
+
+    def test_listen_network_connect_events_async__ok_ordered_per_container(self):
+        """Tests if handlers run concurrently across containers but in order per container."""
+        events = [self._event("c1", 1), self._event("c2", 2), self._event("c1", 3)]
+        events[2]["Action"] = "disconnect"
+        handled = []
+        c2_started = threading.Event()
+
+        def connect(event):
+            if event["Actor"]["Attributes"]["container"] == "c1":
+                # The later c2 event must not wait for c1
+                self.assertTrue(c2_started.wait(5))
+            else:
+                c2_started.set()
+            handled.append(event)
+
+        self._daemon.handle_network_connect_event = connect
+        self._daemon.handle_network_disconnect_event = handled.append
+
+        async def stream(since=None, filters=None):
+            for event in events:
+                yield event
+
+        self._daemon.socket_url = "unix:///var/run/docker.sock"
+        with mock.patch('docker_ndp_daemon.daemon.asyncdocker.AsyncDockerClient') as mock_client:
+            mock_client.return_value.events = stream
+            asyncio.run(self._daemon.listen_network_connect_events_async())
+
+        self.assertEqual([events[1], events[0], events[2]], handled)
+        self.assertEqual(3, self._daemon._handled_since)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+import sys
+import unittest
+import mock
+from docker_ndp_daemon.daemon import metrics
+from docker_ndp_daemon.daemon.events import DockerEventDaemon
+from docker_ndp_daemon.daemon import handlers
+from docker_ndp_daemon.daemon.handlers import HandlerRegistry
+
+
+def event(event_type, action):
+    return {'Type': event_type, 'Action': action, 'Actor': {'ID': 'a' * 64}}
+
+
+class HandlerRegistryTest(unittest.TestCase):
+
+    def test_get__ok_runs_handlers_in_order(self):
+        """Tests if all handlers of an event run in the order they were registered"""
+        calls = []
+        registry = HandlerRegistry()
+        registry.register('network', 'connect', lambda event: calls.append('first'))
+        registry.register('network', 'connect', lambda event: calls.append('second'))
+        registry.register('container', 'destroy', lambda event: calls.append('destroy'))
+
+        registry.get('network', 'connect')(event('network', 'connect'))
+
+        self.assertEqual(['first', 'second'], calls)
+        self.assertIsNone(registry.get('network', 'destroy'))
+        self.assertEqual({'type': ['container', 'network'], 'event': ['connect', 'destroy']},
+                         registry.filters())
+
+    def test_get__fail_handler_exception(self):
+        """Tests if a failing handler is counted and doesn't stop the next one"""
+        calls = []
+        registry = HandlerRegistry()
+        registry.register('network', 'connect', mock.Mock(side_effect=KeyError('Actor')),
+                          name='broken')
+        registry.register('network', 'connect', calls.append, name='working')
+        errors = metrics.HANDLER_ERRORS.value(handler='broken')
+        timed = metrics.HANDLER_SECONDS.count(handler='working')
+
+        with self.assertLogs('docker_ndp_daemon.daemon.handlers', 'ERROR'):
+            registry.get('network', 'connect')(event('network', 'connect'))
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(errors + 1, metrics.HANDLER_ERRORS.value(handler='broken'))
+        self.assertEqual(timed + 1, metrics.HANDLER_SECONDS.count(handler='working'))
+
+    @mock.patch('docker_ndp_daemon.daemon.handlers._entry_points')
+    def test_load_entry_points__ok(self, mock_entry_points):
+        """Tests if entry points register their handlers and broken ones are skipped"""
+        def register(daemon, registry):
+            registry.register('container', 'destroy', daemon.destroyed)
+
+        working, broken = mock.Mock(), mock.Mock()
+        working.name, broken.name = 'working', 'broken'
+        working.load.return_value = register
+        broken.load.side_effect = ImportError("no module named plugin")
+        mock_entry_points.return_value = [broken, working]
+        daemon = DockerEventDaemon()
+        daemon.destroyed = mock.Mock()
+
+        with self.assertLogs('docker_ndp_daemon.daemon.handlers', 'ERROR'):
+            registry = daemon.handler_registry()
+
+        self.assertIn(('container', 'destroy'), registry)
+        daemon._dispatch(event('container', 'destroy'))
+        daemon.destroyed.assert_called_once_with(event('container', 'destroy'))
+        self.assertIs(registry, daemon.handler_registry())
+
+    @mock.patch('docker_ndp_daemon.daemon.handlers._entry_points')
+    def test_handler_registry__ok_without_plugins(self, mock_entry_points):
+        """Tests if the entry points are left alone when plugins are disabled"""
+        daemon = DockerEventDaemon(handler_plugins=False)
+        daemon.handle_network_connect_event = mock.Mock()
+
+        self.assertEqual(1, len(daemon.handler_registry()))
+        mock_entry_points.assert_not_called()
+
+    def test_entry_points__ok_pkg_resources(self):
+        """Tests if pkg_resources finds the entry points without importlib.metadata"""
+        pkg_resources = mock.Mock()
+        pkg_resources.iter_entry_points.return_value = iter(['plugin'])
+        with mock.patch.dict(sys.modules, {'importlib.metadata': None,
+                                           'importlib_metadata': None,
+                                           'pkg_resources': pkg_resources}):
+            self.assertEqual(['plugin'], handlers._entry_points())
+        pkg_resources.iter_entry_points.assert_called_once_with(handlers.ENTRY_POINT_GROUP)
+
+    def test_entry_points__ok_no_metadata(self):
+        """Tests if plugins are skipped when no way to find entry points is installed"""
+        with mock.patch.dict(sys.modules, {'importlib.metadata': None,
+                                           'importlib_metadata': None,
+                                           'pkg_resources': None}):
+            self.assertEqual([], handlers._entry_points())
+
+
+if __name__ == '__main__':
+    unittest.main()
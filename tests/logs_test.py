@@ -0,0 +1,93 @@
+import io
+import json
+import logging
+import unittest
+import mock
+from docker_ndp_daemon import logs
+from docker_ndp_daemon.config import Config
+from docker_ndp_daemon.daemon import metrics
+
+
+def record(msg, *args, level=logging.INFO, **fields):
+    record = logging.LogRecord('dnd', level, __file__, 1, msg, args, None)
+    record.__dict__.update(fields)
+    return record
+
+
+class LogsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._root_handlers = list(logging.root.handlers)
+        self._root_level = logging.root.level
+
+    def tearDown(self):
+        for handler in logs._installed:
+            logging.root.removeHandler(handler)
+            handler.close()
+        logs._installed.clear()
+        logging.root.handlers[:] = self._root_handlers
+        logging.root.setLevel(self._root_level)
+
+    def test_json_formatter__ok_fields(self):
+        """Tests if the fields passed in extra become JSON fields"""
+        line = logs.JsonFormatter().format(
+            record("Set IPv6 ndp proxy for %s", "web", container_id='c' * 64, network='web',
+                   address='2001:db8::1', duration=0.25))
+        document = json.loads(line)
+        self.assertEqual("Set IPv6 ndp proxy for web", document['message'])
+        self.assertEqual('INFO', document['level'])
+        self.assertEqual(('c' * 64, 'web', '2001:db8::1', 0.25),
+                         (document['container_id'], document['network'], document['address'],
+                          document['duration']))
+        self.assertNotIn('interface', document)
+
+    @mock.patch('time.monotonic')
+    def test_rate_limit_filter__ok(self, mock_monotonic):
+        """Tests if repeated lines are suppressed per template and counted on the next one"""
+        log_filter = logs.RateLimitFilter(limit=2, interval=60)
+        dropped = metrics.LOG_RECORDS_DROPPED.value(reason='rate_limited')
+        mock_monotonic.return_value = 100.0
+        passed = [log_filter.filter(record("Ignoring container %r", name))
+                  for name in ('a', 'b', 'c', 'd')]
+        self.assertEqual([True, True, False, False], passed)
+        self.assertTrue(log_filter.filter(record("Something else")))
+        self.assertTrue(log_filter.filter(record("Ignoring container %r", 'e',
+                                                 level=logging.WARNING)))
+        self.assertEqual(dropped + 2, metrics.LOG_RECORDS_DROPPED.value(reason='rate_limited'))
+
+        mock_monotonic.return_value = 160.0
+        later = record("Ignoring container %r", 'f')
+        self.assertTrue(log_filter.filter(later))
+        self.assertEqual(2, later.suppressed)
+        self.assertIn("(2 similar lines suppressed)",
+                      logs.TextFormatter('%(message)s').format(later))
+
+    def test_setup_logging__ok_background_json(self):
+        """Tests if records are written as JSON by the listener thread"""
+        stream = io.StringIO()
+        handler = logs.setup_logging(
+            Config(format='%(message)s', level=logging.INFO, background=True, json=True,
+                   rate_limit=0, rate_interval=60), stream=stream)
+        self.assertIsInstance(handler, logs.BackgroundHandler)
+
+        logging.getLogger('dnd.test').info("Removed %s", "2001:db8::1",
+                                           extra={'address': '2001:db8::1'})
+        handler.close()
+
+        document = json.loads(stream.getvalue())
+        self.assertEqual("Removed 2001:db8::1", document['message'])
+        self.assertEqual('2001:db8::1', document['address'])
+
+    def test_setup_logging__ok_replaces_handler(self):
+        """Tests if setting up logging again replaces the handler of the last call"""
+        settings = Config(format='%(message)s', level=logging.INFO, background=False,
+                          json=False, rate_limit=1, rate_interval=60)
+        first = logs.setup_logging(settings, stream=io.StringIO())
+        second = logs.setup_logging(settings, stream=io.StringIO())
+        self.assertNotIn(first, logging.root.handlers)
+        self.assertIn(second, logging.root.handlers)
+        self.assertIsInstance(second.filters[0], logs.RateLimitFilter)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,6 +33,85 @@ class MainTest(unittest.TestCase):
         self.assertTrue(mock_docker_ndp_daemon.called)
         self.assertTrue(mock_sys_exit.called)
 
+    def test_config_overrides__ok(self):
+        args = main.parse_args([
+            '--gateway', 'eth9', '--engine', 'asyncio',
+            '--set', 'endpoint:alice.socket_url=unix:///run/user/1000/docker.sock',
+        ])
+        self.assertEqual({('host', 'gateway'): 'eth9', ('events', 'engine'): 'asyncio',
+                          ('endpoint:alice', 'socket_url'): 'unix:///run/user/1000/docker.sock'},
+                         main.config_overrides(args))
+
+    @mock.patch('sys.stderr')
+    def test_parse_args__fail_bad_override(self, mock_stderr):
+        with self.assertRaises(SystemExit):
+            main.parse_args(['--set', 'gateway'])
+
+    def test_process_uptime__ok(self):
+        uptime = main.process_uptime()
+        if uptime is not None:
+            self.assertGreater(uptime, 0)
+
+    @mock.patch.object(main, 'setup_logging')
+    def test_reload_config__ok_reconfigures_daemons(self, mock_setup_logging):
+        """Tests if a reload moves the running daemon and the next one to the new gateways"""
+        endpoint = config.Config(name='default', gateway='eth9', interfaces={'web': 'eth2'},
+                                 prefixes={}, networks=[], socket_url=None)
+        served = mock.Mock(options={'socket_url': None, 'watched_networks': [],
+                                    'ethernet_interface': 'eth0'})
+        with mock.patch.dict(main._served, {'default': served}, clear=True), \
+                mock.patch.object(config, 'reload'), \
+                mock.patch.object(config, 'endpoints', [endpoint], create=True):
+            main.reload_config(config.DEFAULT_PATHS, {})
+
+        served.daemon.reconfigure.assert_called_once_with(
+            ethernet_interface='eth9', interfaces={'web': 'eth2'}, prefixes={})
+        self.assertEqual('eth9', served.options['ethernet_interface'])
+        self.assertTrue(mock_setup_logging.called)
+
+    @mock.patch.object(main, 'setup_logging')
+    def test_reload_config__fail_invalid(self, mock_setup_logging):
+        """Tests if an invalid config leaves the daemons alone"""
+        served = mock.Mock()
+        with mock.patch.dict(main._served, {'default': served}, clear=True), \
+                mock.patch.object(config, 'reload', side_effect=ValueError("bad")):
+            main.reload_config(config.DEFAULT_PATHS, {})
+        self.assertFalse(served.daemon.reconfigure.called)
+        self.assertFalse(mock_setup_logging.called)
+
+    def test_close_endpoints__ok_finishes_traces(self):
+        """Tests if leaving the app closes the traces of the served endpoints"""
+        capture = mock.Mock()
+        with mock.patch.object(main, 'daemon_options', side_effect=[{'capture': capture},
+                                                                    {'capture': None}]):
+            served = {'default': main.ServedEndpoint(mock.Mock(), backend=None),
+                      'alice': main.ServedEndpoint(mock.Mock(), backend=None)}
+        with mock.patch.dict(main._served, served, clear=True):
+            main.close_endpoints()
+        capture.close.assert_called_once_with()
+
+    @mock.patch('signal.signal')
+    def test_install_profiling_handlers__ok_disabled(self, mock_signal):
+        """Tests if the profiling signals are left alone unless profiling is enabled"""
+        main.install_profiling_handlers(config.Config(enabled=False))
+        self.assertFalse(mock_signal.called)
+
+    def test_daemon_state__ok(self):
+        """Tests if the state lists the addresses and queue of every endpoint"""
+        served = mock.Mock()
+        served.daemon.addresses = [1, 2]
+        served.daemon.networks = [1]
+        served.daemon.queue.depth = 3
+        served.daemon.queue.retrying = 0
+        served.daemon.backend.name = 'dry-run'
+        with mock.patch.dict(main._served, {'default': served, 'alice': mock.Mock(daemon=None)},
+                             clear=True):
+            state = main.daemon_state()
+        self.assertIn("endpoint default: 2 addresses proxied, 1 networks cached, 3 keys queued, "
+                      "0 retrying", state)
+        self.assertIn("endpoint alice: starting", state)
+        self.assertIn("backend dry-run: 0 apply calls in flight", state)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+import math
+import unittest
+from urllib.request import urlopen
+from docker_ndp_daemon.daemon import metrics
+from docker_ndp_daemon.daemon.events import DockerEventDaemon
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._registry = metrics.Registry()
+
+    def test_render__ok_counter(self):
+        counter = self._registry.register(metrics.Counter('events', "Events.", ('type',)))
+        counter.inc(type='network')
+        counter.inc(2, type='network')
+        self.assertEqual('# HELP events Events.\n'
+                         '# TYPE events counter\n'
+                         'events_total{type="network"} 3\n',
+                         self._registry.render())
+
+    def test_render__ok_histogram(self):
+        histogram = self._registry.register(
+            metrics.Histogram('latency', "Latency.", buckets=(0.1, 1)))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value)
+        lines = self._registry.render().splitlines()
+        self.assertEqual(['latency_bucket{le="0.1"} 1', 'latency_bucket{le="1"} 3',
+                          'latency_bucket{le="+Inf"} 4', 'latency_count 4',
+                          'latency_sum 4.05'], lines[2:])
+
+    def test_quantile__ok(self):
+        histogram = metrics.Histogram('latency', "Latency.", buckets=(0.1, 1))
+        self.assertTrue(math.isnan(histogram.quantile(0.5)))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual(1, histogram.quantile(0.5))
+        self.assertEqual(math.inf, histogram.quantile(0.99))
+
+    def test_gauge__ok_function(self):
+        gauge = self._registry.register(metrics.Gauge('depth', "Depth."))
+        items = [1, 2]
+        gauge.set_function(lambda: len(items))
+        items.append(3)
+        self.assertIn('depth 3\n', self._registry.render())
+
+    def test_inc__fail_wrong_labels(self):
+        counter = metrics.Counter('events', "Events.", ('type',))
+        with self.assertRaises(ValueError):
+            counter.inc(action='connect')
+
+    def test_start_http_server__ok(self):
+        self._registry.register(metrics.Gauge('up', "Up.")).set(1)
+        server = metrics.start_http_server(0, registry=self._registry)
+        try:
+            with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                self.assertIn(b'\nup 1\n', response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_dispatch__ok_counts_events(self):
+        """Tests if received, handled and ignored events are counted"""
+        daemon = DockerEventDaemon(socket_url="socket")
+        daemon._since = 0
+        daemon.handle_network_connect_event = lambda event: None
+        handled = metrics.EVENTS_HANDLED.value(type='network', action='connect')
+        unhandled = metrics.EVENTS_IGNORED.value(reason='unhandled')
+        for action, time_nano in (('connect', 1), ('create', 2)):
+            daemon._dispatch({'Type': 'network', 'Action': action, 'timeNano': time_nano,
+                              'Actor': {'ID': 'n1', 'Attributes': {}}})
+        self.assertEqual(handled + 1,
+                         metrics.EVENTS_HANDLED.value(type='network', action='connect'))
+        self.assertEqual(unhandled + 1, metrics.EVENTS_IGNORED.value(reason='unhandled'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,17 @@
+import ipaddress
+import threading
+import time
 import unittest
 import mock
 from docker_ndp_daemon import config
 import logging
 from docker_ndp_daemon.daemon import DockerNdpDaemon
+from docker_ndp_daemon.daemon.addresses import AddressEntry
+from docker_ndp_daemon.daemon.networks import NetworkCache
+from docker_ndp_daemon.daemon.pipeline import ProxyQueue
+from docker_ndp_daemon.daemon.snapshot import SnapshotState
+from docker_ndp_daemon.daemon.watcher import ALL
+from docker_ndp_daemon.daemon.proxy import ProxyError
 import docker
 from docker import DockerClient
 from docker.models.resource import Model
@@ -129,6 +138,465 @@ class DockerNdpDaemonTest(unittest.TestCase):
         self.assertEqual(3, mock_add_container.call_count)
         self.assertTrue(mock_add_container.called)
 
+    def test_add_all_existing_containers_to_neigh_proxy__ok_reconcile(self):
+        """Tests if only missing entries are added and stale ones inside docker subnets removed"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.networks.return_value = [
+            {'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True,
+             'IPAM': {'Config': [{'Subnet': '172.17.0.0/16'}, {'Subnet': '2001:db8::/64'}]}},
+            {'Id': 'n2', 'Name': 'legacy', 'EnableIPv6': False,
+             'IPAM': {'Config': [{'Subnet': '172.18.0.0/16'}]}},
+        ]
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True, 'Containers': {
+                'c1': {'Name': 'web', 'IPv6Address': '2001:db8::2/64'},
+                'c2': {'Name': 'db', 'IPv6Address': '2001:db8::4/64'},
+                'c3': {'Name': 'v4only', 'IPv6Address': ''},
+            }}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._daemon.backend = mock.Mock()
+        self._daemon.backend.dump.return_value = {
+            ('2001:db8::1', 'ethernet'),  # stale
+            ('2001:db8::4', 'ethernet'),  # up to date
+            ('2001:db8::3', 'other-if'),  # other interface
+            ('2001:db9::1', 'ethernet'),  # outside docker's subnets
+        }
+        self._daemon.backend.apply.return_value = []
+
+        self._daemon._add_all_existing_containers_to_neigh_proxy()
+
+        self._daemon._client.api.inspect_network.assert_called_once_with('n1')
+        self.assertEqual([mock.call(add=[('2001:db8::2', 'ethernet')], delete=()),
+                          mock.call(add=(), delete=[('2001:db8::1', 'ethernet')])],
+                         self._daemon.backend.apply.call_args_list)
+        self.assertEqual(2, len(self._daemon.addresses))
+
+    def _inspect_scan_daemon(self, inspect_network):
+        # Prepares a startup scan over three IPv6 networks, answered by inspect_network
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.networks.return_value = [
+            {'Id': network_id, 'Name': network_id, 'EnableIPv6': True, 'IPAM': {'Config': []}}
+            for network_id in ('n1', 'n2', 'n3')
+        ]
+        self._daemon._client.api.inspect_network.side_effect = inspect_network
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._daemon.backend = mock.Mock()
+        self._daemon.backend.dump.return_value = set()
+        self._daemon.backend.apply.return_value = []
+
+    @staticmethod
+    def _network_attrs(network_id, ipv6_address):
+        return {'Id': network_id, 'Name': network_id, 'EnableIPv6': True, 'Containers': {
+            'c-' + network_id: {'Name': 'web', 'IPv6Address': ipv6_address + '/64'}}}
+
+    def test_add_all_existing_containers_to_neigh_proxy__ok_out_of_order(self):
+        """Tests if each network is added as soon as its inspection finishes, in any order"""
+        n3_done = threading.Event()
+
+        def inspect_network(network_id):
+            if network_id == 'n1':
+                n3_done.wait(5)
+            attrs = self._network_attrs(network_id, '2001:db8::' + network_id[1])
+            if network_id == 'n3':
+                n3_done.set()
+            return attrs
+
+        self._inspect_scan_daemon(inspect_network)
+        self._daemon.startup_concurrency = 3
+
+        self._daemon._add_all_existing_containers_to_neigh_proxy()
+
+        added = [call[1]['add'] for call in self._daemon.backend.apply.call_args_list]
+        self.assertEqual([('2001:db8::1', 'ethernet')], added[-2])
+        self.assertEqual(3, len(self._daemon.addresses))
+
+    def test_add_all_existing_containers_to_neigh_proxy__ok_network_vanished(self):
+        """Tests if a network removed between listing and inspecting it is skipped"""
+        def inspect_network(network_id):
+            if network_id == 'n2':
+                raise docker.errors.NotFound("network n2 not found")
+            return self._network_attrs(network_id, '2001:db8::' + network_id[1])
+
+        self._inspect_scan_daemon(inspect_network)
+
+        self._daemon._add_all_existing_containers_to_neigh_proxy()
+
+        self.assertEqual({('2001:db8::1', 'ethernet'), ('2001:db8::3', 'ethernet')},
+                         {entry.proxy_entry for entry in self._daemon.addresses})
+
+    def _unwatched_network_daemon(self):
+        # Watches only "web", next to the IPv6 network "other" with a proxied address
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.networks.return_value = [
+            {'Id': 'n1', 'Name': 'web', 'EnableIPv6': True,
+             'IPAM': {'Config': [{'Subnet': '2001:db8:1::/64'}]}},
+            {'Id': 'n2', 'Name': 'other', 'EnableIPv6': True,
+             'IPAM': {'Config': [{'Subnet': '2001:db8:2::/64'}]}},
+        ]
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'web', 'EnableIPv6': True, 'Containers': {
+                'c1': {'Name': 'app', 'IPv6Address': '2001:db8:1::2/64'}}}
+        self._daemon.watched_networks = {'web'}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._daemon.backend = mock.Mock()
+        self._daemon.backend.dump.return_value = {
+            ('2001:db8:1::9', 'ethernet'),  # stale
+            ('2001:db8:2::5', 'ethernet'),  # on the unwatched network
+        }
+        self._daemon.backend.apply.return_value = []
+
+    def test_add_all_existing_containers_to_neigh_proxy__ok_unwatched_network(self):
+        """Tests if the scan leaves the proxy entries of unwatched networks alone"""
+        self._unwatched_network_daemon()
+
+        self._daemon._add_all_existing_containers_to_neigh_proxy()
+
+        self._daemon._client.api.inspect_network.assert_called_once_with('n1')
+        self.assertEqual([mock.call(add=[('2001:db8:1::2', 'ethernet')], delete=()),
+                          mock.call(add=(), delete=[('2001:db8:1::9', 'ethernet')])],
+                         self._daemon.backend.apply.call_args_list)
+
+    def test_resume_from_snapshot__ok_unwatched_network(self):
+        """Tests if a warm start leaves the proxy entries of unwatched networks alone"""
+        self._unwatched_network_daemon()
+        previous = SnapshotState(1539202002835354153, [
+            AddressEntry('c1', 'n1', '2001:db8:1::2', 'ethernet'),
+        ], time.time())
+
+        self._daemon._resume_from_snapshot(previous)
+
+        deleted = {entry for call in self._daemon.backend.apply.call_args_list
+                   for entry in call[1]['delete']}
+        self.assertEqual({('2001:db8:1::9', 'ethernet')}, deleted)
+
+    @mock.patch('docker.DockerClient')
+    def test_enter__ok_cursor_before_scan(self, mock_client):
+        """Tests if the event cursor is taken before the startup scan, so no events are lost"""
+        cursor = []
+        self._daemon.backend = mock.Mock()
+        with mock.patch.object(DockerNdpDaemon, '_add_all_existing_containers_to_neigh_proxy',
+                               side_effect=lambda *args: cursor.append(self._daemon._since)):
+            self._daemon.__enter__()
+        self.assertIsNotNone(cursor[0])
+
+        mock_client.return_value.events.return_value = []
+        with mock.patch('time.time', return_value=0):
+            self._daemon.listen_network_connect_events()
+        self.assertEqual(cursor[0], self._daemon._since)
+
+    def _mock_backend(self, failures=()):
+        # Replaces the backend, together with the queue that applies the event changes
+        self._daemon.backend = mock.Mock()
+        self._daemon.backend.apply.return_value = list(failures)
+        self._daemon.queue = ProxyQueue(self._daemon.backend)
+
+    def test_handle_network_connect_event__ok_container_gone(self):
+        """Tests if a container removed before the queue resolved its connect is skipped quietly"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True, 'Containers': {}}
+        self._daemon._client.containers.get.side_effect = docker.errors.NotFound("gone")
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._mock_backend()
+
+        self._daemon.handle_network_connect_event({'Actor': {
+            'ID': 'n1', 'Attributes': {'container': 'c1', 'name': 'bridge'}}})
+        with mock.patch('docker_ndp_daemon.daemon.pipeline.logger') as mock_logger:
+            self._daemon.queue.flush()
+        self.assertFalse(mock_logger.exception.called)
+
+        self.assertFalse(self._daemon.backend.apply.called)
+        self.assertEqual(0, len(self._daemon.addresses))
+
+    def test_handle_network_connect_event__ok_network_gone(self):
+        """Tests if a connect to a network removed before the queue got to it is skipped"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.inspect_network.side_effect = docker.errors.NotFound("gone")
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._mock_backend()
+
+        self._daemon.handle_network_connect_event({'Actor': {
+            'ID': 'n1', 'Attributes': {'container': 'c1', 'name': 'bridge'}}})
+        with mock.patch('docker_ndp_daemon.daemon.pipeline.logger') as mock_logger:
+            self._daemon.queue.flush()
+        self.assertFalse(mock_logger.exception.called)
+
+        self.assertFalse(self._daemon.backend.apply.called)
+
+    def test_handle_network_connect_event__ok_from_network_inspect(self):
+        """Tests if the address is resolved by inspecting the network instead of the container"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True, 'Containers': {
+                'c1': {'Name': 'web', 'IPv6Address': '2001:db8::2/64'},
+                'c2': {'Name': 'db', 'IPv6Address': '2001:db8::3/64'},
+            }}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._mock_backend()
+
+        for container_id in ('c1', 'c2'):
+            self._daemon.handle_network_connect_event({'Actor': {
+                'ID': 'n1', 'Attributes': {'container': container_id, 'name': 'bridge'}}})
+        self.assertFalse(self._daemon._client.api.inspect_network.called)
+        self._daemon.queue.flush()
+
+        self.assertEqual(1, self._daemon._client.api.inspect_network.call_count)
+        self.assertFalse(self._daemon._client.containers.get.called)
+        self._daemon.backend.apply.assert_called_once_with(
+            add=[('2001:db8::2', 'ethernet'), ('2001:db8::3', 'ethernet')], delete=[])
+        self.assertEqual('web', self._daemon.addresses.get('c1', 'n1').container_name)
+
+    def test_handle_network_connect_event__ok_network_without_ipv6(self):
+        """Tests if containers on IPv4 only networks are ignored without inspecting them"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'legacy', 'EnableIPv6': False, 'Containers': {}}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._mock_backend()
+
+        self._daemon.handle_network_connect_event(
+            {'Actor': {'ID': 'n1', 'Attributes': {'container': 'c1', 'name': 'legacy'}}})
+        self._daemon.queue.flush()
+
+        self.assertFalse(self._daemon._client.containers.get.called)
+        self.assertFalse(self._daemon.backend.apply.called)
+
+    def test_handle_network_connect_event__ok_cancelled_by_disconnect(self):
+        """Tests if a disconnect before the next flush cancels the connect without a lookup"""
+        self._daemon._client = mock.Mock()
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._mock_backend()
+        event = {'Actor': {'ID': 'n1', 'Attributes': {'container': 'c1', 'name': 'bridge'}}}
+
+        self._daemon.handle_network_connect_event(event)
+        self._daemon.handle_network_disconnect_event(event)
+        self._daemon.queue.flush()
+
+        self.assertFalse(self._daemon._client.api.inspect_network.called)
+        self.assertFalse(self._daemon.backend.apply.called)
+
+    def test_handle_network_disconnect_event__ok_forgets_address(self):
+        """Tests if a disconnect removes the proxy entry and the address table entry"""
+        self._mock_backend()
+        self._daemon.networks = mock.Mock()
+        self._daemon.addresses.add(AddressEntry('c1', 'n1', '2001:db8::2', 'ethernet'))
+        event = {'Actor': {'ID': 'n1', 'Attributes': {'container': 'c1', 'name': 'bridge'}}}
+        self._daemon.handle_network_disconnect_event(event)
+        self._daemon.queue.flush()
+        self._daemon.backend.apply.assert_called_once_with(
+            add=[], delete=[('2001:db8::2', 'ethernet')])
+        self.assertEqual(0, len(self._daemon.addresses))
+
+    def test_handle_network_disconnect_event__ok_backend_failure(self):
+        """Tests if a failing proxy change is logged instead of ending the event loop"""
+        self._mock_backend(failures=[
+            ProxyError('delete', '2001:db8::2', 'ethernet', OSError(1, "Operation not permitted"))])
+        self._daemon.networks = mock.Mock()
+        self._daemon.addresses.add(AddressEntry('c1', 'n1', '2001:db8::2', 'ethernet'))
+        event = {'Actor': {'ID': 'n1', 'Attributes': {'container': 'c1', 'name': 'bridge'}}}
+        self._daemon.handle_network_disconnect_event(event)
+        with self.assertLogs('docker_ndp_daemon.daemon.pipeline', 'ERROR'):
+            self._daemon.queue.flush()
+        self.assertFalse(self._daemon.backend.delete.called)
+
+    def test_handle_container_destroy_event__ok(self):
+        """Tests if leftover addresses of a destroyed container are removed in one batch"""
+        self._mock_backend()
+        self._daemon.addresses.add(AddressEntry('c1', 'n1', '2001:db8::2', 'ethernet'))
+        self._daemon.addresses.add(AddressEntry('c1', 'n2', '2001:db8:1::2', 'ethernet'))
+        self._daemon.networks = NetworkCache(mock.Mock())
+        self._daemon.networks._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True,
+            'Containers': {'c1': {'Name': 'web', 'IPv6Address': '2001:db8::2/64'}}}
+        self._daemon.networks.refresh('n1')
+
+        self._daemon.handle_container_destroy_event({'Actor': {'ID': 'c1'}})
+        self._daemon.queue.flush()
+
+        self.assertEqual({('2001:db8::2', 'ethernet'), ('2001:db8:1::2', 'ethernet')},
+                         set(self._daemon.backend.apply.call_args[1]['delete']))
+        self.assertEqual(0, len(self._daemon.addresses))
+        self.assertNotIn('c1', self._daemon.networks.get('n1').endpoints)
+
+    def test_restore_changes__ok(self):
+        """Tests if only lost entries the daemon still wants are restored"""
+        self._daemon.addresses.add(AddressEntry('c1', 'n1', '2001:db8::2', 'ethernet'))
+        self._daemon.addresses.add(AddressEntry('c2', 'n1', '2001:db8::3', 'ethernet'))
+        self._daemon.addresses.add(AddressEntry('c3', 'n2', '2001:db8:1::2', 'other'))
+
+        single = self._daemon._restore_changes([('2001:db8::2', 'ethernet'),
+                                                ('2001:db8::9', 'ethernet')])
+        everything = self._daemon._restore_changes([(ALL, 'ethernet')])
+
+        self.assertEqual([('add', '2001:db8::2')],
+                         [(change.action, change.ipv6_address) for change in single])
+        self.assertEqual({'2001:db8::2', '2001:db8::3'},
+                         {change.ipv6_address for change in everything})
+
+    def test_resume_from_snapshot__ok(self):
+        """Tests if a warm start checks the snapshot against docker and resumes from its cursor"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.networks.return_value = [
+            {'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True,
+             'IPAM': {'Config': [{'Subnet': '2001:db8::/64'}]}},
+        ]
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True, 'Containers': {
+                'c1': {'Name': 'web', 'IPv6Address': '2001:db8::2/64'},
+                'c4': {'Name': 'late', 'IPv6Address': '2001:db8::5/64'},  # connected meanwhile
+            }}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._mock_backend()
+        self._daemon.backend.dump.return_value = {
+            ('2001:db8::2', 'ethernet'),  # up to date
+            ('2001:db8:9::2', 'ethernet'),  # on a network destroyed meanwhile
+            ('2001:db8::7', 'ethernet'),  # stale, inside docker's subnets
+        }
+        previous = SnapshotState(1539202002835354153, [
+            AddressEntry('c1', 'n1', '2001:db8::2', 'ethernet'),
+            AddressEntry('c2', 'n1', '2001:db8::3', 'ethernet'),  # disconnected meanwhile
+            AddressEntry('c3', 'n9', '2001:db8:9::2', 'ethernet'),
+        ], time.time())
+
+        self._daemon._resume_from_snapshot(previous)
+
+        self.assertEqual([mock.call(add=[('2001:db8::5', 'ethernet')], delete=()),
+                          mock.call(add=(), delete=[('2001:db8:9::2', 'ethernet'),
+                                                    ('2001:db8::7', 'ethernet')])],
+                         self._daemon.backend.apply.call_args_list)
+        self.assertEqual({'c1', 'c4'}, {entry.container_id for entry in self._daemon.addresses})
+        self.assertEqual("1539202002.835354153", self._daemon._since_param())
+
+    def test_handle_network_connect_event__ok_mapped_interface(self):
+        """Tests if addresses of a network with its own gateway are proxied on that interface"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n2', 'Name': 'isolated', 'EnableIPv6': True, 'Containers': {
+                'c1': {'Name': 'web', 'IPv6Address': '2001:db8:2::2/64'}}}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._daemon.network_interfaces = {'isolated': 'uplink2'}
+        self._mock_backend()
+
+        self._daemon.handle_network_connect_event({'Actor': {
+            'ID': 'n2', 'Attributes': {'container': 'c1', 'name': 'isolated'}}})
+        self._daemon.queue.flush()
+
+        self._daemon.backend.apply.assert_called_once_with(
+            add=[('2001:db8:2::2', 'uplink2')], delete=[])
+
+    def test_resume_from_snapshot__ok_moved_network(self):
+        """Tests if entries of a network that got another gateway since the snapshot are moved"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.networks.return_value = [
+            {'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True,
+             'IPAM': {'Config': [{'Subnet': '2001:db8::/64'}]}},
+        ]
+        self._daemon.network_interfaces = {'n1': 'uplink2'}
+        self._daemon.gateway_interfaces = ['ethernet', 'uplink2']
+        self._mock_backend()
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True, 'Containers': {
+                'c1': {'Name': 'web', 'IPv6Address': '2001:db8::2/64'}}}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._daemon.backend.dump.return_value = {('2001:db8::2', 'ethernet')}
+        previous = SnapshotState(1539202002835354153, [
+            AddressEntry('c1', 'n1', '2001:db8::2', 'ethernet', network_name='bridge'),
+        ], time.time())
+
+        self._daemon._resume_from_snapshot(previous)
+
+        self.assertEqual([mock.call(add=[('2001:db8::2', 'uplink2')], delete=()),
+                          mock.call(add=(), delete=[('2001:db8::2', 'ethernet')])],
+                         self._daemon.backend.apply.call_args_list)
+        self.assertEqual('uplink2', self._daemon.addresses.get('c1', 'n1').interface)
+
+    def test_add_all_existing_containers_to_neigh_proxy__ok_skipped_prefix(self):
+        """Tests if addresses routed to the host already aren't proxied and lose their entries"""
+        daemon = DockerNdpDaemon(socket_url="socket", ethernet_interface="ethernet",
+                                 prefixes={'2001:db8::/56': 'skip', '2001:db8:0:1::/64': 'uplink2'})
+        daemon._client = mock.Mock()
+        daemon._client.api.networks.return_value = [
+            {'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True,
+             'IPAM': {'Config': [{'Subnet': '2001:db8::/64'}]}},
+            {'Id': 'n2', 'Name': 'uplink', 'EnableIPv6': True,
+             'IPAM': {'Config': [{'Subnet': '2001:db8:0:1::/64'}]}},
+        ]
+        daemon._client.api.inspect_network.side_effect = lambda network_id: {
+            'n1': {'Id': 'n1', 'Name': 'bridge', 'EnableIPv6': True, 'Containers': {
+                'c1': {'Name': 'web', 'IPv6Address': '2001:db8::2/64'}}},
+            'n2': {'Id': 'n2', 'Name': 'uplink', 'EnableIPv6': True, 'Containers': {
+                'c2': {'Name': 'db', 'IPv6Address': '2001:db8:0:1::2/64'}}},
+        }[network_id]
+        daemon.networks = NetworkCache(daemon._client)
+        daemon.backend = mock.Mock()
+        daemon.backend.dump.return_value = {('2001:db8::2', 'ethernet')}
+        daemon.backend.apply.return_value = []
+
+        daemon._add_all_existing_containers_to_neigh_proxy()
+
+        self.assertIn(mock.call(add=[('2001:db8:0:1::2', 'uplink2')], delete=()),
+                      daemon.backend.apply.call_args_list)
+        self.assertEqual(mock.call(add=(), delete=[('2001:db8::2', 'ethernet')]),
+                         daemon.backend.apply.call_args)
+        self.assertEqual(['c2'], [entry.container_id for entry in daemon.addresses])
+        self.assertEqual(['ethernet', 'uplink2'], daemon.gateway_interfaces)
+
+    def test_handle_network_create_event__ok_indexes_subnets(self):
+        """Tests if created networks route their subnets and destroyed ones stop to"""
+        self._daemon._client = mock.Mock()
+        self._daemon._client.api.inspect_network.return_value = {
+            'Id': 'n2', 'Name': 'isolated', 'EnableIPv6': True,
+            'IPAM': {'Config': [{'Subnet': '2001:db8:2::/64'}]}, 'Containers': {}}
+        self._daemon.networks = NetworkCache(self._daemon._client)
+        self._daemon.network_interfaces = {'isolated': 'uplink2'}
+        self._mock_backend()
+        event = {'Actor': {'ID': 'n2', 'Attributes': {'name': 'isolated'}}}
+
+        self._daemon.handle_network_create_event(event)
+        self._daemon.queue.flush()
+        self.assertEqual('uplink2', self._daemon.prefixes.lookup('2001:db8:2::9'))
+
+        self._daemon.handle_network_destroy_event(event)
+        self._daemon.queue.flush()
+        self.assertIsNone(self._daemon.prefixes.lookup('2001:db8:2::9'))
+        self.assertFalse(self._daemon.backend.apply.called)
+
+    def test_save_snapshot__ok_waits_for_queued_work(self):
+        """Tests if no snapshot is saved while events are queued that it wouldn't reflect"""
+        self._daemon.snapshot = mock.Mock()
+        self._daemon._handled_since = 42
+        self._daemon.queue = mock.Mock(depth=1)
+        self._daemon._save_snapshot(force=True)
+        self.assertFalse(self._daemon.snapshot.save.called)
+
+        self._daemon.queue.depth = 0
+        self._daemon._save_snapshot(force=True)
+        self._daemon.snapshot.save.assert_called_once_with(42, self._daemon.addresses)
+
+    def test_reconfigure__ok_moves_changed_entries(self):
+        """Tests if only the entries whose interface changes are moved, in one batch"""
+        self._mock_backend()
+        self._daemon._index_network('n1', 'bridge', [ipaddress.ip_network('2001:db8:1::/64')])
+        self._daemon._index_network('n2', 'web', [ipaddress.ip_network('2001:db8:2::/64')])
+        for entry in (AddressEntry('c1', 'n1', '2001:db8:1::2', 'ethernet', network_name='bridge'),
+                      AddressEntry('c2', 'n2', '2001:db8:2::2', 'ethernet', network_name='web'),
+                      AddressEntry('c3', 'n2', '2001:db8:2:0:1::2', 'ethernet',
+                                   network_name='web')):
+            self._daemon.addresses.add(entry)
+
+        self._daemon.reconfigure(ethernet_interface='ethernet', interfaces={'web': 'uplink2'},
+                                 prefixes={'2001:db8:2:0:1::/80': 'skip'})
+        self._daemon.queue.flush()
+
+        self._daemon.backend.activate.assert_called_once_with('uplink2')
+        self._daemon.backend.apply.assert_called_once_with(
+            add=[('2001:db8:2::2', 'uplink2')],
+            delete=[('2001:db8:2::2', 'ethernet'), ('2001:db8:2:0:1::2', 'ethernet')])
+        self.assertEqual('ethernet', self._daemon.addresses.get('c1', 'n1').interface)
+        self.assertEqual('uplink2', self._daemon.addresses.get('c2', 'n2').interface)
+        self.assertIsNone(self._daemon.addresses.get('c3', 'n2'))
+        self.assertEqual(['ethernet', 'uplink2'], self._daemon.gateway_interfaces)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,167 @@
+import errno
+import unittest
+import mock
+import threading
+from docker_ndp_daemon.daemon.pipeline import ProxyChange, ProxyQueue
+from docker_ndp_daemon.daemon.proxy import ProxyError
+
+
+class ProxyQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self._backend = mock.Mock()
+        self._backend.apply.return_value = []
+        self._queue = ProxyQueue(self._backend, flush_interval=0.01, batch_size=3, max_depth=4)
+
+    def test_submit__ok_cancels_opposite(self):
+        """Tests if a disconnect cancels a pending connect of the same address"""
+        self._queue.add("2001:db8::1", "eth0")
+        self._queue.add("2001:db8::2", "eth0")
+        self.assertEqual(2, self._queue.depth)
+        self._queue.delete("2001:db8::1", "eth0")
+        self.assertEqual(1, self._queue.depth)
+
+    def test_flush__ok_resolves_on_flush(self):
+        """Tests if queued callables only run when flushed and the last change of an entry wins"""
+        resolve = mock.Mock(return_value=[ProxyChange('add', "2001:db8::1", "eth0")])
+        self._queue.submit('add', ('endpoint', 'c1', 'n1'), resolve)
+        self._queue.submit('delete', ('endpoint', 'c2', 'n1'),
+                           lambda: [ProxyChange('delete', "2001:db8::1", "eth0")])
+        self.assertFalse(resolve.called)
+        self._queue.flush()
+        self.assertTrue(resolve.called)
+        self._backend.apply.assert_called_once_with(add=[], delete=[("2001:db8::1", "eth0")])
+
+    def test_stop__ok_flushes_in_batches(self):
+        """Tests if pending changes are applied in batches of at most batch_size"""
+        for i in range(3):
+            self._queue.add(f"2001:db8::{i}", "eth0")
+        self._queue.delete("2001:db8::9", "eth0")
+        self._queue.start()
+        self._queue.stop()
+        self.assertEqual(0, self._queue.depth)
+        self.assertEqual(2, self._backend.apply.call_count)
+        first, second = self._backend.apply.call_args_list
+        self.assertEqual(3, len(first[1]['add']))
+        self.assertEqual(([], [("2001:db8::9", "eth0")]), (second[1]['add'], second[1]['delete']))
+
+    def test_submit__ok_backpressure(self):
+        """Tests if submitting blocks while the queue is full until the worker drained it"""
+        for i in range(4):
+            self._queue.add(f"2001:db8::{i}", "eth0")
+        submitted = threading.Event()
+
+        def submit():
+            self._queue.add("2001:db8::a", "eth0")
+            submitted.set()
+
+        threading.Thread(target=submit, daemon=True).start()
+        self.assertFalse(submitted.wait(0.05))
+        self._queue.start()
+        self.assertTrue(submitted.wait(1))
+        self._queue.stop()
+        added = [entry for call in self._backend.apply.call_args_list for entry in call[1]['add']]
+        self.assertEqual(5, len(added))
+
+    def _fail(self, *codes):
+        # Makes the backend fail the next apply calls with the errnos in codes, one per call
+        def apply(add=(), delete=()):
+            code = next(results)
+            if code is None:
+                return []
+            return [ProxyError(action, ipv6_address, interface, OSError(code, "failed"))
+                    for action, entries in (('add', add), ('delete', delete))
+                    for ipv6_address, interface in entries]
+        results = iter(codes)
+        self._backend.apply.side_effect = apply
+
+    def test_flush__ok_retries_transient_failure(self):
+        """Tests if a failed change is tried again once its backoff is over"""
+        self._queue.retry_delay = 0
+        self._fail(errno.EBUSY, None)
+        self._queue.add("2001:db8::1", "eth0")
+        self._queue.flush()
+        self.assertEqual(1, self._queue.retrying)
+        self._queue.flush()
+        self.assertEqual(0, self._queue.retrying)
+        self.assertEqual(2, self._backend.apply.call_count)
+        self.assertEqual([("2001:db8::1", "eth0")], self._backend.apply.call_args[1]['add'])
+
+    def test_flush__ok_backoff(self):
+        """Tests if retries wait for their backoff and give up after retry_attempts"""
+        self._queue.retry_attempts = 2
+        self._fail(errno.EBUSY, errno.EBUSY)
+        self._queue.add("2001:db8::1", "eth0")
+        with mock.patch('time.monotonic', return_value=100):
+            self._queue.flush()
+            self._queue.flush()
+        self.assertEqual(1, self._backend.apply.call_count)
+        with mock.patch('time.monotonic', return_value=101):
+            with self.assertLogs('docker_ndp_daemon.daemon.pipeline', 'ERROR'):
+                self._queue.flush()
+        self.assertEqual(0, self._queue.retrying)
+
+    def test_flush__ok_newer_change_replaces_retry(self):
+        """Tests if a newer change of an entry replaces its pending retry"""
+        self._fail(errno.EBUSY, None)
+        self._queue.add("2001:db8::1", "eth0")
+        self._queue.flush()
+        self._queue.delete("2001:db8::1", "eth0")
+        self._queue.flush()
+        self.assertEqual(0, self._queue.retrying)
+        self.assertEqual(([], [("2001:db8::1", "eth0")]),
+                         (self._backend.apply.call_args[1]['add'],
+                          self._backend.apply.call_args[1]['delete']))
+
+    def test_flush__ok_permanent_failure(self):
+        """Tests if permanent errors are not retried"""
+        self._fail(errno.EPERM)
+        self._queue.add("2001:db8::1", "eth0")
+        with self.assertLogs('docker_ndp_daemon.daemon.pipeline', 'ERROR'):
+            self._queue.flush()
+        self.assertEqual(0, self._queue.retrying)
+
+    def test_flush__ok_retries_failed_work(self):
+        """Tests if queued work that raised runs again under its key after its backoff"""
+        self._queue.retry_delay = 0
+        self._backend.apply.return_value = []
+        work = mock.Mock(side_effect=[ConnectionError("docker is busy"),
+                                      [ProxyChange('add', "2001:db8::1", "eth0")]])
+        self._queue.submit('add', ('c1', 'n1'), work)
+        self._queue.flush()
+        self.assertEqual(1, self._queue.retrying)
+        self.assertFalse(self._backend.apply.called)
+
+        self._queue.flush()
+
+        self.assertEqual(0, self._queue.retrying)
+        self.assertEqual(2, work.call_count)
+        self._backend.apply.assert_called_once_with(add=[("2001:db8::1", "eth0")], delete=[])
+
+    def test_flush__ok_newer_work_replaces_failed_work(self):
+        """Tests if work queued under the key of failed work replaces its retry"""
+        self._queue.retry_delay = 0
+        failing = mock.Mock(side_effect=ConnectionError("docker is busy"))
+        self._queue.submit('add', ('c1', 'n1'), failing)
+        self._queue.flush()
+        self._queue.submit('delete', ('c1', 'n1'), lambda: [])
+        self._queue.flush()
+        self._queue.flush()
+        self.assertEqual(0, self._queue.retrying)
+        self.assertEqual(1, failing.call_count)
+
+    def test_flush__ok_gives_up_failed_work(self):
+        """Tests if work that keeps raising is given up after retry_attempts"""
+        self._queue.retry_delay = 0
+        self._queue.retry_attempts = 2
+        failing = mock.Mock(side_effect=ConnectionError("docker is busy"))
+        self._queue.submit('add', ('c1', 'n1'), failing)
+        self._queue.flush()
+        with self.assertLogs('docker_ndp_daemon.daemon.pipeline', 'ERROR'):
+            self._queue.flush()
+        self.assertEqual(0, self._queue.retrying)
+        self.assertEqual(2, failing.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
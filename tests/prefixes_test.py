@@ -0,0 +1,36 @@
+import ipaddress
+import unittest
+from docker_ndp_daemon.daemon.prefixes import SKIP, PrefixIndex
+
+
+class PrefixIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._index = PrefixIndex()
+        self._index.add('2001:db8::/32', 'eth0')
+        self._index.add('2001:db8:1::/48', SKIP)
+        self._index.add('2001:db8:1:2::/64', 'eth1')
+
+    def test_lookup__ok_longest_prefix(self):
+        self.assertEqual('eth1', self._index.lookup('2001:db8:1:2::5'))
+        self.assertEqual(SKIP, self._index.lookup('2001:db8:1:3::5'))
+        self.assertEqual('eth0', self._index.lookup(ipaddress.ip_address('2001:db8:2::5')))
+
+    def test_lookup__ok_no_match(self):
+        self.assertIsNone(self._index.lookup('2001:db9::1'))
+
+    def test_lookup__ok_max_length(self):
+        """Tests if only prefixes covering a whole subnet are found with max_length"""
+        self.assertEqual(SKIP, self._index.lookup('2001:db8:1:2::', 56))
+
+    def test_remove__ok(self):
+        self._index.remove('2001:db8:1::/48')
+        self.assertEqual('eth0', self._index.lookup('2001:db8:1:3::5'))
+        self.assertIsNone(self._index.get('2001:db8:1::/48'))
+        self.assertEqual(2, len(self._index))
+        self._index.remove('2001:db8:7::/48')  # unknown
+        self.assertEqual(2, len(self._index))
+
+
+if __name__ == '__main__':
+    unittest.main()
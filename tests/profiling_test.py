@@ -0,0 +1,56 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+from docker_ndp_daemon.daemon import profiling
+
+
+def busy(count):
+    return sum(range(count))
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._directory = directory.name
+        self.addCleanup(setattr, profiling, '_profiler', None)
+
+    def test_toggle__ok(self):
+        """Tests if the calls made between two toggles are written as stats"""
+        self.assertEqual(10, profiling.call(busy, 5))
+        self.assertIsNone(profiling.toggle(self._directory))
+        self.assertEqual(10, profiling.call(profiling.call, busy, 5))
+
+        path = profiling.toggle(self._directory, top=5)
+
+        self.assertIsNone(profiling._profiler)
+        self.assertTrue(os.path.exists(path))
+        with open(path[:-len('.prof')] + '.txt') as file:
+            self.assertIn('busy', file.read())
+
+    def test_toggle__ok_nothing_profiled(self):
+        """Tests if no stats are written without profiled calls"""
+        profiling.toggle(self._directory)
+        self.assertIsNone(profiling.toggle(self._directory))
+        self.assertEqual([], os.listdir(self._directory))
+
+    def test_dump_memory__ok(self):
+        """Tests if the first dump starts tracing and the next one lists the allocations"""
+        if tracemalloc.is_tracing():
+            self.skipTest("memory is traced already")
+        self.addCleanup(tracemalloc.stop)
+
+        with open(profiling.dump_memory(self._directory, ["endpoint default: idle"])) as file:
+            first = file.read()
+        self.assertIn("endpoint default: idle", first)
+        self.assertIn("traced from now on", first)
+        self.assertTrue(tracemalloc.is_tracing())
+
+        kept = [bytearray(1024) for _ in range(100)]
+        with open(profiling.dump_memory(self._directory, top=5)) as file:
+            second = file.read()
+        self.assertIn("Top 5 allocating lines", second)
+        self.assertIn(os.path.basename(__file__), second)
+        del kept
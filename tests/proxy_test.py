@@ -0,0 +1,128 @@
+import unittest
+import mock
+import socket
+from docker_ndp_daemon.daemon import proxy
+from docker_ndp_daemon.daemon import netlink
+from docker_ndp_daemon.daemon.proxy import (
+    DryRunBackend, IpCommandBackend, NetlinkBackend, SynchronizedBackend, create_backend,
+)
+
+
+class IpCommandBackendTest(unittest.TestCase):
+
+    @mock.patch.object(proxy, 'run')
+    def test_add__ok(self, mock_run):
+        """Tests if the right command was called to add an ipv6 address to the ndp proxy"""
+        IpCommandBackend().add("fe80::1", "ethernet")
+        self.assertEqual(['ip', '-6', 'neigh', 'add', 'proxy', 'fe80::1', 'dev', 'ethernet'],
+                         mock_run.call_args[0][0])
+
+    @mock.patch.object(proxy, 'run')
+    def test_activate__ok(self, mock_run):
+        """Tests if the right command was called to activate ipv6 ndp Proxy"""
+        IpCommandBackend().activate("ethernet")
+        self.assertEqual(["sysctl", "net.ipv6.conf.ethernet.proxy_ndp=1"], mock_run.call_args[0][0])
+
+    @mock.patch.object(proxy, 'run')
+    def test_dump__ok(self, mock_run):
+        """Tests parsing the output of `ip -6 neigh show proxy`"""
+        mock_run.return_value.stdout = (
+            "2001:db8::1 dev eth0 proxy \n"
+            "2001:db8::2 dev eth1 proxy \n"
+        )
+        self.assertEqual({("2001:db8::1", "eth0"), ("2001:db8::2", "eth1")},
+                         IpCommandBackend().dump())
+
+    @mock.patch.object(proxy, 'run')
+    def test_apply__ok_single_batch(self, mock_run):
+        """Tests if all changes are sent to one `ip -batch` invocation"""
+        mock_run.return_value.returncode = 0
+        failures = IpCommandBackend().apply(add=[("2001:db8::1", "eth0")],
+                                            delete=[("2001:db8::2", "eth0")])
+        self.assertEqual([], failures)
+        self.assertEqual(1, mock_run.call_count)
+        self.assertEqual("neigh del proxy 2001:db8::2 dev eth0\n"
+                         "neigh add proxy 2001:db8::1 dev eth0\n",
+                         mock_run.call_args[1]['input'])
+
+
+class NetlinkBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        with mock.patch.object(netlink, 'NetlinkRouteSocket'):
+            self._backend = NetlinkBackend()
+
+    @mock.patch.object(socket, 'if_nametoindex', return_value=7)
+    def test_add__ok(self, mock_ifindex):
+        """Tests if a proxy RTM_NEWNEIGH for the address is sent on the interface"""
+        self._backend.add("2001:db8::1", "ethernet")
+        msg_type, flags, payload = self._backend._sock.request.call_args[0]
+        self.assertEqual(netlink.RTM_NEWNEIGH, msg_type)
+        self.assertTrue(flags & netlink.NLM_F_CREATE)
+        self.assertEqual(netlink.pack_proxy_neigh("2001:db8::1", 7), payload)
+        mock_ifindex.assert_called_with("ethernet")
+
+    @mock.patch.object(socket, 'if_nametoindex', return_value=7)
+    def test_apply__ok_ignores_existing(self, mock_ifindex):
+        """Tests if EEXIST on add is ignored while other errors are reported"""
+        self._backend._sock.request_many.return_value = [
+            OSError(1, "Operation not permitted"), OSError(17, "File exists"),
+        ]
+        failures = self._backend.apply(add=[("2001:db8::1", "eth0")],
+                                       delete=[("2001:db8::2", "eth0")])
+        self.assertEqual(1, len(failures))
+        self.assertEqual(("delete", "2001:db8::2"), (failures[0].action, failures[0].ipv6_address))
+        self.assertEqual(1, self._backend._sock.request_many.call_count)
+
+    def test_pack_proxy_neigh__ok(self):
+        """Tests the layout of the ndmsg and its NDA_DST attribute"""
+        payload = netlink.pack_proxy_neigh("2001:db8::1", 7)
+        self.assertEqual(12 + 4 + 16, len(payload))
+        self.assertEqual(socket.AF_INET6, payload[0])
+        self.assertEqual(netlink.NTF_PROXY, payload[10])
+        self.assertEqual(socket.inet_pton(socket.AF_INET6, "2001:db8::1"), payload[16:])
+
+    def test_iter_messages__ok(self):
+        """Tests splitting an acknowledgement datagram into its messages"""
+        ack = netlink._NLMSGHDR.pack(20, netlink.NLMSG_ERROR, 0, 3, 0) + netlink._NLMSGERR.pack(-17)
+        messages = list(netlink.iter_messages(ack * 2))
+        self.assertEqual(2, len(messages))
+        self.assertEqual((netlink.NLMSG_ERROR, 0, 3), messages[0][:3])
+
+
+class SynchronizedBackendTest(unittest.TestCase):
+
+    def test_apply__ok_delegates(self):
+        backend = mock.Mock()
+        backend.apply.return_value = []
+        shared = SynchronizedBackend(backend)
+        self.assertEqual([], shared.apply(add=[("2001:db8::1", "eth0")]))
+        backend.apply.assert_called_once_with(add=[("2001:db8::1", "eth0")], delete=())
+        self.assertEqual(backend.name, shared.name)
+
+
+class DryRunBackendTest(unittest.TestCase):
+
+    def test_apply__ok_in_memory(self):
+        """Tests if a dry run keeps the table in memory and counts the changes"""
+        backend = create_backend("dry-run")
+        self.assertIsInstance(backend, DryRunBackend)
+        backend.add("2001:db8::1", "eth0")
+        self.assertEqual([], backend.apply(add=[("2001:db8::2", "eth0")],
+                                           delete=[("2001:db8::1", "eth0")]))
+        self.assertEqual({("2001:db8::2", "eth0")}, backend.dump())
+        self.assertEqual((2, 1), (backend.added, backend.deleted))
+
+
+class CreateBackendTest(unittest.TestCase):
+
+    def test_create_backend__fail_unknown(self):
+        with self.assertRaises(ValueError):
+            create_backend("carrier-pigeon")
+
+    def test_create_backend__ok(self):
+        self.assertIsInstance(create_backend("ip"), IpCommandBackend)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+from pathlib import Path
+from docker_ndp_daemon.daemon.addresses import AddressEntry
+from docker_ndp_daemon.daemon.snapshot import Snapshot
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._path = Path(self._directory.name) / 'state' / 'snapshot.json'
+        self._snapshot = Snapshot(self._path)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_save__ok_roundtrip(self):
+        """Tests if a saved snapshot loads with the same cursor and entries"""
+        entries = [AddressEntry('c1', 'n1', '2001:db8::2', 'eth0',
+                                container_name='web', network_name='bridge')]
+        self._snapshot.save(1539202002835354153, entries)
+        state = self._snapshot.load()
+        self.assertEqual(1539202002835354153, state.since)
+        self.assertEqual([(('c1', 'n1'), ('2001:db8::2', 'eth0'), 'web')],
+                         [(entry.key, entry.proxy_entry, entry.container_name)
+                          for entry in state.entries])
+        self.assertLess(state.age, 60)
+        self.assertEqual(['snapshot.json'], [path.name for path in self._path.parent.iterdir()])
+
+    def test_load__ok_missing(self):
+        self.assertIsNone(self._snapshot.load())
+
+    def test_load__ok_corrupt(self):
+        """Tests if a damaged snapshot is ignored instead of stopping the daemon"""
+        self._path.parent.mkdir()
+        self._path.write_text('{"version": 1, "entries": [')
+        with self.assertLogs('docker_ndp_daemon.daemon.snapshot', 'WARNING'):
+            self.assertIsNone(self._snapshot.load())
+
+
+if __name__ == '__main__':
+    unittest.main()
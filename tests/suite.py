@@ -1,14 +1,48 @@
 import unittest
-from events_test import DockerEventDaemonTest
+from events_test import DockerEventDaemonTest, DockerEventDaemonListenTest
 from ndp_test import DockerNdpDaemonTest
 from main_test import MainTest
+from addresses_test import AddressTableTest
+from pipeline_test import ProxyQueueTest
+from proxy_test import (
+    IpCommandBackendTest, NetlinkBackendTest, SynchronizedBackendTest, DryRunBackendTest,
+    CreateBackendTest,
+)
+from config_test import ConfigTest
+from metrics_test import MetricsTest
+from watcher_test import NeighbourWatcherTest
+from snapshot_test import SnapshotTest
+from prefixes_test import PrefixIndexTest
+from asyncdocker_test import AsyncDockerClientTest
+from trace_test import TraceTest
+from logs_test import LogsTest
+from handlers_test import HandlerRegistryTest
+from profiling_test import ProfilingTest
 
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(MainTest))
     suite.addTest(unittest.makeSuite(DockerEventDaemonTest))
+    suite.addTest(unittest.makeSuite(DockerEventDaemonListenTest))
     suite.addTest(unittest.makeSuite(DockerNdpDaemonTest))
+    suite.addTest(unittest.makeSuite(IpCommandBackendTest))
+    suite.addTest(unittest.makeSuite(NetlinkBackendTest))
+    suite.addTest(unittest.makeSuite(SynchronizedBackendTest))
+    suite.addTest(unittest.makeSuite(DryRunBackendTest))
+    suite.addTest(unittest.makeSuite(CreateBackendTest))
+    suite.addTest(unittest.makeSuite(AddressTableTest))
+    suite.addTest(unittest.makeSuite(ConfigTest))
+    suite.addTest(unittest.makeSuite(ProxyQueueTest))
+    suite.addTest(unittest.makeSuite(MetricsTest))
+    suite.addTest(unittest.makeSuite(NeighbourWatcherTest))
+    suite.addTest(unittest.makeSuite(SnapshotTest))
+    suite.addTest(unittest.makeSuite(PrefixIndexTest))
+    suite.addTest(unittest.makeSuite(AsyncDockerClientTest))
+    suite.addTest(unittest.makeSuite(TraceTest))
+    suite.addTest(unittest.makeSuite(LogsTest))
+    suite.addTest(unittest.makeSuite(HandlerRegistryTest))
+    suite.addTest(unittest.makeSuite(ProfilingTest))
     return suite
 
 
@@ -0,0 +1,128 @@
+import gzip
+import os
+import tempfile
+import unittest
+import mock
+from docker.errors import NotFound
+from docker_ndp_daemon.config import Config
+from docker_ndp_daemon.daemon.proxy import DryRunBackend
+from docker_ndp_daemon.daemon.trace import (
+    ReplayDockerClient, TraceWriter, TracingDockerClient, read_trace,
+)
+from docker_ndp_daemon.replay import replay
+
+NETWORK = 'a' * 64
+CONTAINER = 'c' * 64
+
+
+def network(*containers):
+    return {'Id': NETWORK, 'Name': 'web', 'EnableIPv6': True,
+            'IPAM': {'Config': [{'Subnet': '2001:db8::/64'}]},
+            'Containers': {container_id: {'Name': f"app{index}",
+                                          'IPv6Address': f"2001:db8::{index + 1}/64"}
+                           for index, container_id in enumerate(containers)}}
+
+
+def connect(container_id):
+    return {'Type': 'network', 'Action': 'connect',
+            'Actor': {'ID': NETWORK, 'Attributes': {'container': container_id, 'name': 'web'}}}
+
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._path = os.path.join(directory.name, 'trace.jsonl.gz')
+
+    def test_read_trace__ok_cut_short(self):
+        """Tests if a trace whose writer was never closed is read up to its last record"""
+        trace = TraceWriter(self._path)
+        trace.record('networks', None, [{'Id': NETWORK}])
+        trace.record('event', None, connect(CONTAINER))
+        trace.flush()
+        with open(self._path, 'rb') as file, open(self._path + '.copy.gz', 'wb') as copy:
+            copy.write(file.read())
+        trace.close()
+
+        records = read_trace(self._path + '.copy.gz')
+        self.assertEqual([('networks', None, [{'Id': NETWORK}]),
+                          ('event', None, connect(CONTAINER))],
+                         [record[1:] for record in records])
+
+    def test_trace_writer__ok_close(self):
+        """Tests if closing finishes the gzip file and later records are dropped"""
+        trace = TraceWriter(self._path)
+        trace.record('event', None, connect(CONTAINER))
+        trace.close()
+        trace.record('event', None, connect('d' * 64))
+        trace.flush()
+
+        with gzip.open(self._path, 'rt') as file:
+            self.assertEqual(2, len(file.read().splitlines()))
+
+    def test_tracing_client__ok_records_lookups(self):
+        """Tests if the network and container lookups are recorded, including unknown ones"""
+        client = mock.Mock()
+        client.api.inspect_network.return_value = network()
+        client.containers.get.side_effect = NotFound("gone")
+        trace = mock.Mock()
+        tracing = TracingDockerClient(client, trace)
+
+        self.assertEqual(network(), tracing.api.inspect_network(NETWORK))
+        with self.assertRaises(NotFound):
+            tracing.containers.get(CONTAINER)
+        tracing.close()
+
+        trace.record.assert_has_calls([mock.call('network', NETWORK, network()),
+                                       mock.call('container', CONTAINER, None)])
+        client.close.assert_called_once_with()
+
+    def test_replay_client__ok_responses_follow_events(self):
+        """Tests if lookups get the first response recorded after the event played last"""
+        client = ReplayDockerClient([
+            (0.0, 'network', NETWORK, network()),
+            (1.0, 'event', None, connect(CONTAINER)),
+            (1.1, 'network', NETWORK, network(CONTAINER)),
+            (2.0, 'event', None, connect('d' * 64)),
+        ], speed=0)
+        self.assertEqual({}, client.api.inspect_network(NETWORK)['Containers'])
+
+        events = client.events()
+        event = next(events)
+        self.assertEqual(connect(CONTAINER)['Actor'], event['Actor'])
+        self.assertGreater(event['timeNano'], 0)
+        self.assertIn(CONTAINER, client.api.inspect_network(NETWORK)['Containers'])
+        next(events)
+        self.assertIn(CONTAINER, client.api.inspect_network(NETWORK)['Containers'])
+        with self.assertRaises(NotFound):
+            client.api.inspect_network('b' * 64)
+
+    def test_replay_client__ok_listed_container(self):
+        """Tests if containers that were never looked up are made up from the networks"""
+        client = ReplayDockerClient([(1.0, 'network', NETWORK, network(CONTAINER))])
+        container = client.containers.get(CONTAINER)
+        self.assertEqual('app0', container.name)
+        self.assertEqual({'NetworkID': NETWORK, 'GlobalIPv6Address': '2001:db8::1'},
+                         container.attrs['NetworkSettings']['Networks']['web'])
+        with self.assertRaises(NotFound):
+            client.containers.get('d' * 64)
+
+    def test_replay__ok(self):
+        """Tests if a trace replayed against a dry run proxies what the events connected"""
+        records = [
+            (0.0, 'networks', None, [network()]),
+            (0.0, 'network', NETWORK, network()),
+            (0.5, 'event', None, connect(CONTAINER)),
+            (0.6, 'network', NETWORK, network(CONTAINER)),
+        ]
+        endpoint = Config(name='replay', gateway='eth0', interfaces={}, prefixes={},
+                          networks=[])
+        backend = DryRunBackend()
+
+        report = replay(records, endpoint, backend, speed=0)
+
+        self.assertEqual({('2001:db8::1', 'eth0')}, backend.entries)
+        self.assertEqual(1, report['events'])
+        self.assertEqual(1, report['added'])
+        self.assertEqual(1, report['entries'])
@@ -0,0 +1,53 @@
+import struct
+import unittest
+import mock
+from docker_ndp_daemon.daemon import netlink
+from docker_ndp_daemon.daemon.watcher import ALL, NeighbourWatcher
+
+
+def link_message(name, flags):
+    return (struct.pack('=BxHiII', 0, 1, 4, flags, 0)
+            + netlink.pack_attr(netlink.IFLA_IFNAME, name.encode() + b'\0'))
+
+
+UP = netlink.IFF_UP | netlink.IFF_LOWER_UP
+
+
+class NeighbourWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self._restore = mock.Mock()
+        self._watcher = NeighbourWatcher(self._restore, ['eth0'], min_interval=1, cooldown=10)
+
+    @mock.patch('socket.if_indextoname', return_value='eth0')
+    def test_handle_message__ok_deleted_proxy_entry(self, mock_indextoname):
+        """Tests if a deleted proxy entry on a watched interface is restored"""
+        self._watcher.handle_message(netlink.RTM_DELNEIGH,
+                                     netlink.pack_proxy_neigh("2001:db8::1", 4), 0)
+        self._watcher.flush(0)
+        self._restore.assert_called_once_with([("2001:db8::1", "eth0")])
+
+    def test_handle_message__ok_link_back_up(self):
+        """Tests if all entries are restored when the interface comes back up, but not at start"""
+        self._watcher.handle_message(netlink.RTM_NEWLINK, link_message('eth0', UP), 0)
+        self._watcher.handle_message(netlink.RTM_NEWLINK, link_message('eth1', 0), 0)
+        self._watcher.flush(0)
+        self.assertFalse(self._restore.called)
+
+        self._watcher.handle_message(netlink.RTM_NEWLINK, link_message('eth0', netlink.IFF_UP), 1)
+        self._watcher.handle_message(netlink.RTM_NEWLINK, link_message('eth0', UP), 2)
+        self._watcher.flush(2)
+        self._restore.assert_called_once_with([(ALL, "eth0")])
+
+    def test_flush__ok_rate_limited(self):
+        """Tests if a flapping link is restored at most once per cooldown"""
+        for second in range(0, 20, 2):
+            self._watcher.handle_message(netlink.RTM_NEWLINK, link_message('eth0', 0), second)
+            self._watcher.handle_message(netlink.RTM_NEWLINK, link_message('eth0', UP), second + 1)
+            self._watcher.flush(second + 1)
+        self.assertEqual(2, self._restore.call_count)
+        self.assertEqual(1, len(self._watcher._pending))
+
+
+if __name__ == '__main__':
+    unittest.main()